@@ -7,121 +7,418 @@
 #   * rpi pico v2
 #   * esp32-wroom
 #===================================================================
-from machine import Pin,bitstream  # type: ignore
+from machine import Pin  # type: ignore
+from nos.acc.backends import Bitstream
+import time
 
 def RGB(r, g, b, a=1.0):
     """ returns int given r,g,b,a values. """
     return int(r*a)<<16 | int(g*a)<<8 | int(b*a)
 def getRGB(val):
     """ takes rgb values and extracts r,g,b """
-    return ((val>>x&0xff) for x in [16,8,0])
+    return (val>>16&0xff, val>>8&0xff, val&0xff)
 def maprange(x,a,b,c,d):
     return (x-a)/(b-a)*(d-c)+c
 def gradient_rainbow(val):
-    """ Provides 0-255 gradient rainbow rgb values """
-    val = int(val)
-    r=g=b=0
-    if val<0: return gradient_rainbow(val+0xff)
-    if val>255: return gradient_rainbow(val-0xff)
-    elif val<85:
-        g=int(val*3)
-        r=255-g 
-    elif val<170:
-        val-=85
-        b=int(val*3)
-        g=255-b
-    else:
-        val-=170
-        r=int(val*3)
-        b=255-r
-    return RGB(r,g,b)
+    """ Provides 0-255 gradient rainbow rgb values. wraps every 255 """
+    val = int(val)%0xff
+    if val<85:
+        g=val*3
+        return (255-g)<<16 | g<<8
+    if val<170:
+        b=(val-85)*3
+        return (255-b)<<8 | b
+    r=(val-170)*3
+    return r<<16 | (255-r)
 def RGBA(rgba):
     """ given rgba value, converts to rgb """
-    r,g,b=getRGB(rgba>>8)
-    a=(rgba&0xff)/0xff
-    return RGB(r,g,b,a)
+    return alpha(rgba>>8,(rgba&0xff)/0xff)
 def alpha(rgb,a=1.0):
     """ applies an alpha to an rgb """
-    r,g,b=getRGB(rgb)
-    return RGB(r,g,b,a)
+    return int((rgb>>16&0xff)*a)<<16 | int((rgb>>8&0xff)*a)<<8 | int((rgb&0xff)*a)
+def gamma_table(g=2.2):
+    """ 256 entry gamma lut. 1.0 is linear """
+    return bytes(int((i/255)**g*255+0.5) for i in range(256))
+
+class Palette:
+    def __init__(self,colors=None):
+        """ 256 precomputed colors, stored grb like the strip so a lookup is a
+        3 byte copy
+        * colors (`callable|list`): index to rgb function, or 256 rgb values
+        """
+        self.grb=bytearray(768)
+        self.mv=memoryview(self.grb)
+        if colors!=None:
+            for i in range(256):
+                self[i]=colors(i) if callable(colors) else colors[i]
+
+    def __setitem__(self,i,rgb):
+        i=i*3
+        self.grb[i+0]=rgb>>8&0xff
+        self.grb[i+1]=rgb>>16&0xff
+        self.grb[i+2]=rgb&0xff
+
+    def __getitem__(self,i):
+        i=(i&0xff)*3
+        return self.grb[i+1]<<16 | self.grb[i]<<8 | self.grb[i+2]
+
+    @classmethod
+    def rainbow(cls):
+        return cls(lambda i: gradient_rainbow(i*255//256))
+
+    @classmethod
+    def gradient(cls,stops):
+        """ linear blend between color stops
+        * stops (`list`): (index 0-255, rgb) pairs in index order
+        """
+        p=cls()
+        for k in range(len(stops)):
+            i0,c0=stops[k]
+            i1,c1=stops[k+1] if k+1<len(stops) else (256,c0)
+            if k==0:
+                for i in range(i0): p[i]=c0
+            for i in range(i0,min(i1,256)):
+                f=(i-i0)/(i1-i0)
+                p[i]=RGB((c0>>16&0xff)+((c1>>16&0xff)-(c0>>16&0xff))*f,
+                         (c0>>8&0xff)+((c1>>8&0xff)-(c0>>8&0xff))*f,
+                         (c0&0xff)+((c1&0xff)-(c0&0xff))*f)
+        return p
 
 class WS2812x:
-    def __init__(self,pin:int,amnt:int,auto:bool=False, **kwargs):
+    def __init__(self,pin:int,amnt:int,auto:bool=False,max_fps:int=0,backend=None, **kwargs):
         """ Controls addressable leds 
-        * pin (`int`)   : data pin 
-        * amnt (`int`)  : amount of leds you want to control
-        * auto (`int`)  : true to auto render when changing values
+        * pin (`int`)     : data pin 
+        * amnt (`int`)    : amount of leds you want to control
+        * auto (`int`)    : true to auto render when changing values
+        * max_fps (`int`) : caps auto renders. changes in between are pushed
+        together by the next change or service(). 0 for no cap
+        * backend         : what pushes frames, see nos.acc.backends. bitstream
+        on pin by default. None pin for backends that don't need one
         """
-        self.pin=Pin(pin,Pin.OUT)
+        self.pin=Pin(pin,Pin.OUT) if pin!=None else None
         self.amnt=amnt
-        self.auto=auto
+        self.auto=False
+        self.max_fps=max_fps
+        self.dirty=True         # framebuffer differs from what was last pushed
+        self.renders=0          # frames pushed
+        self.t=0                # ticks_us of the last push
+        self.coalesced=0        # auto renders folded into a later one
+        self.__batch=0
+        self.__last=time.ticks_add(time.ticks_us(),-1000000)
         
-        self.__a=bytearray(amnt*3)
+        self.__a=bytearray(amnt*3)      # grb, as sent
+        self.__mv=memoryview(self.__a)
+        self.__s=bytearray(amnt*3)      # scratch for roll and overlapping blits
+        self.__smv=memoryview(self.__s)
+        self.__o=bytearray(amnt*3)      # what render sends, after the lut
+        self.__lut=bytearray(768)       # g,r,b channel tables of gamma and brightness
+        self.__linear=True
+        self.__brightness=1.0
+        self.__gamma=None
+        self.__build_lut()
+        self.backend=backend or Bitstream(self.pin)
+        self.backend.attach(amnt*3)
+        self.auto=auto
 
     def __repr__(self) -> str:
         return self.__a
 
+    def __len__(self):
+        return self.amnt
+
+    @property
+    def buf(self):
+        """ memoryview of the framebuffer, 3 bytes per led in grb order. handing
+        it out marks the strip dirty, so the next render() pushes whatever was
+        written through it. call changed() after writing for auto renders
+        """
+        self.dirty=True
+        return self.__mv
+
+    def __span(self,s):
+        """ start,stop of a slice in leds. steps are not supported """
+        n=self.amnt
+        a=0 if s.start==None else s.start
+        b=n if s.stop==None else s.stop
+        if a<0: a+=n
+        if b<0: b+=n
+        return max(0,min(a,n)),max(0,min(b,n))
+
+    def __range(self,start,count):
+        """ start,count clamped to the strip. None count runs to the end """
+        n=self.amnt
+        start=max(0,min(start,n))
+        if count==None or count>n-start: count=n-start
+        return start,count
+
     def __setitem__(self,i,rgb):
-        r,g,b=((rgb>>x&0xff) for x in [16,8,0])
+        if type(i)==slice:
+            a,b=self.__span(i)
+            if type(rgb)==int: return self.fill(rgb,a,b-a)
+            with self:
+                for k in range(min(b-a,len(rgb))): self[a+k]=rgb[k]
+            return
         i=i*3
-        self.__a[i+0]=g
-        self.__a[i+1]=r
-        self.__a[i+2]=b
-        if self.auto: self.render()
+        self.__a[i+0]=rgb>>8&0xff
+        self.__a[i+1]=rgb>>16&0xff
+        self.__a[i+2]=rgb&0xff
+        self.changed()
 
     def __getitem__(self,i):
+        if type(i)==slice:
+            a,b=self.__span(i)
+            return [self[k] for k in range(a,b)]
         i=i*3
         g=self.__a[i+0]
         r=self.__a[i+1]
         b=self.__a[i+2]
         return r<<16 | g<<8 | b
         
-    def roll(self,amnt):
-        """ shifts list by amnt"""
-        __a = self.auto
-        self.auto=False
-        self.__a[:]=self.__a[amnt*3:]+self.__a[:amnt*3]
-        self.auto=__a
-        if self.auto: self.render()
+    def roll(self,amnt,start=0,count=None):
+        """ shifts leds by amnt in place. led i moves to i-amnt, negative
+        amnt goes the other way. three copies, no allocation
+        * start (`int`): first led of the range to rotate
+        * count (`int`): leds in it, None for the rest of the strip
+        """
+        start,count=self.__range(start,count)
+        k=(amnt%count)*3 if count>0 else 0
+        if k:
+            o=start*3
+            n=count*3
+            s=self.__smv
+            mv=self.__mv
+            s[:n-k]=mv[o+k:o+n]
+            s[n-k:n]=mv[o:o+k]
+            mv[o:o+n]=s[:n]
+            self.changed()
         
-    def fill(self,rgb):
-        """ fills the leds with one color """
-        __a = self.auto
-        self.auto=False
-        for i in range(self.amnt):
-            self[i]=rgb
-        self.auto=__a
-        if self.auto: self.render()
+    def fill(self,rgb,start=0,count=None):
+        """ fills the leds with one color by doubling copies of the first one
+        * rgb   (`int`): color
+        * start (`int`): first led
+        * count (`int`): leds to fill, None for the rest of the strip. the range
+        is clamped to the strip
+        """
+        start,count=self.__range(start,count)
+        o=start*3
+        n=count*3
+        if n>0:
+            a=self.__a
+            mv=self.__mv
+            a[o+0]=rgb>>8&0xff
+            a[o+1]=rgb>>16&0xff
+            a[o+2]=rgb&0xff
+            k=3
+            while k<n:
+                c=min(k,n-k)
+                mv[o+k:o+k+c]=mv[o:o+c]
+                k+=c
+            self.changed()
     
     def clear(self):
-        __a = self.auto
-        self.auto=False
-        for i in range(self.amnt):
-            self[i]=0
+        with self: self.fill(0)
         self.render()
-        self.auto=__a
-        
-    
-    def render(self):
-        """ render the colors to the strip """
-        bitstream(self.pin,0,(400, 850, 800, 450),self.__a) #(800, 1700, 1600, 900)
+
+    def blit(self,src,at=0,start=0,count=None):
+        """ copies leds from another strip or a grb buffer through memoryviews.
+        a nos.acc.segments.Segment is copied led by led through its pixel api
+        * src   (`WS2812x|Segment|buffer`): source. may be this strip
+        * at    (`int`)                   : first destination led
+        * start (`int`)                   : first source led
+        * count (`int`)                   : leds, None for as many as fit. both
+        ranges are clamped to their ends
+        """
+        if not isinstance(src,WS2812x) and hasattr(src,'amnt'):
+            at,count=self.__range(at,count)
+            start=max(0,min(start,len(src)))
+            count=min(count,len(src)-start)
+            if count>0: self[at:at+count]=src[start:start+count]
+            return
+        s=src.__mv if isinstance(src,WS2812x) else memoryview(src)  # reading leaves src clean
+        at,count=self.__range(at,count)
+        m=len(s)//3
+        start=max(0,min(start,m))
+        count=min(count,m-start)
+        n=count*3
+        if n>0:
+            d=at*3
+            o=start*3
+            if src is self:     # may overlap
+                self.__smv[:n]=s[o:o+n]
+                s=self.__smv
+                o=0
+            self.__mv[d:d+n]=s[o:o+n]
+            self.changed()
+
+    def paint(self,palette,phase=0,spread=256,start=0,count=None):
+        """ fills leds from a palette. led k gets palette[phase+k*spread/count],
+        so animating is just moving phase
+        * palette (`Palette`): colors
+        * phase   (`number`) : palette index of the first led
+        * spread  (`number`) : palette indices covered by the range, negative
+        runs the palette backwards
+        * start   (`int`)    : first led
+        * count   (`int`)    : leds, None for the rest of the strip
+        """
+        if count==None: count=self.amnt-start
+        if count<=0: return
+        pmv=palette.mv
+        mv=self.__mv
+        d=start*3
+        acc=int(phase*256)
+        step=int(spread*256)//count
+        for k in range(count):
+            i=(acc>>8&0xff)*3
+            mv[d:d+3]=pmv[i:i+3]
+            d+=3
+            acc+=step
+        self.changed()
+
+    @property
+    def brightness(self):
+        return self.__brightness
+
+    @brightness.setter
+    def brightness(self,v):
+        """ 0.0-1.0, applied at render. the framebuffer keeps full values """
+        self.__brightness=max(0.0,min(1.0,v))
+        self.__build_lut()
+
+    @property
+    def gamma(self):
+        return self.__gamma
+
+    @gamma.setter
+    def gamma(self,g):
+        """ None for linear, a float, or an (r,g,b) tuple of floats """
+        self.__gamma=g
+        self.__build_lut()
+
+    def __build_lut(self):
+        """ folds gamma and brightness into one table per channel. 768 entries,
+        only when either changes
+        """
+        g=self.__gamma
+        gs=(g,g,g) if g==None or type(g) in (int,float) else (g[1],g[0],g[2])   # grb
+        k=self.__brightness
+        lut=self.__lut
+        for c in range(3):
+            t=gamma_table(gs[c]) if gs[c]!=None else None
+            for i in range(256):
+                lut[c*256+i]=int((t[i] if t else i)*k+0.5)
+        self.__linear=g==None and k==1.0
+        self.changed()
+
+    def output(self,o=None):
+        """ buffer render sends. the framebuffer itself when no lut applies
+        * o (`bytearray`): compose into this instead, e.g. a backend buffer
+        """
+        if self.__linear:
+            if o==None: return self.__a
+            o[:]=self.__a
+            return o
+        a=self.__a
+        if o==None: o=self.__o
+        lut=self.__lut
+        for i in range(0,self.amnt*3,3):
+            o[i]=lut[a[i]]
+            o[i+1]=lut[256+a[i+1]]
+            o[i+2]=lut[512+a[i+2]]
+        return o
+
+    def busy(self):
+        """ true while the backend is still sending the last frame """
+        return self.backend.busy()
+
+    def wait(self):
+        """ blocks until the last frame is out """
+        self.backend.wait()
+
+    def _send(self):
+        self.backend.send(self.output(self.backend.buffer()))
+
+    def __enter__(self):
+        """ with strip: ... defers auto renders until the outermost block ends """
+        self.__batch+=1
+        return self
+
+    def __exit__(self,*a):
+        self.__batch-=1
+        if self.__batch==0 and self.auto and self.dirty: self.__auto_render()
+
+    def batch(self):
+        """ with strip.batch(): ... same as with strip """
+        return self
+
+    def changed(self):
+        """ marks the framebuffer dirty and auto renders if due. call it after
+        writing through buf when auto is on
+        """
+        self.dirty=True
+        if self.auto and not self.__batch: self.__auto_render()
+
+    def __auto_render(self):
+        if self.max_fps and time.ticks_diff(time.ticks_us(),self.__last)<1000000//self.max_fps:
+            self.coalesced+=1
+            return
+        self.render()
+
+    def service(self):
+        """ pushes auto changes held back by max_fps once their slot comes.
+        call it from the main loop
+        return (`bool`): true if a frame went out
+        """
+        if not (self.auto and self.dirty and not self.__batch): return False
+        n=self.renders
+        self.__auto_render()
+        return self.renders!=n
+
+    def render(self,force=False):
+        """ render the colors to the strip. skipped when nothing changed. with
+        a non blocking backend this returns once the frame is queued
+        * force (`bool`): push even if clean
+        return (`bool`): true if a frame went out
+        """
+        if not (self.dirty or force): return False
+        self.t=time.ticks_us()
+        self._send()
+        self.dirty=False
+        self.__last=time.ticks_us()
+        self.renders+=1
+        return True
 
 def ie_cycle_rainbow_fast(strip):
-    strip.auto=False
-    for i in range(strip.amnt):
-        strip[i]=gradient_rainbow(maprange(i,0,strip.amnt,0,255))
+    with strip:
+        for i in range(strip.amnt):
+            strip[i]=gradient_rainbow(maprange(i,0,strip.amnt,0,255))
         
     strip.auto=True
     while True:
         strip.roll(1)
         # time.sleep(0.1)
 
+def ie_cycle_palette(strip,palette=None,speed=1):
+    """ rainbow cycle from a palette. no per pixel color math """
+    palette=palette or Palette.rainbow()
+    strip.auto=False
+    phase=0
+    while True:
+        strip.paint(palette,phase)
+        strip.render()
+        phase=(phase+speed)&0xff
+
 if __name__ == "__main__":
     strip=WS2812x(13,8)
     # print(strip[0])
     # strip.auto=True
     # strip.fill(0xff0000)
     ie_cycle_rainbow_fast(strip)
+    # non blocking on rp2, draw the next frame while this one goes out
+    # from nos.acc.backends import PIO
+    # strip=WS2812x(13,300,backend=PIO(Pin(13)))
+    # strip.gamma=2.2
+    # strip.brightness=0.2
+    # ie_cycle_palette(strip,Palette.gradient([(0,0xff0000),(128,0x0000ff),(255,0xff0000)]))
     # strip.roll(-1)
     # time.sleep(1)
     
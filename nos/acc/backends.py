@@ -0,0 +1,159 @@
+#===================================================================
+# file: backends.py
+# desc: ways of pushing a WS2812x frame out. blocking bitstream,
+#       non blocking rp2 pio+dma, and a capture sink for benchmarks
+# dev : nos
+# mcu :
+#   * rpi pico v2 (PIO)
+#   * esp32-wroom (Bitstream)
+#===================================================================
+# a backend has
+#   attach(nbytes) : called once by the strip with its frame size
+#   buffer()       : where the next frame should be composed, or None to
+#                    send straight from the strip's own buffer
+#   send(buf)      : starts pushing buf. blocking backends return when done
+#   busy()         : true while a frame is still going out
+#   wait()         : blocks until it isn't
+#===================================================================
+import time
+try: from machine import bitstream   # type: ignore
+except ImportError: bitstream=None     # host, Capture only
+
+TIMING = (400, 850, 800, 450)   # ns t0h, t0l, t1h, t1l. (800, 1700, 1600, 900) for 400kHz parts
+RESET_US = 300                  # low time that latches a frame, >280us for newer parts
+
+class Bitstream:
+    def __init__(self,pin,timing=TIMING):
+        """ machine.bitstream. blocks with interrupts off for the whole frame
+        * pin    (`Pin`)  : data pin
+        * timing (`tuple`): bit timing in ns
+        """
+        self.pin=pin
+        self.timing=timing
+
+    def attach(self,nbytes):
+        pass
+
+    def buffer(self):
+        return None
+
+    def send(self,buf):
+        bitstream(self.pin,0,self.timing,buf)
+
+    def busy(self):
+        return False
+
+    def wait(self):
+        pass
+
+class PIO:
+    def __init__(self,pin,sm_id=0,freq=800000):
+        """ rp2 state machine fed by dma. send returns right away; frames are
+        double buffered so the next one can be drawn while this one goes out
+        * pin   (`Pin`): data pin
+        * sm_id (`int`): state machine. 0-3 pio0, 4-7 pio1
+        * freq  (`int`): bit rate
+        """
+        import rp2  # type: ignore
+
+        @rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW,out_shiftdir=rp2.PIO.SHIFT_LEFT,
+                     autopull=True,pull_thresh=8)
+        def ws2812():
+            T1 = 2
+            T2 = 5
+            T3 = 3
+            wrap_target()                                   # type: ignore
+            label("bitloop")                                # type: ignore
+            out(x, 1)               .side(0)    [T3 - 1]    # type: ignore
+            jmp(not_x, "do_zero")   .side(1)    [T1 - 1]    # type: ignore
+            jmp("bitloop")          .side(1)    [T2 - 1]    # type: ignore
+            label("do_zero")                                # type: ignore
+            nop()                   .side(0)    [T2 - 1]    # type: ignore
+            wrap()                                          # type: ignore
+
+        self.sm=rp2.StateMachine(sm_id,ws2812,freq=freq*10,sideset_base=pin)
+        self.sm.active(1)
+        self.dma=rp2.DMA()
+        # byte writes to the tx fifo are replicated across the word, the top
+        # 8 bits are what gets shifted out first
+        self.ctrl=self.dma.pack_ctrl(size=0,inc_write=False,treq_sel=(sm_id//4)*8+sm_id%4)
+        self.bufs=None
+        self.back=0
+        self.__done=None        # ticks_us the fifo ran dry, None while sending
+
+    def attach(self,nbytes):
+        self.bufs=(bytearray(nbytes),bytearray(nbytes))
+
+    def buffer(self):
+        """ the buffer not being sent """
+        return self.bufs[self.back]
+
+    def busy(self):
+        if self.dma.active() or self.sm.tx_fifo(): return True
+        if self.__done==None: self.__done=time.ticks_us()
+        return time.ticks_diff(time.ticks_us(),self.__done)<RESET_US+10    # last word + latch
+
+    def wait(self):
+        while self.busy(): pass
+
+    def send(self,buf):
+        self.wait()
+        self.dma.config(read=buf,write=self.sm,count=len(buf),ctrl=self.ctrl,trigger=True)
+        self.__done=None
+        if buf is self.bufs[self.back]: self.back^=1
+
+class Capture:
+    def __init__(self,timing=TIMING,keep=16):
+        """ records frames instead of sending them. keeps the last keep frames
+        with their ticks_us and the time they'd take on the wire
+        * timing (`tuple`): bit timing in ns, for the wire time
+        * keep   (`int`)  : frames kept
+        """
+        self.bit_ns=max(timing[0]+timing[1],timing[2]+timing[3])
+        self.keep=keep
+        self.frames=[]
+        self.times=[]
+        self.count=0
+        self.nbytes=0
+        self.t0=None
+        self.t1=None
+
+    def attach(self,nbytes):
+        pass
+
+    def buffer(self):
+        return None
+
+    def wire_us(self,nbytes):
+        """ µs a frame of nbytes occupies the line, latch included """
+        return nbytes*8*self.bit_ns//1000+RESET_US
+
+    def send(self,buf):
+        t=time.ticks_us()
+        if self.t0==None: self.t0=t
+        self.t1=t
+        if len(self.frames)>=self.keep:
+            self.frames.pop(0)
+            self.times.pop(0)
+        self.frames.append(bytes(buf))
+        self.times.append(t)
+        self.count+=1
+        self.nbytes+=len(buf)
+
+    def busy(self):
+        return False
+
+    def wait(self):
+        pass
+
+    def stats(self):
+        """ achieved frame rate and the most the line could carry """
+        s=time.ticks_diff(self.t1,self.t0)/1000000 if self.count>1 else 0
+        n=self.nbytes//self.count if self.count else 0
+        return {
+            'frames'        : self.count,
+            'bytes'         : self.nbytes,
+            'fps'           : (self.count-1)/s if s else 0,
+            'wire_us'       : self.wire_us(n),
+            'wire_fps_max'  : 1000000/self.wire_us(n) if n else 0,
+        }
@@ -0,0 +1,223 @@
+#===================================================================
+# file: effects.py
+# desc: led effects as stateful steps, run by a fixed fps scheduler
+# dev : nos
+# mcu :
+#   * rpi pico v2
+#   * esp32-wroom
+#===================================================================
+import time
+from nos.acc.WS2812x import Palette, RGB
+from nos.util.timing import Ticker
+try: import asyncio
+except ImportError: import uasyncio as asyncio  #type: ignore
+
+class Effect:
+    """ one animation. draws a whole frame per step from the time it is given,
+    so speed doesn't depend on fps or strip length
+    """
+    def start(self,strip,t):
+        """ called when the effect starts playing
+        * strip (`WS2812x`): target
+        * t     (`int`)    : ticks_ms
+        """
+        self.t0=t
+
+    def step(self,strip,t):
+        """ draws one frame into strip's framebuffer. don't render
+        * t (`int`): ticks_ms of the frame
+        """
+        pass
+
+class Solid(Effect):
+    def __init__(self,rgb):
+        self.rgb=rgb
+
+    def step(self,strip,t):
+        strip.fill(self.rgb)
+
+class Rainbow(Effect):
+    def __init__(self,palette=None,period_ms=5000,spread=256):
+        """ palette cycling along the strip
+        * palette   (`Palette`): colors, rainbow by default
+        * period_ms (`int`)    : time for one full cycle
+        * spread    (`int`)    : palette indices across the strip
+        """
+        self.palette=palette or Palette.rainbow()
+        self.period_ms=period_ms
+        self.spread=spread
+
+    def step(self,strip,t):
+        phase=time.ticks_diff(t,self.t0)*256//self.period_ms
+        strip.paint(self.palette,phase,self.spread)
+
+class Chase(Effect):
+    def __init__(self,rgb,width=3,speed=30,bg=0):
+        """ a block of leds running along the strip
+        * rgb   (`int`): color
+        * width (`int`): leds
+        * speed (`int`): leds per second
+        * bg    (`int`): background color
+        """
+        self.rgb=rgb
+        self.width=width
+        self.speed=speed
+        self.bg=bg
+
+    def step(self,strip,t):
+        n=strip.amnt
+        p=time.ticks_diff(t,self.t0)*self.speed//1000%n
+        strip.fill(self.bg)
+        w=min(self.width,n-p)
+        strip.fill(self.rgb,p,w)
+        if w<self.width: strip.fill(self.rgb,0,self.width-w)
+
+class Breathe(Effect):
+    def __init__(self,rgb,period_ms=3000):
+        """ triangle wave fade of one color """
+        self.rgb=rgb
+        self.period_ms=period_ms
+
+    def step(self,strip,t):
+        x=time.ticks_diff(t,self.t0)%self.period_ms*512//self.period_ms
+        a=(x if x<256 else 511-x)/255
+        c=self.rgb
+        strip.fill(RGB(c>>16&0xff,c>>8&0xff,c&0xff,a))
+
+class Engine:
+    def __init__(self,strip,fps=30):
+        """ runs effects on strip at a fixed frame rate. frames that can't
+        make their deadline are dropped, animations keep their speed
+        * strip (`WS2812x`): target
+        * fps   (`int`)    : frame rate
+        """
+        self.strip=strip
+        self.ticker=Ticker(fps)
+        self.effect=None
+        self.running=False
+        self.__old=None                     # effect fading out
+        self.__snap=bytearray(len(strip.buf)) # its frame during a crossfade
+        self.__fade0=0
+        self.__fade_ms=0
+        self.reset_stats()
+
+    def play(self,effect,fade_ms=0):
+        """ switches effect, cross fading from the current one
+        * effect  (`Effect`): next effect
+        * fade_ms (`int`)   : crossfade time, 0 cuts
+        """
+        t=time.ticks_ms()
+        effect.start(self.strip,t)
+        if self.effect and fade_ms>0:
+            self.__old=self.effect
+            self.__fade0=t
+            self.__fade_ms=fade_ms
+        self.effect=effect
+
+    def reset_stats(self):
+        self.frames=0
+        self.compute_us_max=0
+        self.render_us_max=0
+        self.__compute_us=0
+        self.__render_us=0
+        self.ticker.reset()
+
+    @property
+    def fps(self):
+        """ frame rate. setting it retimes the ticker """
+        return self.ticker.hz
+
+    @fps.setter
+    def fps(self,fps):
+        self.ticker.hz=fps
+
+    @property
+    def dropped(self):
+        """ frames skipped to keep the schedule """
+        return self.ticker.overruns
+
+    def stats(self):
+        """ per frame compute and render time against the frame budget """
+        n=self.frames or 1
+        return {
+            'frames'        : self.frames,
+            'dropped'       : self.dropped,
+            'budget_us'     : int(self.ticker.period),
+            'compute_us_avg': self.__compute_us//n,
+            'compute_us_max': self.compute_us_max,
+            'render_us_avg' : self.__render_us//n,
+            'render_us_max' : self.render_us_max,
+        }
+
+    def __draw(self,t):
+        """ steps the effect, and the old one while fading, and mixes them """
+        strip=self.strip
+        old=self.__old
+        if old:
+            w=time.ticks_diff(t,self.__fade0)*256//self.__fade_ms
+            if w>=256: self.__old=old=None
+        if old:
+            old.step(strip,t)
+            snap=self.__snap
+            snap[:]=strip.buf
+        self.effect.step(strip,t)
+        if old:
+            buf=strip.buf
+            v=256-w
+            for i in range(len(snap)):
+                buf[i]=(snap[i]*v+buf[i]*w)>>8
+
+    def frame(self):
+        """ draws and renders one frame now """
+        t=time.ticks_ms()
+        t0=time.ticks_us()
+        with self.strip:
+            if self.effect: self.__draw(t)
+        t1=time.ticks_us()
+        self.strip.render()
+        t2=time.ticks_us()
+        c=time.ticks_diff(t1,t0)
+        r=time.ticks_diff(t2,t1)
+        self.__compute_us+=c
+        self.__render_us+=r
+        if c>self.compute_us_max: self.compute_us_max=c
+        if r>self.render_us_max: self.render_us_max=r
+        self.frames+=1
+
+    def start(self):
+        """ blocking loop """
+        self.running=True
+        self.reset_stats()
+        while self.running:
+            self.ticker.wait()
+            self.frame()
+
+    async def serve(self):
+        """ asyncio loop: asyncio.create_task(engine.serve()) """
+        self.running=True
+        self.reset_stats()
+        while self.running:
+            await self.ticker.wait_async()
+            self.frame()
+
+    def stop(self):
+        self.running=False
+
+
+if __name__=="__main__":
+    from nos.acc.WS2812x import WS2812x
+    strip=WS2812x(13,300)
+    strip.brightness=0.3
+    engine=Engine(strip,fps=60)
+    engine.play(Rainbow(period_ms=4000))
+
+    async def main():
+        asyncio.create_task(engine.serve())
+        effects=(Chase(0x00ff40,width=10,speed=120),Breathe(0xff2000),Rainbow())
+        i=0
+        while True:
+            await asyncio.sleep(5)
+            print(engine.stats())
+            engine.play(effects[i%len(effects)],fade_ms=1000)
+            i+=1
+    asyncio.run(main())
@@ -0,0 +1,243 @@
+#===================================================================
+# file: segments.py
+# desc: zones on a WS2812x framebuffer, and several pins driven as
+#       one strip
+# dev : nos
+# mcu :
+#   * rpi pico v2
+#   * esp32-wroom
+#===================================================================
+from machine import Pin  # type: ignore
+from nos.acc.WS2812x import WS2812x
+from nos.acc.backends import Bitstream
+
+class Segment:
+    def __init__(self,strip,offset,length,reverse=False,mirror=False):
+        """ a view of leds offset..offset+length of strip with the pixel api.
+        nothing is copied, writes go straight to the strip's framebuffer
+        * strip   (`WS2812x`): owner of the framebuffer
+        * offset  (`int`)    : first led
+        * length  (`int`)    : leds
+        * reverse (`bool`)   : led 0 is the last one of the range
+        * mirror  (`bool`)   : the second half repeats the first backwards.
+        the segment is then (length+1)//2 leds long
+        """
+        self.strip=strip
+        self.offset=offset
+        self.length=length
+        self.mirror=mirror
+        self.reverse=reverse and not mirror     # mirrored is symmetric anyway
+        self.amnt=(length+1)//2 if mirror else length
+        self.plain=not (reverse or mirror)
+
+    def __len__(self):
+        return self.amnt
+
+    @property
+    def auto(self):
+        return self.strip.auto
+
+    @auto.setter
+    def auto(self,v):
+        self.strip.auto=v
+
+    @property
+    def buf(self):
+        """ memoryview of the physical range, grb """
+        return self.strip.buf[self.offset*3:(self.offset+self.length)*3]
+
+    def __phys(self,i):
+        if i<0: i+=self.amnt
+        if i<0 or i>=self.amnt: raise IndexError("led out of segment")
+        return self.offset+(self.length-1-i if self.reverse else i)
+
+    def __range(self,start,count):
+        """ start,count clamped to the segment. None count runs to the end """
+        n=self.amnt
+        start=max(0,min(start,n))
+        if count==None or count>n-start: count=n-start
+        return start,count
+
+    def __span(self,start,count):
+        """ physical start of logical leds start..start+count """
+        if self.reverse: return self.offset+self.length-start-count
+        return self.offset+start
+
+    def __remirror(self):
+        """ copies the first half onto the second, backwards """
+        mv=self.strip.buf
+        o=self.offset*3
+        e=(self.offset+self.length-1)*3
+        for k in range(self.length//2):
+            mv[e-k*3:e-k*3+3]=mv[o+k*3:o+k*3+3]
+        self.strip.changed()
+
+    def __setitem__(self,i,rgb):
+        if type(i)==slice:
+            a=0 if i.start==None else i.start
+            b=self.amnt if i.stop==None else i.stop
+            if a<0: a+=self.amnt
+            if b<0: b+=self.amnt
+            a,n=self.__range(a,max(0,b-a))
+            if type(rgb)==int: return self.fill(rgb,a,n)
+            b=a+n
+            with self.strip:
+                for k in range(min(b-a,len(rgb))): self[a+k]=rgb[k]
+            return
+        p=self.__phys(i)
+        if not self.mirror:
+            self.strip[p]=rgb
+            return
+        with self.strip:
+            self.strip[p]=rgb
+            self.strip[2*self.offset+self.length-1-p]=rgb
+
+    def __getitem__(self,i):
+        if type(i)==slice:
+            a=0 if i.start==None else i.start
+            b=self.amnt if i.stop==None else i.stop
+            if a<0: a+=self.amnt
+            if b<0: b+=self.amnt
+            return [self[k] for k in range(max(0,a),min(b,self.amnt))]
+        return self.strip[self.__phys(i)]
+
+    def fill(self,rgb,start=0,count=None):
+        """ fills leds start..start+count, clamped to the segment """
+        start,count=self.__range(start,count)
+        if count<=0: return
+        if not self.mirror: return self.strip.fill(rgb,self.__span(start,count),count)
+        with self.strip:
+            self.strip.fill(rgb,self.offset+start,count)
+            self.strip.fill(rgb,self.offset+self.length-start-count,count)
+
+    def roll(self,amnt):
+        if self.mirror:
+            with self.strip:
+                self.strip.roll(amnt,self.offset,self.amnt)
+                self.__remirror()
+            return
+        self.strip.roll(-amnt if self.reverse else amnt,self.offset,self.length)
+
+    def paint(self,palette,phase=0,spread=256,start=0,count=None):
+        start,count=self.__range(start,count)
+        if count<=0: return
+        if self.reverse:
+            step=int(spread*256)//count
+            return self.strip.paint(palette,phase+(count-1)*step/256,-step*count/256,
+                                    self.__span(start,count),count)
+        if not self.mirror: return self.strip.paint(palette,phase,spread,self.offset+start,count)
+        with self.strip:
+            self.strip.paint(palette,phase,spread,self.offset+start,count)
+            self.__remirror()
+
+    def blit(self,src,at=0,start=0,count=None):
+        """ copies leds from a strip, segment or grb buffer. clamped to the segment
+        and the source
+        """
+        at,count=self.__range(at,count)
+        if self.plain and not isinstance(src,Segment):
+            return self.strip.blit(src,self.offset+at,start,count)
+        m=len(src) if hasattr(src,'amnt') else len(src)//3
+        start=max(0,min(start,m))
+        count=min(count,m-start)
+        with self.strip:
+            for k in range(count):
+                if hasattr(src,'amnt'): c=src[start+k]
+                else:
+                    j=(start+k)*3
+                    c=src[j+1]<<16 | src[j]<<8 | src[j+2]
+                self[at+k]=c
+
+    def clear(self):
+        with self.strip: self.fill(0)
+        self.strip.render()
+
+    def changed(self):
+        self.strip.changed()
+
+    def render(self,force=False):
+        """ renders the whole strip """
+        return self.strip.render(force)
+
+    def service(self):
+        return self.strip.service()
+
+    def busy(self):
+        return self.strip.busy()
+
+    def wait(self):
+        self.strip.wait()
+
+    def __enter__(self):
+        self.strip.__enter__()
+        return self
+
+    def __exit__(self,*a):
+        self.strip.__exit__(*a)
+
+class StripGroup(WS2812x):
+    def __init__(self,pins,counts,auto=False,max_fps=0,backends=None):
+        """ several strips on their own pins as one framebuffer. a render pushes
+        every pin with the same frame timestamp
+        * pins     (`list`): data pins
+        * counts   (`list`): leds per pin
+        * backends (`list`): one per pin instead of bitstream
+        """
+        self.counts=counts
+        self.backends=backends or [Bitstream(Pin(p,Pin.OUT)) for p in pins]
+        super().__init__(None,sum(counts),auto,max_fps,backend=self.backends[0])
+        self.spans=[]
+        o=0
+        for b,n in zip(self.backends,counts):
+            b.attach(n*3)
+            self.spans.append((o*3,(o+n)*3))
+            o+=n
+        self.__out=None
+        self.__views=None
+
+    def zone(self,i,reverse=False,mirror=False):
+        """ the leds of pin i as a Segment """
+        o=sum(self.counts[:i])
+        return Segment(self,o,self.counts[i],reverse,mirror)
+
+    def _send(self):
+        out=self.output()
+        if out is not self.__out:     # lut on or off since last time
+            mv=memoryview(out)
+            self.__out=out
+            self.__views=[mv[a:b] for a,b in self.spans]
+        for b,v in zip(self.backends,self.__views):
+            bb=b.buffer()
+            if bb!=None:
+                bb[:]=v
+                b.send(bb)
+            else: b.send(v)
+
+    def busy(self):
+        for b in self.backends:
+            if b.busy(): return True
+        return False
+
+    def wait(self):
+        for b in self.backends: b.wait()
+
+
+if __name__=="__main__":
+    from nos.acc.effects import Engine, Rainbow, Chase
+    # two 150 led strips, one framebuffer. left half of pin 13 runs backwards
+    strips=StripGroup([13,14],[150,150])
+    left=Segment(strips,0,75,reverse=True)
+    ring=strips.zone(1,mirror=True)
+    import time
+    t0=time.ticks_ms()
+    a=Rainbow(period_ms=3000)
+    b=Chase(0x0040ff,width=5,speed=40)
+    a.start(left,t0)
+    b.start(ring,t0)
+    while True:
+        t=time.ticks_ms()
+        with strips:
+            a.step(left,t)
+            b.step(ring,t)
+        strips.render()
+        time.sleep_ms(16)
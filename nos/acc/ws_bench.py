@@ -0,0 +1,61 @@
+#===================================================================
+# file: ws_bench.py
+# desc: WS2812x framebuffer benchmark. the old per pixel and
+#       concatenating operations against the memoryview ones.
+#       render is left out, bitstream costs the same either way
+# dev : nos
+#===================================================================
+from nos.acc.WS2812x import WS2812x, Palette, gradient_rainbow
+from nos.acc.backends import Capture
+from nos.util.bench import report
+
+def legacy_set(a,i,rgb):
+    r,g,b=((rgb>>x&0xff) for x in [16,8,0])
+    i=i*3
+    a[i+0]=g
+    a[i+1]=r
+    a[i+2]=b
+
+def legacy_roll(a,amnt):
+    a[:]=a[amnt*3:]+a[:amnt*3]
+
+def legacy_fill(a,n,rgb):
+    for i in range(n): legacy_set(a,i,rgb)
+
+def legacy_rainbow(a,n,phase):
+    for i in range(n): legacy_set(a,i,gradient_rainbow(phase+i*255//n))
+
+def run(pin=13,amnt=300,n=50):
+    strip=WS2812x(pin,amnt)
+    other=WS2812x(pin,amnt)
+    a=bytearray(amnt*3)
+    for i in range(amnt): strip[i]=gradient_rainbow(i*255//amnt)
+    pal=Palette.rainbow()
+    dim=WS2812x(pin,amnt)
+    dim.blit(strip)
+    dim.gamma=2.2
+    dim.brightness=0.25
+    cap=Capture()
+    sink=WS2812x(None,amnt,backend=cap)
+    sink.blit(strip)
+    sink.brightness=0.5
+    rows=(
+        ("roll legacy",         lambda: legacy_roll(a,1)),
+        ("roll",                lambda: strip.roll(1)),
+        ("roll -1",             lambda: strip.roll(-1)),
+        ("fill legacy",         lambda: legacy_fill(a,amnt,0x123456)),
+        ("fill",                lambda: strip.fill(0x123456)),
+        ("blit",                lambda: other.blit(strip)),
+        ("rainbow legacy",      lambda: legacy_rainbow(a,amnt,7)),
+        ("rainbow palette",     lambda: strip.paint(pal,7)),
+        ("output linear",       strip.output),
+        ("output gamma+dim",    dim.output),
+        ("render capture",      lambda: sink.render(True)),
+    )
+    for name,fn in rows:
+        us,_=report(name,fn,n)
+        print("%-24s %10.0f fps" % (name,1000000/us if us else 0))
+    print(cap.stats())
+
+if __name__=="__main__":
+    run()
@@ -0,0 +1,90 @@
+#===================================================================
+# file: capture.py
+# desc: appendable capture file for long UDP_STREAM recordings.
+#       fixed size records so the whole file memory maps as one array
+# dev : nos
+#===================================================================
+# file = header | records
+#   header  64 bytes
+#     magic    4s  b'NCAP'
+#     version  H
+#     fmt len  H
+#     fmt      56s struct format of one sample, nul padded
+#   record  t (int64 µs, unwrapped device ticks) | one sample packed with fmt
+#===================================================================
+import os
+import struct
+import numpy as np
+from nos.host.receiver import dtype_for
+
+MAGIC       = b'NCAP'
+VERSION     = 1
+HEADER      = '<4sHH56s'
+HEADER_SIZE = struct.calcsize(HEADER)
+
+class CAPTURE_ERROR(Exception):pass
+
+def record_dtype(fmt):
+    """ numpy dtype of one record for a sample fmt """
+    return np.dtype([('t','<i8'),('x',dtype_for(fmt))])
+
+def read_header(path):
+    """ sample fmt stored in a capture file """
+    with open(path,'rb') as fp: d=fp.read(HEADER_SIZE)
+    if len(d)<HEADER_SIZE: raise CAPTURE_ERROR("short file")
+    magic,ver,n,fmt=struct.unpack(HEADER,d)
+    if magic!=MAGIC or ver!=VERSION: raise CAPTURE_ERROR("not a capture file")
+    return fmt[:n].decode()
+
+class CaptureWriter:
+    def __init__(self,path,fmt):
+        """ opens path for appending. a new file gets a header, an existing one
+        must have been written with the same fmt
+        * path (`str`): capture file
+        * fmt  (`str`): struct format of one sample
+        """
+        f=fmt.encode()
+        if len(f)>56: raise CAPTURE_ERROR("fmt too long")
+        self.fmt=fmt
+        self.dtype=record_dtype(fmt)
+        if os.path.exists(path) and os.path.getsize(path)>0:
+            if read_header(path)!=fmt: raise CAPTURE_ERROR("fmt differs from %s" % path)
+            self.fp=open(path,'ab')
+            # drop a torn record left by a crash so records stay aligned
+            size=os.path.getsize(path)-HEADER_SIZE
+            if size%self.dtype.itemsize:
+                self.fp.truncate(HEADER_SIZE+size-size%self.dtype.itemsize)
+        else:
+            self.fp=open(path,'wb')
+            self.fp.write(struct.pack(HEADER,MAGIC,VERSION,len(f),f))
+
+    def append(self,t,payload):
+        """ appends samples
+        * t       (`ndarray`)      : int64 µs per sample
+        * payload (`bytes|ndarray`): samples packed with fmt
+        """
+        x=np.frombuffer(payload,dtype=self.dtype['x']) if isinstance(payload,(bytes,bytearray,memoryview)) else payload
+        rec=np.empty(len(t),self.dtype)
+        rec['t']=t
+        rec['x']=x
+        self.fp.write(rec.tobytes())
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*a):
+        self.close()
+
+def open_capture(path,mode='r'):
+    """ memory maps a capture file
+    return (`np.memmap`): records with fields 't' and 'x'
+    """
+    dt=record_dtype(read_header(path))
+    n=(os.path.getsize(path)-HEADER_SIZE)//dt.itemsize
+    return np.memmap(path,dtype=dt,mode=mode,offset=HEADER_SIZE,shape=(n,))
@@ -0,0 +1,40 @@
+#===================================================================
+# file: logfile.py
+# desc: memory mapped reader for nos.util.recorder flash logs
+# dev : nos
+#===================================================================
+import struct
+import numpy as np
+from nos.util.recorder import MAGIC, VERSION, FILE_HEADER, BLOCK_SIZE
+from nos.host.receiver import dtype_for, Unwrap
+
+def open_log(path):
+    """ maps <path>.dat as an array of blocks
+    return (`tuple`): fmt, np.memmap of blocks with fields seq, t0, t1, n, rec
+    """
+    with open(path+'.dat','rb') as fp: head=fp.read(struct.calcsize(FILE_HEADER)+255)
+    magic,ver,flen,rec,block,blocks=struct.unpack_from(FILE_HEADER,head)
+    if magic!=MAGIC or ver!=VERSION: raise ValueError("%s.dat is not a recorder log" % path)
+    o=struct.calcsize(FILE_HEADER)
+    fmt=head[o:o+flen].decode()
+    per=(block-BLOCK_SIZE)//rec
+    r=np.dtype([('t','<u4'),('x',dtype_for(fmt))])
+    dt=np.dtype({'names':['seq','t0','t1','n','rec'],
+                 'formats':['<u4','<u4','<u4','<u2',(r,(per,))],
+                 'offsets':[0,4,8,12,BLOCK_SIZE],
+                 'itemsize':block})
+    m=np.memmap(path+'.dat',dtype=np.uint8,mode='r')
+    n=len(m)//block-1
+    return fmt,np.ndarray((n,),dtype=dt,buffer=m,offset=block)
+
+def read_log(path):
+    """ every record in the log in sequence order
+    return (`tuple`): t (int64 µs, unwrapped device ticks), samples
+    """
+    fmt,b=open_log(path)
+    b=b[b['n']>0]
+    b=b[np.argsort(b['seq'],kind='stable')]
+    rec=np.concatenate([blk['rec'][:blk['n']] for blk in b]) if len(b) else np.zeros(0,b.dtype['rec'].base)
+    u=Unwrap()
+    t=np.fromiter((u(int(v)) for v in rec['t']),np.int64,len(rec))
+    return t,rec['x']
@@ -0,0 +1,110 @@
+#===================================================================
+# file: loopback.py
+# desc: local stand-in for a UDP_STREAM device and a receiver
+#       throughput benchmark against it
+# dev : nos
+#===================================================================
+import socket
+import struct
+import threading
+import time
+from nos.util.stream_format import FrameBuilder
+from nos.util.delta import DeltaFrameBuilder
+from nos.host.receiver import StreamReceiver, TICKS_PERIOD
+
+def ticks_us():
+    return (time.perf_counter_ns()//1000)&(TICKS_PERIOD-1)
+
+class FakeDevice:
+    def __init__(self,port=0,fmt='<7h',batch=64,hz=0,drop_every=0,codec=None):
+        """ answers start/stop/ping and streams a counting pattern
+        * port       (`int`)  : udp port, 0 picks a free one
+        * fmt        (`str`)  : struct format of one sample
+        * batch      (`int`)  : samples per frame
+        * hz         (`float`): sample rate, 0 for as fast as possible
+        * drop_every (`int`)  : skip sending every nth frame to exercise loss counting
+        * codec      (`str`)  : 'delta' for delta coded frames
+        """
+        self.sock=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_SNDBUF,4<<20)
+        self.sock.bind(('127.0.0.1',port))
+        self.sock.setblocking(False)
+        self.port=self.sock.getsockname()[1]
+        self.fb=DeltaFrameBuilder(fmt,batch=batch) if codec=='delta' else FrameBuilder(fmt,batch=batch)
+        self.hz=hz
+        self.drop_every=drop_every
+        self.clients=set()
+        self.sent=0
+        self.running=False
+        self.thread=None
+
+    def __ctrl(self):
+        while True:
+            try: msg,addr=self.sock.recvfrom(256)
+            except (BlockingIOError,OSError): return
+            cmd=msg.split()[0] if msg.split() else b''
+            if cmd==b'start': self.clients.add(addr)
+            elif cmd==b'stop': self.clients.discard(addr)
+
+    def __run(self):
+        fb=self.fb
+        n=struct_len(fb.fmt)
+        period=1e6/self.hz if self.hz else 0
+        t_next=time.perf_counter()
+        i=0
+        while self.running:
+            self.__ctrl()
+            if not self.clients:
+                time.sleep(0.001)
+                continue
+            if period:
+                t_next+=period/1e6
+                d=t_next-time.perf_counter()
+                if d>0: time.sleep(d)
+            if fb.add([i&0x7fff]*n,ticks_us()):
+                buf=fb.frame()
+                if not (self.drop_every and fb.seq%self.drop_every==0):
+                    for c in tuple(self.clients):
+                        try: self.sock.sendto(buf,c)
+                        except (BlockingIOError,OSError): pass
+                    self.sent+=1
+            i+=1
+
+    def start(self):
+        self.running=True
+        self.thread=threading.Thread(target=self.__run,daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running=False
+        if self.thread: self.thread.join()
+        self.sock.close()
+
+def struct_len(fmt):
+    """ number of values in one sample of fmt """
+    return len(struct.unpack(fmt,bytes(struct.calcsize(fmt))))
+
+def benchmark(seconds=3.0,fmt='<7h',batch=64,hz=0,codec=None):
+    """ streams from a FakeDevice into a StreamReceiver over loopback
+    return (`dict`): receiver stats plus throughput
+    """
+    dev=FakeDevice(fmt=fmt,batch=batch,hz=hz,codec=codec).start()
+    rx=StreamReceiver('127.0.0.1',dev.port)
+    rx.subscribe()
+    t0=time.perf_counter()
+    t,x=rx.read(seconds=seconds)
+    dt=time.perf_counter()-t0
+    rx.close()
+    dev.stop()
+    s=rx.stats
+    s['samples_per_s']=len(t)/dt
+    s['mb_per_s']=(x.nbytes if x is not None else 0)/dt/1e6
+    s['device_frames']=dev.sent
+    return s
+
+if __name__=="__main__":
+    for batch,codec in ((1,None),(16,None),(64,None),(64,'delta')):
+        s=benchmark(batch=batch,codec=codec)
+        print("batch %3d %-5s %10.0f samples/s  %6.2f MB/s  lost %d/%d  p99 latency %.0f us" % (
+            batch,codec or '',s['samples_per_s'],s['mb_per_s'],s['lost'],s['frames']+s['lost'],s['latency_us_p99']))
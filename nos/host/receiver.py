@@ -0,0 +1,234 @@
+#===================================================================
+# file: receiver.py
+# desc: host side (cpython) UDP_STREAM client. decodes binary frames
+#       into numpy arrays in bulk
+# dev : nos
+#===================================================================
+import socket
+import time
+import numpy as np
+from nos.util.stream_format import unpack_header, FORMAT_ERROR, FLAG_DELTA, FLAG_REPLAY
+from nos.util.delta import DeltaDecoder
+
+TICKS_PERIOD = 1<<30    # micropython ticks_us wrap on rp2/esp32
+
+# struct codes to numpy. '<' standard sizes
+_CODES = {'b':'i1','B':'u1','h':'i2','H':'u2','i':'i4','I':'u4','l':'i4','L':'u4',
+          'q':'i8','Q':'u8','e':'f2','f':'f4','d':'f8','?':'u1'}
+
+def dtype_for(fmt):
+    """ numpy dtype for one struct sample. uniform formats become a subarray
+    so samples decode to a plain 2d array
+    * fmt (`str`): struct format, e.g. '<7h'
+    """
+    order='>' if fmt[:1] in '>!' else '<'
+    body=fmt.lstrip('<>!=@')
+    codes=[]
+    n=''
+    for ch in body:
+        if ch.isdigit(): n+=ch
+        elif ch in ' \t': continue
+        else:
+            if ch not in _CODES: raise FORMAT_ERROR("unsupported code %r" % ch)
+            codes+=[ch]*int(n or 1)
+            n=''
+    if len(set(codes))==1:
+        return np.dtype((order+_CODES[codes[0]],(len(codes),)))
+    return np.dtype([('f%d' % i,order+_CODES[c]) for i,c in enumerate(codes)])
+
+class Unwrap:
+    def __init__(self,period=TICKS_PERIOD):
+        """ turns wrapping device ticks into a monotonic int64 µs count """
+        self.period=period
+        self.base=0
+        self.last=None
+
+    def __call__(self,t):
+        if self.last!=None and t<self.last and self.last-t>self.period//2:
+            self.base+=self.period
+        self.last=t
+        return self.base+t
+
+class StreamReceiver:
+    def __init__(self,host,port=65000,rate=0,topics=None,rcvbuf=8<<20,keepalive=2.0,ticks_period=TICKS_PERIOD):
+        """ subscribes to a device UDP_STREAM and receives binary frames
+        * host      (`str`)   : device address
+        * port      (`int`)   : device port
+        * rate      (`float`) : requested rate in Hz. 0 for every tick
+        * topics    (`list`)  : topic names, None for everything
+        * rcvbuf    (`int`)   : socket receive buffer in bytes
+        * keepalive (`float`) : seconds between pings while receiving
+        """
+        self.addr=(host,port)
+        self.rate=rate
+        self.topics=topics
+        self.keepalive=keepalive
+        self.sock=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF,rcvbuf)
+        self.sock.bind(('0.0.0.0',0))
+        self.unwrap=Unwrap(ticks_period)
+        self.replay_unwrap=Unwrap(ticks_period)     # backlog has its own timeline
+        self.fmt=None
+        self.dtype=None
+        self.decoder=None
+        self.reset_stats()
+        self.__pinged=0
+
+    def reset_stats(self):
+        self.frames=0
+        self.samples=0
+        self.lost=0             # frames missing from the sequence
+        self.reordered=0        # frames older than one already seen
+        self.duplicates=0
+        self.replayed=0         # backlog samples, not in the counts above
+        self.__seq=None
+        self.__offset=None      # min(host - device) µs, clock offset plus best case latency
+        self.__lat=[]
+
+    @property
+    def stats(self):
+        """ loss, reordering and relative one-way latency. latency is measured
+        above the best case seen, as device and host clocks are not synced
+        """
+        lat=np.array(self.__lat) if self.__lat else np.zeros(1)
+        return {
+            'frames'        : self.frames,
+            'samples'       : self.samples,
+            'lost'          : self.lost,
+            'reordered'     : self.reordered,
+            'duplicates'    : self.duplicates,
+            'replayed'      : self.replayed,
+            'loss_rate'     : self.lost/max(1,self.frames+self.lost),
+            'latency_us_p50': float(np.percentile(lat,50)),
+            'latency_us_p99': float(np.percentile(lat,99)),
+            'latency_us_max': float(lat.max()),
+        }
+
+    def __send(self,msg):
+        self.sock.sendto(msg,self.addr)
+
+    def subscribe(self):
+        msg='start %g' % self.rate
+        if self.topics: msg+=' '+','.join(self.topics)
+        self.__send(msg.encode())
+        self.__pinged=time.monotonic()
+
+    def unsubscribe(self):
+        self.__send(b'stop')
+
+    def close(self):
+        self.unsubscribe()
+        self.sock.close()
+
+    def __enter__(self):
+        self.subscribe()
+        return self
+
+    def __exit__(self,*a):
+        self.close()
+
+    def __track(self,seq,t_last,host_us):
+        """ sequence and latency bookkeeping for one frame """
+        if self.__seq!=None:
+            d=(seq-self.__seq)&0xffffffff
+            if d==0: self.duplicates+=1
+            elif d<0x80000000:
+                self.lost+=d-1
+                self.__seq=seq
+            else:
+                self.reordered+=1
+                self.lost=max(0,self.lost-1)   # it was counted missing
+        else: self.__seq=seq
+        off=host_us-t_last
+        if self.__offset==None or off<self.__offset: self.__offset=off
+        self.__lat.append(off-self.__offset)
+        if len(self.__lat)>100000: del self.__lat[:50000]
+
+    def frames_for(self,seconds=None,count=None,replay=False):
+        """ receives frames, yields (t0 µs, period µs, count, payload bytes,
+        flags) with t0 unwrapped. stops after seconds or count live frames
+        * replay (`bool`): also yield backlog frames, flagged FLAG_REPLAY. their
+        t0 is unwrapped on a timeline of its own. False only counts them
+        """
+        self.sock.settimeout(0.5)
+        end=None if seconds==None else time.monotonic()+seconds
+        n=0
+        while (end==None or time.monotonic()<end) and (count==None or n<count):
+            now=time.monotonic()
+            if self.keepalive and now-self.__pinged>self.keepalive:
+                self.__send(b'ping')
+                self.__pinged=now
+            try: data=self.sock.recv(65535)
+            except socket.timeout: continue
+            host_us=time.perf_counter_ns()//1000
+            try: flags,sid,fmt,cnt,seq,t0,period,o=unpack_header(data)
+            except FORMAT_ERROR: continue
+            if fmt!=self.fmt:
+                self.fmt=fmt
+                self.dtype=dtype_for(fmt)
+                self.decoder=None
+            if flags&FLAG_REPLAY:
+                # backlog from nos.util.recorder. own seq, old timestamps
+                self.replayed+=cnt
+                if replay: yield self.replay_unwrap(t0),period,cnt,data[o:o+cnt*self.dtype.itemsize],flags
+                continue
+            t0=self.unwrap(t0)
+            self.__track(seq,t0+period*(cnt-1),host_us)
+            if flags&FLAG_DELTA:
+                if self.decoder==None: self.decoder=DeltaDecoder(fmt)
+                payload=self.decoder.decode(flags,cnt,seq,memoryview(data)[o:])
+                if payload==None: continue      # waiting for a key after a gap
+                self.frames+=1
+                self.samples+=cnt
+                n+=1
+                yield t0,period,cnt,payload,flags
+                continue
+            self.frames+=1
+            self.samples+=cnt
+            n+=1
+            yield t0,period,cnt,data[o:o+cnt*self.dtype.itemsize],flags
+
+    def read(self,seconds=None,count=None,replay=False):
+        """ receives for seconds or count frames and decodes in one go
+        * replay (`bool`): include backlog samples and return a mask of them
+        return (`tuple`): t (int64 µs, unwrapped device ticks), samples, and
+        with replay a bool array that is true for backlog samples. backlog t
+        is on its own timeline
+        """
+        t0s=[]
+        periods=[]
+        counts=[]
+        chunks=[]
+        old=[]
+        for t0,p,c,payload,flags in self.frames_for(seconds,count,replay):
+            t0s.append(t0)
+            periods.append(p)
+            counts.append(c)
+            chunks.append(payload)
+            old.append(bool(flags&FLAG_REPLAY))
+        if not chunks: x=None
+        else: x=np.frombuffer(b''.join(chunks),dtype=self.dtype)
+        t=timestamps(t0s,periods,counts)
+        if not replay: return t,x
+        return t,x,np.repeat(np.array(old,bool),np.asarray(counts,np.int64))
+
+    def capture(self,writer,seconds=None,count=None,backlog=None):
+        """ streams frames into a CaptureWriter until done. returns live samples written
+        * backlog (`CaptureWriter`): gets the replayed backlog. None drops it
+        """
+        n=0
+        for t0,p,c,payload,flags in self.frames_for(seconds,count,backlog!=None):
+            if flags&FLAG_REPLAY:
+                backlog.append(timestamps([t0],[p],[c]),payload)
+                continue
+            writer.append(timestamps([t0],[p],[c]),payload)
+            n+=c
+        return n
+
+def timestamps(t0s,periods,counts):
+    """ per sample µs from per frame t0, period and count. vectorised """
+    counts=np.asarray(counts,np.int64)
+    start=np.repeat(np.asarray(t0s,np.int64),counts)
+    step=np.repeat(np.asarray(periods,np.int64),counts)
+    first=np.repeat(np.cumsum(counts)-counts,counts)
+    return start+step*(np.arange(counts.sum())-first)
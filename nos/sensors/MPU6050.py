@@ -6,7 +6,11 @@
 #   * rpi pico v2
 #===================================================================
 from nos.util.i2c import NosI2CDevice
+import nos.util.store as store
+from machine import Pin     #type: ignore
 from math import atan2, degrees,sqrt
+from array import array
+import micropython          #type: ignore
 import time
 
 class MPU6050(NosI2CDevice):
@@ -14,14 +18,19 @@ class MPU6050(NosI2CDevice):
     
     # read write
     RW_SMPLRT_DIV   = 25    # sample rate
+    RW_CONFIG       = 26    # dlpf
     RW_GYRO_CONFIG  = 27
     RW_ACCEL_CONFIG = 28
+    RW_FIFO_EN      = 35
+    RW_INT_PIN_CFG  = 55
     RW_INT_ENABLE   = 56
+    RW_USER_CTRL    = 106
     RW_PWR_MGMT_1   = 107
     RW_PWR_MGMT_2   = 108
+    RW_FIFO_R_W     = 116
     
     # read
-    R_INT_STATUS    = 57
+    R_INT_STATUS    = 58
     R_ACCEL_XOUT_H  = 59
     R_ACCEL_XOUT_L  = 60
     R_ACCEL_YOUT_H  = 61
@@ -36,8 +45,14 @@ class MPU6050(NosI2CDevice):
     R_GYRO_YOUT_L   = 70
     R_GYRO_ZOUT_H   = 71
     R_GYRO_ZOUT_L   = 72
+    R_FIFO_COUNT_H  = 114
+    R_FIFO_COUNT_L  = 115
     R_WHO_AM_I      = 117
     
+    RAW_LEN         = 7     # ax,ay,az,temp,wx,wy,wz
+    FRAME_LEN       = 14    # bytes per frame, registers and fifo alike
+    FIFO_SIZE       = 1024
+    
     class UNIT_EXCEPTION(Exception):pass
     class RANGE_ERROR(Exception):pass
     
@@ -49,14 +64,10 @@ class MPU6050(NosI2CDevice):
         # wake. set 7th to 1 to reset.
         self.write_reg(self.RW_PWR_MGMT_1,0x0)   
         
-        # setup gyro and accel
-        data = self.read_reg(self.RW_GYRO_CONFIG,1)
-        fs_sel = int.from_bytes(data,'big')>>3&0b11
-        self.gyro_lsb = [131,65.5,32.8,16.4][fs_sel]
-        
-        data = self.read_reg(self.RW_ACCEL_CONFIG,1)
-        afs_sel = int.from_bytes(data,'big')>>3&0b11
-        self.accel_lsb = [16384,8192,4096,2048][afs_sel]
+        # config registers live in a shadow. one read now, rmw without reads after
+        self.shadow_regs(self.RW_SMPLRT_DIV,self.RW_CONFIG,self.RW_GYRO_CONFIG,
+                         self.RW_ACCEL_CONFIG,self.RW_FIFO_EN,self.RW_INT_PIN_CFG,
+                         self.RW_INT_ENABLE,self.RW_USER_CTRL)
         
         self.set_gyro_range(0)
         self.set_accel_range(0)
@@ -66,20 +77,26 @@ class MPU6050(NosI2CDevice):
         self.__rz=0
         
         self.__rg=[0,0,0]
-        self.__drift=[0,0,0]
+        self.fusion=None    # nos.sensors.fusion filter used by get_data when set
+        
+        # preallocated read buffers
+        self.__frame = bytearray(self.FRAME_LEN)
+        self.__raw = array('h',[0]*self.RAW_LEN)
+        self.__f = array('f',[0]*self.RAW_LEN)
+        self.__cnt = bytearray(2)
+        self.__st = bytearray(1)
+        self.fifo_frames = 0
+        
+        # bias in g and °/s. ax,ay,az,-,wx,wy,wz. warm boots load it from flash
+        self.bias = array('f',[0]*self.RAW_LEN)
+        self.calibrated = self.load_bias()
         
-    def write_reg(self,reg,data):
-        data=data.to_bytes(2,'big')
-        self.i2c.write_reg(self.addr,reg,data)
-    def read_reg(self,reg,nbytes=1):
-        return self.i2c.read_reg(self.addr,reg,nbytes)
-    
     def set_accel_range(self,r:int):
         """ set accelerometer full scale range based on datasheet
         * r (`int`): 0-3
         """
         if r not in range(4): raise self.RANGE_ERROR
-        self.write_reg(self.RW_GYRO_CONFIG,r<<3)
+        self.update_reg(self.RW_ACCEL_CONFIG,0x18,r<<3)
         self.accel_lsb = [16384,8192,4096,2048][r]
         
     def set_gyro_range(self,r:int):
@@ -87,34 +104,236 @@ class MPU6050(NosI2CDevice):
         * r (`int`): 0-3
         """
         if r not in range(4): raise self.RANGE_ERROR
-        self.write_reg(self.RW_ACCEL_CONFIG,r<<3)
+        self.update_reg(self.RW_GYRO_CONFIG,0x18,r<<3)
         self.gyro_lsb = [131,65.5,32.8,16.4][r]
     
-    def __xyz(self,d,divisor=1):
-        x=int.from_bytes(d[0:2],'big')
-        y=int.from_bytes(d[2:4],'big')
-        z=int.from_bytes(d[4:6],'big')
+    def __decode(self,b,o,buf):
+        """ big endian int16 words from b[o:] into buf """
+        for i in range(self.RAW_LEN):
+            v=b[o]<<8|b[o+1]
+            buf[i]=v-0x10000 if v&0x8000 else v
+            o+=2
+    
+    def read_raw_into(self,buf):
+        """ reads one frame of raw counts. no allocation
+        * buf (`array`): array('h') of RAW_LEN. ax,ay,az,temp,wx,wy,wz
+        """
+        b=self.__frame
+        self.read_reg_into(self.R_ACCEL_XOUT_H,b)
+        self.__decode(b,0,buf)
+    
+    def read_into(self,buf):
+        """ reads one frame in g, °C and °/s. ports that box floats still
+        pay for the temporaries, read_raw_into is fully allocation free
+        * buf (`array`): array('f') of RAW_LEN. ax,ay,az,temp,wx,wy,wz
+        """
+        r=self.__raw
+        self.read_raw_into(r)
+        self.__scale(r,buf)
+    
+    def __scale(self,r,buf):
+        """ raw counts to g, °C and °/s with bias removed """
+        a=self.accel_lsb
+        g=self.gyro_lsb
+        b=self.bias
+        buf[0]=r[0]/a-b[0]
+        buf[1]=r[1]/a-b[1]
+        buf[2]=r[2]/a-b[2]
+        buf[3]=r[3]/340+36.53
+        buf[4]=r[4]/g-b[4]
+        buf[5]=r[5]/g-b[5]
+        buf[6]=r[6]/g-b[6]
+    
+    def __cal_key(self):
+        if self.channel==None: return "cal_%02x" % self.addr
+        return "cal_%02x_%d" % (self.addr,self.channel)
+    
+    def calibrate(self,n=200,save=True):
+        """ estimates accel and gyro bias from n frames. keep the board still, z up.
+        read_raw_into stays uncorrected, read_into and friends subtract the bias
+        * n    (`int`) : frames to average
+        * save (`bool`): store the bias on flash for the next init
+        """
+        r=self.__raw
+        acc=[0]*self.RAW_LEN
+        for _ in range(n):
+            self.read_raw_into(r)
+            for i in range(self.RAW_LEN): acc[i]+=r[i]
+            time.sleep(0.002)
+        b=self.bias
+        for i in (0,1,2): b[i]=acc[i]/n/self.accel_lsb
+        for i in (4,5,6): b[i]=acc[i]/n/self.gyro_lsb
+        b[2]-=1     # gravity
+        self.calibrated=True
+        if save: store.save(self.__cal_key(),'<7f',*b)
+    
+    def load_bias(self):
+        """ loads the bias saved by calibrate. returns true if found """
+        v=store.load(self.__cal_key(),'<7f')
+        if v==None: return False
+        for i in range(self.RAW_LEN): self.bias[i]=v[i]
+        return True
+    
+    def fifo_start(self,rate=1000,nframes=32,dlpf=1):
+        """ streams accel,temp,gyro frames into the sensor fifo
+        * rate    (`int`): sample rate in Hz. 1kHz/(1+div), 8kHz/(1+div) if dlpf is 0
+        * nframes (`int`): most frames drained by one fifo_read
+        * dlpf    (`int`): RW_CONFIG DLPF_CFG 0-6
+        """
+        base=8000 if dlpf==0 else 1000
+        div=base//rate-1
+        if div not in range(256) or dlpf not in range(7): raise self.RANGE_ERROR
+        self.fifo_period_us=(div+1)*1000000//base
+        
+        # preallocated drain block and per frame timestamps
+        self.fifo_frames=nframes
+        self.fifo_block=bytearray(nframes*self.FRAME_LEN)
+        self.__fifo_mv=memoryview(self.fifo_block)
+        self.fifo_ts=array('i',[0]*nframes)
+        self.fifo_overflows=0
+        
+        self.update_reg(self.RW_CONFIG,0x07,dlpf)
+        self.write_reg(self.RW_SMPLRT_DIV,div)
+        self.write_reg(self.RW_FIFO_EN,0xf8)        # temp,xg,yg,zg,accel
+        self.update_reg(self.RW_INT_ENABLE,0x10,0x10)   # FIFO_OFLOW_EN
+        self.fifo_reset()
+        
+    def fifo_stop(self):
+        """ stops filling the fifo """
+        self.write_reg(self.RW_FIFO_EN,0)
+        self.update_reg(self.RW_USER_CTRL,0x40,0)
+        self.update_reg(self.RW_INT_ENABLE,0x10,0)
+        
+    def fifo_reset(self):
+        """ empties the fifo and restarts the sample clock """
+        c=self.read_shadow(self.RW_USER_CTRL)&~0x44
+        # FIFO_RESET clears itself so it stays out of the shadow
+        self.i2c.write_reg(self.addr,self.RW_USER_CTRL,bytes((c|0x04,)))
+        self.write_reg(self.RW_USER_CTRL,c|0x40)    # FIFO_EN
+        self.__fifo_t=time.ticks_us()
+        
+    def fifo_read(self):
+        """ drains whole frames in one burst into fifo_block. returns count.
+        fifo_ts gets each frame's ticks_us derived from the configured rate.
+        an overflow resets the fifo, bumps fifo_overflows and returns 0. it is
+        seen by FIFO_OFLOW_INT in INT_STATUS, a full count only catches it while
+        the fifo hasn't wrapped. reading INT_STATUS clears it
+        """
+        st=self.__st
+        self.read_reg_into(self.R_INT_STATUS,st)
+        c=self.__cnt
+        self.read_reg_into(self.R_FIFO_COUNT_H,c)
+        n=c[0]<<8|c[1]
+        if st[0]&0x10 or n>=self.FIFO_SIZE:
+            self.fifo_overflows+=1
+            self.fifo_reset()
+            return 0
+        
+        n=min(n//self.FRAME_LEN,self.fifo_frames)
+        if n==0: return 0
+        self.read_reg_into(self.RW_FIFO_R_W,self.__fifo_mv[:n*self.FRAME_LEN])
+        
+        t=self.__fifo_t
+        p=self.fifo_period_us
+        ts=self.fifo_ts
+        for i in range(n):
+            t=time.ticks_add(t,p)
+            ts[i]=t
+        self.__fifo_t=t
+        return n
+    
+    def fifo_raw_into(self,i,buf):
+        """ raw counts of frame i from the last fifo_read
+        * i   (`int`)  : frame index
+        * buf (`array`): array('h') of RAW_LEN
+        """
+        self.__decode(self.fifo_block,i*self.FRAME_LEN,buf)
+        
+    def fifo_into(self,i,buf):
+        """ frame i from the last fifo_read in g, °C and °/s
+        * i   (`int`)  : frame index
+        * buf (`array`): array('f') of RAW_LEN
+        """
+        r=self.__raw
+        self.fifo_raw_into(i,r)
+        self.__scale(r,buf)
+        
+    def irq_start(self,pin,callback=None,late_us=1000):
+        """ samples on the DATA_RDY interrupt instead of sleep polling. the isr
+        only stamps and latches, the read runs via micropython.schedule. with no
+        callback, await irq_wait() from an asyncio task instead
+        * pin      (`int`)     : mcu pin wired to INT
+        * callback (`callable`): callback(raw,t_us). raw is irq_raw, t_us the isr ticks_us
+        * late_us  (`int`)     : reads starting later than this after the isr count as late
+        """
+        if type(pin)!=Pin: pin=Pin(pin,Pin.IN)
+        self.irq_raw=array('h',[0]*self.RAW_LEN)
+        self.irq_t=0
+        self.irq_missed=0
+        self.irq_late=0
+        self.irq_late_us=late_us
+        self.__irq_pin=pin
+        self.__irq_cb=callback
+        self.__irq_pending=False
+        self.__irq_read_ref=self.__irq_read     # bound once, the isr can't allocate
+        self.__irq_flag=None
+        if callback==None:
+            try: import asyncio
+            except ImportError: import uasyncio as asyncio  #type: ignore
+            self.__irq_flag=asyncio.ThreadSafeFlag()
+        
+        self.write_reg(self.RW_INT_PIN_CFG,0x10)    # active high, 50us pulse, cleared by any read
+        self.update_reg(self.RW_INT_ENABLE,0x01,0x01)   # DATA_RDY_EN
+        pin.irq(handler=self.__isr,trigger=Pin.IRQ_RISING,hard=True)
+        
+    def irq_stop(self):
+        """ disables DATA_RDY sampling """
+        self.__irq_pin.irq(handler=None)
+        self.update_reg(self.RW_INT_ENABLE,0x01,0)
+        
+    def __isr(self,pin):
+        t=time.ticks_us()
+        if self.__irq_pending:
+            self.irq_missed+=1
+            return
+        self.irq_t=t
+        self.__irq_pending=True
+        if self.__irq_flag: 
+            self.__irq_flag.set()
+            return
+        try: micropython.schedule(self.__irq_read_ref,None)
+        except RuntimeError:                        # schedule queue full
+            self.__irq_pending=False
+            self.irq_missed+=1
+            
+    def __irq_take(self):
+        """ reads the latched frame into irq_raw. returns its isr ticks_us """
+        t=self.irq_t
+        if time.ticks_diff(time.ticks_us(),t)>self.irq_late_us: self.irq_late+=1
+        self.read_raw_into(self.irq_raw)
+        self.__irq_pending=False
+        return t
+        
+    def __irq_read(self,_):
+        t=self.__irq_take()
+        self.__irq_cb(self.irq_raw,t)
         
-        if x>=0x8000: x+=-0xffff-1
-        if y>=0x8000: y+=-0xffff-1
-        if z>=0x8000: z+=-0xffff-1
+    async def irq_wait(self):
+        """ waits for the next DATA_RDY frame. returns its isr ticks_us, frame in irq_raw """
+        await self.__irq_flag.wait()
+        return self.__irq_take()
         
-        return x/divisor,y/divisor,z/divisor
     def get_data(self):
         """ Gets all data and parses into dict """
-        data = self.read_reg(self.R_ACCEL_XOUT_H,14)
+        f=self.__f
+        self.read_into(f)
         t1 = time.ticks_us()
-        dt = (t1-self.__t0)/1000000
+        dt = time.ticks_diff(t1,self.__t0)/1000000
         self.__t0 = t1
         
-        # temperature 
-        t = int.from_bytes(data[6:8],'big')
-        if t>=0x8000: t+=-0xffff-1
-        c=t/340+36.53
-        
         # accel and gyro. units: g(9.8m/s^2) and º/s
-        ax,ay,az = self.__xyz(data[0:6],self.accel_lsb)
-        wx,wy,wz = self.__xyz(data[8:14],self.gyro_lsb)
+        ax,ay,az = f[0],f[1],f[2]
+        wx,wy,wz = f[4],f[5],f[6]
         
         # angle without accounting gravity
         # rx=degrees(atan2(ay,az))
@@ -126,30 +345,72 @@ class MPU6050(NosI2CDevice):
         # ry=degrees(-atan2(ax,sqrt(ay*ay+az*az)))
         # self.__rz+=gz*dt
         
-        # angles with some filtering. basic complimentary. with gravity. 
-        self.__c = 0.80
-        rx = degrees(atan2(ay,sqrt(ax**2+az**2)))
-        ry = degrees(atan2(-ax,sqrt(ay**2+az**2)))
-        self.__rg[0]+=wx*dt
-        self.__rg[1]+=wy*dt
-        self.__rg[2]+=wz*dt
-        
-        self.__rg[0]=self.__c * (self.__rg[0] - self.__drift[0]) + (1-self.__c) * rx
-        self.__rg[1]=self.__c * (self.__rg[1] - self.__drift[1]) + (1-self.__c) * ry
-        self.__rg[2]=self.__rg[2] - 0.18
+        # quaternion filter when one is attached
+        if self.fusion:
+            self.fusion.update_mpu6050(f,dt)
+            e=self.fusion.get_euler()
+            rx,ry,rz=e[0],e[1],e[2]
+        else:
+            rx,ry,rz=self.__complementary(ax,ay,az,wx,wy,wz,dt)
         
         res = {
             'acceleration'      : {'x':ax,'y':ay,'z':az},
             'angular_velocity'  : {'x':wx,'y':wy,'z':wz},
-            'angle'             : {'x':self.__rg[0],'y':self.__rg[1],'z':self.__rg[2]}
+            'angle'             : {'x':rx,'y':ry,'z':rz}
         }
         return res
     
+    def __complementary(self,ax,ay,az,wx,wy,wz,dt):
+        """ angles with some filtering. basic complimentary. with gravity. """
+        self.__c = 0.80
+        rx = degrees(atan2(ay,sqrt(ax*ax+az*az)))
+        ry = degrees(atan2(-ax,sqrt(ay*ay+az*az)))
+        self.__rg[0]+=wx*dt
+        self.__rg[1]+=wy*dt
+        self.__rg[2]+=wz*dt
+        
+        self.__rg[0]=self.__c * self.__rg[0] + (1-self.__c) * rx
+        self.__rg[1]=self.__c * self.__rg[1] + (1-self.__c) * ry
+        self.__rg[2]=self.__rg[2] - 0.18
+        return self.__rg[0],self.__rg[1],self.__rg[2]
+    
     
 if __name__ == "__main__":
     from nos.util.i2c import NosI2C
+    from nos.util.bench import report
     i2c=NosI2C(scl=5,sda=4)
+    print("i2c%s @%dHz" % (i2c.id,i2c.negotiate([(0x68,MPU6050.R_WHO_AM_I,1)])))
     mpu=MPU6050(0x68,i2c=i2c)
+    if not mpu.calibrated: mpu.calibrate()
+    
+    # heap bytes per sample. dict api vs preallocated paths
+    raw=array('h',[0]*MPU6050.RAW_LEN)
+    buf=array('f',[0]*MPU6050.RAW_LEN)
+    report("get_data",mpu.get_data)
+    report("read_into",lambda:mpu.read_into(buf))
+    report("read_raw_into",lambda:mpu.read_raw_into(raw))
+    
+    # bus time per sample
+    i2c.instrument()
+    for _ in range(100): mpu.read_raw_into(raw)
+    i2c.stats.show()
+    i2c.instrument(False)
+    
+    # fifo at 1kHz. one burst per loop
+    # mpu.fifo_start(1000)
+    # while True:
+    #     time.sleep(0.02)
+    #     for i in range(mpu.fifo_read()):
+    #         mpu.fifo_into(i,buf)
+    #         print(mpu.fifo_ts[i],buf[4],buf[5],buf[6])
+    
+    # data ready interrupt on gp6. default rate is 1kHz/(1+RW_SMPLRT_DIV)
+    # mpu.irq_start(6,lambda raw,t: print(t,raw[4],raw[5],raw[6]))
+    
+    # madgwick instead of the builtin complimentary filter
+    # from nos.sensors.fusion import Madgwick
+    # mpu.fusion=Madgwick(beta=0.1)
+    
     while True:
         time.sleep(0.1)
         d=mpu.get_data()
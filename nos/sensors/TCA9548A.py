@@ -6,21 +6,154 @@
 #   * rpi pico v2
 #===================================================================
 from nos.util.i2c import NosI2CDevice
+from array import array
+import time
 
 class TCA9548A(NosI2CDevice):
     DEF_ADDR = 0x70
-    def set_channels(self,b):
-        """ sets the multiplexor channel
-        * b (`int`): 8 bit. each channel represents a bit.
+    class CHANNEL_ERROR(Exception):pass
+    def init(self):
+        self.mask=None      # cached channel mask. None until first set or read
+        self.shared=False   # mask opens several channels on purpose. see TCA9548APoller
+        self.switches=0     # mux writes so far
+        
+    def set_channels(self,b,force=False):
+        """ sets the multiplexor channel. skipped when already set
+        * b     (`int`) : 8 bit. each channel represents a bit.
+        * force (`bool`): write even if the cached mask matches
         """
         if b>0xff: b=0xff
+        self.shared=False
+        if b==self.mask and not force: return
         self.i2c.writeto(self.addr,b.to_bytes(1,'big'))
+        self.mask=b
+        self.switches+=1
     def get_channels(self):
-        """ gets channel status """
-        res = self.i2c.readfrom(self.addr,1)
-        return res.hex()
+        """ gets channel mask as int. cached after the first read """
+        if self.mask==None: self.mask=self.read_channels()
+        return self.mask
     channels=property(get_channels,set_channels)
     
+    def read_channels(self):
+        """ reads the channel mask from the device """
+        return self.i2c.readfrom(self.addr,1)[0]
+    
+    def select(self,ch):
+        """ opens only channel ch
+        * ch (`int`): 0-7
+        """
+        if ch not in range(8): raise self.CHANNEL_ERROR(ch)
+        self.set_channels(1<<ch)
+        
+    def bus(self,ch):
+        """ i2c proxy bound to channel ch. pass it as i2c to any NosI2CDevice
+        * ch (`int`): 0-7
+        """
+        return TCA9548AChannel(self,ch)
+
+class TCA9548AChannel:
+    def __init__(self,mux,ch):
+        """ the bus behind one mux channel. selects it before every transaction,
+        which costs nothing while it is already selected
+        * mux (`TCA9548A`): multiplexor
+        * ch  (`int`)     : channel 0-7
+        """
+        if ch not in range(8): raise TCA9548A.CHANNEL_ERROR(ch)
+        self.mux=mux
+        self.channel=ch
+        self.bit=1<<ch
+        self.i2c=mux.i2c
+        
+    def select(self):
+        m=self.mux
+        if m.mask!=self.bit and not (m.shared and m.mask&self.bit):
+            m.set_channels(self.bit)
+    
+    def readfrom_mem(self,addr,reg,nbytes):
+        self.select()
+        return self.i2c.readfrom_mem(addr,reg,nbytes)
+    def readfrom_mem_into(self,addr,reg,buf):
+        self.select()
+        self.i2c.readfrom_mem_into(addr,reg,buf)
+    def writeto_mem(self,addr,reg,data):
+        self.select()
+        self.i2c.writeto_mem(addr,reg,data)
+    def readfrom(self,addr,nbytes):
+        self.select()
+        return self.i2c.readfrom(addr,nbytes)
+    def readfrom_into(self,addr,buf):
+        self.select()
+        self.i2c.readfrom_into(addr,buf)
+    def writeto(self,addr,data):
+        self.select()
+        return self.i2c.writeto(addr,data)
+    def read_reg(self,addr,reg,nbytes=1):
+        return self.readfrom_mem(addr,reg,nbytes)
+    def read_reg_into(self,addr,reg,buf):
+        self.readfrom_mem_into(addr,reg,buf)
+    def write_reg(self,addr,reg,data):
+        self.writeto_mem(addr,reg,data)
+    def scan(self):
+        """ Prints detected addresses on this channel """
+        self.select()
+        return self.i2c.scan()
+
+class TCA9548APoller:
+    def __init__(self,mux,devices):
+        """ reads many devices behind one mux in a single round. channels whose
+        devices have distinct addresses are opened together, and the groups are
+        walked in alternating direction so a round starts on the channel the
+        last one ended on
+        * mux     (`TCA9548A`): multiplexor
+        * devices (`list`)    : drivers with read_raw_into and RAW_LEN, built on mux.bus().
+        a device without a channel sits on the main bus and is read without
+        switching the mux
+        """
+        self.mux=mux
+        self.devices=devices
+        self.raw=[array('h',[0]*d.RAW_LEN) for d in devices]    # per device raw counts
+        self.ts=array('i',[0]*len(devices))                     # per device ticks_us
+        self.rounds=0
+        
+        # greedy channel groups with unique addresses. [mask, addrs, device idx]
+        chans={}
+        main=[]
+        for i,d in enumerate(devices):
+            ch=getattr(d,'channel',None)
+            if ch==None: main.append(i)
+            elif ch in range(8): chans.setdefault(ch,[]).append(i)
+            else: raise TCA9548A.CHANNEL_ERROR(ch)
+        groups=[]
+        for ch in sorted(chans):
+            addrs=[devices[i].addr for i in chans[ch]]
+            if not groups or any(a in groups[-1][1] for a in addrs):
+                groups.append([0,[],[]])
+            g=groups[-1]
+            g[0]|=1<<ch
+            g[1]+=addrs
+            g[2]+=chans[ch]
+        self.groups=[(g[0],tuple(g[2])) for g in groups]
+        if main: self.groups.append((None,tuple(main)))   # any mask will do
+        
+    def poll(self):
+        """ reads every device once. raw counts in self.raw, stamps in self.ts """
+        mux=self.mux
+        groups=self.groups
+        devices=self.devices
+        raw=self.raw
+        ts=self.ts
+        n=len(groups)
+        rev=self.rounds&1
+        for k in range(n):
+            mask,idx=groups[n-1-k if rev else k]
+            if mask!=None:
+                mux.set_channels(mask)
+                mux.shared=True
+            for i in idx:
+                devices[i].read_raw_into(raw[i])
+                ts[i]=time.ticks_us()
+        mux.shared=False
+        self.rounds+=1
 
 if __name__ == "__main__":
     from nos.util.i2c import NosI2C
@@ -30,4 +163,12 @@ if __name__ == "__main__":
     tca.channels = 0x3
     i2c.scan()
     
+    # one mpu6050 at 0x68 per channel
+    # from nos.sensors.MPU6050 import MPU6050
+    # mpus=[MPU6050(0x68,i2c=tca.bus(ch)) for ch in range(8)]
+    # poller=TCA9548APoller(tca,mpus)
+    # while True:
+    #     poller.poll()
+    #     print(poller.ts[0],poller.raw[0][4],tca.switches)
+    
     
@@ -6,7 +6,9 @@
 #   * rpi pico v2
 #===================================================================
 from nos.util.i2c import NosI2CDevice
+import nos.util.store as store
 from math import atan2, radians as rad, floor
+from array import array
 import time
 
 class WT901(NosI2CDevice):
@@ -78,9 +80,96 @@ class WT901(NosI2CDevice):
     R_Q1        = 0x52
     R_Q2        = 0x53
     R_Q3        = 0x54
+    R_KEY       = 0x69
+    
+    KEY_UNLOCK  = 0xb588
+    RAW_LEN     = 12    # ax,ay,az,wx,wy,wz,hx,hy,hz,roll,pitch,yaw
+    SCALES      = (16/32768,2000/32768,1,180/32768)
+    
+    # name: (first register, registers, int32 pairs, scale). for plan()
+    FIELDS = {
+        'time'              : (R_YYMM,4,False,1),           # yymm,ddhh,mmss,ms
+        'acceleration'      : (R_AX,3,False,16/32768),      # g
+        'angular_velocity'  : (R_GX,3,False,2000/32768),    # °/s
+        'magnetic'          : (R_HX,3,False,1),
+        'angle'             : (R_Roll,3,False,180/32768),   # °
+        'temperature'       : (R_TEMP,1,False,1/100),       # °C
+        'port'              : (R_D0Status,4,False,1),
+        'pressure'          : (R_PressureL,2,True,1),       # Pa
+        'height'            : (R_HeightL,2,True,1),         # cm
+        'gps'               : (R_LonL,4,True,1),            # lon,lat. ddmm.mmmmm*1e5
+        'gps_height'        : (R_GPSHeight,1,False,1/10),   # m
+        'gps_yaw'           : (R_GPSYAW,1,False,1/10),      # °
+        'gps_velocity'      : (R_GPSVL,2,True,1/1000),      # km/h
+        'quaternion'        : (R_Q0,4,False,1/32768),
+    }
     
     class UNIT_EXCEPTION(Exception):pass
     class RANGE_ERROR(Exception):pass
+    class FIELD_ERROR(Exception):pass
+    
+    def init(self):
+        """ preallocates read buffers and restores saved offsets """
+        self.__raw = array('h',[0]*self.RAW_LEN)
+        self.__f = array('f',[0]*self.RAW_LEN)
+        self.offsets = array('h',[0]*6)     # ax,ay,az,gx,gy,gz in raw counts
+        self.calibrated = self.load_offsets()
+    
+    def write_reg(self,reg,data):
+        """ writes one 16 bit register. little endian """
+        self.i2c.write_reg(self.addr,reg,(data&0xffff).to_bytes(2,'little'))
+        
+    def __cal_key(self):
+        if self.channel==None: return "cal_%02x" % self.addr
+        return "cal_%02x_%d" % (self.addr,self.channel)
+    
+    def read_offsets(self):
+        """ reads R_AXOFFSET..R_GZOFFSET into self.offsets """
+        self.read_reg_into(self.R_AXOFFSET,self.offsets)
+        return self.offsets
+    
+    def write_offsets(self,save=True):
+        """ writes self.offsets to R_AXOFFSET..R_GZOFFSET
+        * save (`bool`): R_SAVE them to the sensor's own flash too
+        """
+        self.write_reg(self.R_KEY,self.KEY_UNLOCK)
+        time.sleep(0.01)
+        for i in range(6):
+            self.write_reg(self.R_AXOFFSET+i,self.offsets[i])
+            time.sleep(0.01)
+        if save: self.write_reg(self.R_SAVE,0)
+    
+    def calibrate(self,n=100,save=True):
+        """ estimates accel and gyro offsets from n frames and writes them to
+        the offset registers. keep the board still, z up
+        * n    (`int`) : frames to average
+        * save (`bool`): R_SAVE them and store them on flash for the next init
+        """
+        self.read_offsets()
+        r=self.__raw
+        acc=[0]*6
+        for _ in range(n):
+            self.read_raw_into(r)
+            for i in range(6): acc[i]+=r[i]
+            time.sleep(0.01)
+        acc[2]-=n*round(1/self.SCALES[0])   # gravity
+        o=self.offsets
+        for i in range(6): o[i]+=round(acc[i]/n)
+        self.write_offsets(save)
+        self.calibrated=True
+        if save: store.save(self.__cal_key(),'<6h',*o)
+    
+    def load_offsets(self):
+        """ restores the offsets saved by calibrate. only writes the registers
+        when the sensor lost them. returns true if found
+        """
+        v=store.load(self.__cal_key(),'<6h')
+        if v==None: return False
+        o=self.read_offsets()
+        if tuple(o)!=v:
+            for i in range(6): o[i]=v[i]
+            self.write_offsets()
+        return True
     
     def __xyz(self,d,scalar=1):
         """ takes 6 bytes and splits by 2. little endian """
@@ -110,28 +199,140 @@ class WT901(NosI2CDevice):
     def get_magnetic(self):
         return self.__xyz(self.read_reg(self.R_HX,6))
     
+    def read_raw_into(self,buf):
+        """ reads R_AX..R_Yaw as raw counts. no allocation. registers are
+        little endian int16 so they land in the array as is (rp2, esp32)
+        * buf (`array`): array('h') of RAW_LEN. ax,ay,az,wx,wy,wz,hx,hy,hz,roll,pitch,yaw
+        """
+        self.read_reg_into(self.R_AX,buf)
+    
+    def read_into(self,buf):
+        """ reads R_AX..R_Yaw in g, °/s, magnetic units and °
+        * buf (`array`): array('f') of RAW_LEN. ax,ay,az,wx,wy,wz,hx,hy,hz,roll,pitch,yaw
+        """
+        r=self.__raw
+        s=self.SCALES
+        self.read_raw_into(r)
+        for i in range(self.RAW_LEN):
+            buf[i]=r[i]*s[i//3]
+    
+    def plan(self,*fields,gap=2):
+        """ plans the fewest register bursts covering fields. build once, poll often
+        * fields (`str`): names from FIELDS
+        * gap    (`int`): merge ranges at most this many registers apart. a new
+        transaction costs about as much as 2 extra registers
+        """
+        return WT901Plan(self,fields,gap)
+    
     def get_data(self):
         """ Gets all data and parses into dict """
-        data = self.read_reg(self.R_AX,24)
-        ax,ay,az=self.__xyz(data[0:6],16/32768)
-        wx,wy,wz=self.__xyz(data[6:12],2000/32768)
-        mx,my,mz=self.__xyz(data[12:18])
-        rx,ry,rz=self.__xyz(data[18:24],180/32768)
+        f=self.__f
+        self.read_into(f)
         
         d = {
-            'acceleration'      : {'x':ax,'y':ay,'z':az},   # g or 9.8m/s^2
-            'angular_velocity'  : {'x':wx,'y':wy,'z':wz},   # °/s
-            'magnetic'          : {'x':mx,'y':my,'z':mz},   # G or µT
-            'angle'             : {'x':rx,'y':ry,'z':rz}    # °
+            'acceleration'      : {'x':f[0],'y':f[1],'z':f[2]},     # g or 9.8m/s^2
+            'angular_velocity'  : {'x':f[3],'y':f[4],'z':f[5]},     # °/s
+            'magnetic'          : {'x':f[6],'y':f[7],'z':f[8]},     # G or µT
+            'angle'             : {'x':f[9],'y':f[10],'z':f[11]}    # °
         }
         return d
     
+class WT901Plan:
+    def __init__(self,dev,fields,gap=2):
+        """ register read plan for a WT901. see WT901.plan
+        * raw    (`array`): array('h') every poll lands in
+        * bursts (`list`) : (register, memoryview into raw) per transaction
+        """
+        for f in fields:
+            if f not in dev.FIELDS: raise dev.FIELD_ERROR(f)
+        self.dev=dev
+        self.fields=fields
+        
+        # sorted register spans merged across small gaps
+        runs=[]
+        for a,n,_,_ in sorted(dev.FIELDS[f] for f in fields):
+            if runs and a-runs[-1][1]<=gap: runs[-1][1]=max(runs[-1][1],a+n)
+            else: runs.append([a,a+n])
+        
+        self.raw=array('h',[0]*sum(b-a for a,b in runs))
+        mv=memoryview(self.raw)
+        self.bursts=[]
+        self.offsets={}
+        o=0
+        for a,b in runs:
+            self.bursts.append((a,mv[o:o+b-a]))
+            for f in fields:
+                reg=dev.FIELDS[f][0]
+                if a<=reg<b: self.offsets[f]=o+reg-a
+            o+=b-a
+        self.nbytes=2*o
+    
+    def poll(self):
+        """ runs the plan. results stay raw in self.raw """
+        dev=self.dev
+        for reg,mv in self.bursts:
+            dev.read_reg_into(reg,mv)
+    
+    def field_into(self,name,buf):
+        """ scaled values of a planned field from the last poll. the wide int32
+        fields (gps, pressure, height) don't fit a float32 mantissa, give them
+        array('i') for exact counts when their scale is 1, or array('d')
+        * name (`str`)  : field name
+        * buf  (`array`): array('f'), array('d') or array('i') big enough for the field
+        """
+        _,n,wide,scale=self.dev.FIELDS[name]
+        o=self.offsets[name]
+        r=self.raw
+        if wide:
+            for i in range(n//2):
+                v=(r[o+1]<<16)|(r[o]&0xffff)
+                buf[i]=v if scale==1 else v*scale
+                o+=2
+        else:
+            for i in range(n):
+                buf[i]=r[o+i]*scale
+    
+    def get_data(self):
+        """ polls and parses the planned fields into dict. wide fields with
+        scale 1 come back as ints
+        """
+        buf=array('d',[0]*4)
+        ibuf=array('i',[0]*2)
+        d={}
+        self.poll()
+        for f in self.fields:
+            _,n,wide,scale=self.dev.FIELDS[f]
+            b=buf
+            if wide:
+                n//=2
+                if scale==1: b=ibuf
+            self.field_into(f,b)
+            if n==3: d[f]={'x':b[0],'y':b[1],'z':b[2]}
+            elif n==1: d[f]=b[0]
+            else: d[f]=list(b[:n])
+        return d
+
 if __name__ == "__main__":
     from nos.util.i2c import NosI2C
     from math import degrees,sqrt
     i2c=NosI2C(scl=5,sda=4)
     i2c.scan()
     wt = WT901(0x50,i2c=i2c)
+    if not wt.calibrated: wt.calibrate()
+    
+    # heap bytes per sample. dict api vs preallocated paths
+    from nos.util.bench import report
+    raw=array('h',[0]*WT901.RAW_LEN)
+    buf=array('f',[0]*WT901.RAW_LEN)
+    report("get_data",wt.get_data)
+    report("read_into",lambda:wt.read_into(buf))
+    report("read_raw_into",lambda:wt.read_raw_into(raw))
+    
+    # only angles and quaternion. 2 bursts, 14 bytes instead of 4 getters
+    p=wt.plan('angle','quaternion')
+    print("plan: %d bursts, %d bytes" % (len(p.bursts),p.nbytes))
+    report("plan.poll",p.poll)
+    
     while True:
         time.sleep(0.1)
         data=wt.get_data()
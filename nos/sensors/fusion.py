@@ -0,0 +1,360 @@
+#===================================================================
+# file: fusion.py
+# desc: complementary, madgwick and mahony quaternion filters for
+#       imu data
+# dev : nos
+# mcu :
+#   * rpi pico v2
+#===================================================================
+from math import sqrt, atan2, asin, degrees, sin, cos
+from array import array
+
+DEG2RAD = 0.017453292519943295
+
+class Fusion:
+    def __init__(self,alpha=0.98):
+        """ complementary filter, and the base of the quaternion filters. state
+        lives in preallocated arrays
+        * alpha (`float`): gyro weight per step. roll and pitch are pulled
+        toward the accelerometer by 1-alpha, yaw follows the gyro only
+        * q     (`array`): w,x,y,z
+        * euler (`array`): roll,pitch,yaw in ° after get_euler()
+        """
+        self.alpha=alpha
+        self.q=array('f',[1,0,0,0])
+        self.euler=array('f',[0,0,0])
+
+    def reset(self):
+        q=self.q
+        q[0]=1
+        q[1]=0
+        q[2]=0
+        q[3]=0
+
+    def update(self,gx,gy,gz,ax,ay,az,dt,mx=0,my=0,mz=0):
+        """ one filter step. the complementary filter ignores the magnetometer
+        * gx,gy,gz (`float`): angular velocity in °/s
+        * ax,ay,az (`float`): acceleration, any unit
+        * dt       (`float`): seconds since last update
+        * mx,my,mz (`float`): magnetic field, any unit. all zero for none
+        """
+        q=self.q
+        q0=q[0]
+        q1=q[1]
+        q2=q[2]
+        q3=q[3]
+        h=0.5*dt*DEG2RAD
+        gx*=h
+        gy*=h
+        gz*=h
+        q0,q1,q2,q3=(q0-q1*gx-q2*gy-q3*gz,
+                     q1+q0*gx+q2*gz-q3*gy,
+                     q2+q0*gy-q1*gz+q3*gx,
+                     q3+q0*gz+q1*gy-q2*gx)
+        if ax==0 and ay==0 and az==0:
+            self._store(q0,q1,q2,q3)
+            return
+
+        # gyro attitude as angles, tilt blended with the accelerometer's
+        roll=atan2(2*(q0*q1+q2*q3),q0*q0-q1*q1-q2*q2+q3*q3)
+        s=2*(q0*q2-q3*q1)/(q0*q0+q1*q1+q2*q2+q3*q3)
+        pitch=asin(1 if s>1 else -1 if s<-1 else s)
+        yaw=atan2(2*(q0*q3+q1*q2),q0*q0+q1*q1-q2*q2-q3*q3)
+        k=1-self.alpha
+        d=atan2(ay,az)-roll
+        if d>3.141592653589793: d-=6.283185307179586
+        elif d<-3.141592653589793: d+=6.283185307179586
+        roll+=k*d
+        pitch+=k*(atan2(-ax,sqrt(ay*ay+az*az))-pitch)
+
+        cr=cos(roll*0.5)
+        sr=sin(roll*0.5)
+        cp=cos(pitch*0.5)
+        sp=sin(pitch*0.5)
+        cy=cos(yaw*0.5)
+        sy=sin(yaw*0.5)
+        self._store(cr*cp*cy+sr*sp*sy,
+                    sr*cp*cy-cr*sp*sy,
+                    cr*sp*cy+sr*cp*sy,
+                    cr*cp*sy-sr*sp*cy)
+
+    def update_mpu6050(self,buf,dt):
+        """ update from MPU6050.read_into/fifo_into output """
+        self.update(buf[4],buf[5],buf[6],buf[0],buf[1],buf[2],dt)
+
+    def update_wt901(self,buf,dt,mag=True):
+        """ update from WT901.read_into output
+        * mag (`bool`): use the magnetometer
+        """
+        if mag: self.update(buf[3],buf[4],buf[5],buf[0],buf[1],buf[2],dt,buf[6],buf[7],buf[8])
+        else:   self.update(buf[3],buf[4],buf[5],buf[0],buf[1],buf[2],dt)
+
+    def get_euler(self):
+        """ roll,pitch,yaw in ° written to and returned as self.euler """
+        q=self.q
+        q0=q[0]
+        q1=q[1]
+        q2=q[2]
+        q3=q[3]
+        e=self.euler
+        e[0]=degrees(atan2(2*(q0*q1+q2*q3),1-2*(q1*q1+q2*q2)))
+        s=2*(q0*q2-q3*q1)
+        if s>1: s=1
+        elif s<-1: s=-1
+        e[1]=degrees(asin(s))
+        e[2]=degrees(atan2(2*(q0*q3+q1*q2),1-2*(q2*q2+q3*q3)))
+        return e
+
+    def _store(self,q0,q1,q2,q3):
+        """ normalises and writes back the quaternion """
+        n=sqrt(q0*q0+q1*q1+q2*q2+q3*q3)
+        if n==0: return
+        n=1/n
+        q=self.q
+        q[0]=q0*n
+        q[1]=q1*n
+        q[2]=q2*n
+        q[3]=q3*n
+
+class Madgwick(Fusion):
+    def __init__(self,beta=0.1):
+        """ Madgwick gradient descent filter
+        * beta (`float`): gyro measurement error gain. higher trusts accel/mag more
+        """
+        super().__init__()
+        self.beta=beta
+
+    def update(self,gx,gy,gz,ax,ay,az,dt,mx=0,my=0,mz=0):
+        if mx==0 and my==0 and mz==0:
+            return self.update_imu(gx,gy,gz,ax,ay,az,dt)
+        q=self.q
+        q0=q[0]
+        q1=q[1]
+        q2=q[2]
+        q3=q[3]
+        gx*=DEG2RAD
+        gy*=DEG2RAD
+        gz*=DEG2RAD
+
+        # rate of change from gyro
+        qd0=0.5*(-q1*gx-q2*gy-q3*gz)
+        qd1=0.5*(q0*gx+q2*gz-q3*gy)
+        qd2=0.5*(q0*gy-q1*gz+q3*gx)
+        qd3=0.5*(q0*gz+q1*gy-q2*gx)
+
+        n=sqrt(ax*ax+ay*ay+az*az)
+        if n!=0:
+            n=1/n
+            ax*=n
+            ay*=n
+            az*=n
+            n=1/sqrt(mx*mx+my*my+mz*mz)
+            mx*=n
+            my*=n
+            mz*=n
+
+            _2q0mx=2*q0*mx
+            _2q0my=2*q0*my
+            _2q0mz=2*q0*mz
+            _2q1mx=2*q1*mx
+            _2q0=2*q0
+            _2q1=2*q1
+            _2q2=2*q2
+            _2q3=2*q3
+            _2q0q2=2*q0*q2
+            _2q2q3=2*q2*q3
+            q0q0=q0*q0
+            q0q1=q0*q1
+            q0q2=q0*q2
+            q0q3=q0*q3
+            q1q1=q1*q1
+            q1q2=q1*q2
+            q1q3=q1*q3
+            q2q2=q2*q2
+            q2q3=q2*q3
+            q3q3=q3*q3
+
+            # reference direction of earth's field
+            hx=mx*q0q0-_2q0my*q3+_2q0mz*q2+mx*q1q1+_2q1*my*q2+_2q1*mz*q3-mx*q2q2-mx*q3q3
+            hy=_2q0mx*q3+my*q0q0-_2q0mz*q1+_2q1mx*q2-my*q1q1+my*q2q2+_2q2*mz*q3-my*q3q3
+            _2bx=sqrt(hx*hx+hy*hy)
+            _2bz=-_2q0mx*q2+_2q0my*q1+mz*q0q0+_2q1mx*q3-mz*q1q1+_2q2*my*q3-mz*q2q2+mz*q3q3
+            _4bx=2*_2bx
+            _4bz=2*_2bz
+
+            # gradient descent step
+            fa=2*q1q3-_2q0q2-ax
+            fb=2*q0q1+_2q2q3-ay
+            fc=1-2*q1q1-2*q2q2-az
+            fx=_2bx*(0.5-q2q2-q3q3)+_2bz*(q1q3-q0q2)-mx
+            fy=_2bx*(q1q2-q0q3)+_2bz*(q0q1+q2q3)-my
+            fz=_2bx*(q0q2+q1q3)+_2bz*(0.5-q1q1-q2q2)-mz
+            s0=-_2q2*fa+_2q1*fb-_2bz*q2*fx+(-_2bx*q3+_2bz*q1)*fy+_2bx*q2*fz
+            s1=_2q3*fa+_2q0*fb-4*q1*fc+_2bz*q3*fx+(_2bx*q2+_2bz*q0)*fy+(_2bx*q3-_4bz*q1)*fz
+            s2=-_2q0*fa+_2q3*fb-4*q2*fc+(-_4bx*q2-_2bz*q0)*fx+(_2bx*q1+_2bz*q3)*fy+(_2bx*q0-_4bz*q2)*fz
+            s3=_2q1*fa+_2q2*fb+(-_4bx*q3+_2bz*q1)*fx+(-_2bx*q0+_2bz*q2)*fy+_2bx*q1*fz
+            n=sqrt(s0*s0+s1*s1+s2*s2+s3*s3)
+            if n!=0:
+                n=self.beta/n
+                qd0-=n*s0
+                qd1-=n*s1
+                qd2-=n*s2
+                qd3-=n*s3
+
+        self._store(q0+qd0*dt,q1+qd1*dt,q2+qd2*dt,q3+qd3*dt)
+
+    def update_imu(self,gx,gy,gz,ax,ay,az,dt):
+        """ update without magnetometer. same args as update """
+        q=self.q
+        q0=q[0]
+        q1=q[1]
+        q2=q[2]
+        q3=q[3]
+        gx*=DEG2RAD
+        gy*=DEG2RAD
+        gz*=DEG2RAD
+
+        qd0=0.5*(-q1*gx-q2*gy-q3*gz)
+        qd1=0.5*(q0*gx+q2*gz-q3*gy)
+        qd2=0.5*(q0*gy-q1*gz+q3*gx)
+        qd3=0.5*(q0*gz+q1*gy-q2*gx)
+
+        n=sqrt(ax*ax+ay*ay+az*az)
+        if n!=0:
+            n=1/n
+            ax*=n
+            ay*=n
+            az*=n
+
+            _2q0=2*q0
+            _2q1=2*q1
+            _2q2=2*q2
+            _2q3=2*q3
+            _4q0=4*q0
+            _4q1=4*q1
+            _4q2=4*q2
+            _8q1=8*q1
+            _8q2=8*q2
+            q0q0=q0*q0
+            q1q1=q1*q1
+            q2q2=q2*q2
+            q3q3=q3*q3
+
+            s0=_4q0*q2q2+_2q2*ax+_4q0*q1q1-_2q1*ay
+            s1=_4q1*q3q3-_2q3*ax+4*q0q0*q1-_2q0*ay-_4q1+_8q1*q1q1+_8q1*q2q2+_4q1*az
+            s2=4*q0q0*q2+_2q0*ax+_4q2*q3q3-_2q3*ay-_4q2+_8q2*q1q1+_8q2*q2q2+_4q2*az
+            s3=4*q1q1*q3-_2q1*ax+4*q2q2*q3-_2q2*ay
+            n=sqrt(s0*s0+s1*s1+s2*s2+s3*s3)
+            if n!=0:
+                n=self.beta/n
+                qd0-=n*s0
+                qd1-=n*s1
+                qd2-=n*s2
+                qd3-=n*s3
+
+        self._store(q0+qd0*dt,q1+qd1*dt,q2+qd2*dt,q3+qd3*dt)
+
+class Mahony(Fusion):
+    def __init__(self,kp=1.0,ki=0.0):
+        """ Mahony complementary filter with PI feedback
+        * kp (`float`): proportional gain
+        * ki (`float`): integral gain. 0 disables gyro bias integration
+        """
+        super().__init__()
+        self.kp=kp
+        self.ki=ki
+        self.bias=array('f',[0,0,0])    # integral feedback
+
+    def reset(self):
+        super().reset()
+        b=self.bias
+        b[0]=0
+        b[1]=0
+        b[2]=0
+
+    def update(self,gx,gy,gz,ax,ay,az,dt,mx=0,my=0,mz=0):
+        q=self.q
+        q0=q[0]
+        q1=q[1]
+        q2=q[2]
+        q3=q[3]
+        gx*=DEG2RAD
+        gy*=DEG2RAD
+        gz*=DEG2RAD
+
+        n=sqrt(ax*ax+ay*ay+az*az)
+        if n!=0:
+            n=1/n
+            ax*=n
+            ay*=n
+            az*=n
+
+            # estimated gravity direction, halved
+            vx=q1*q3-q0*q2
+            vy=q0*q1+q2*q3
+            vz=q0*q0-0.5+q3*q3
+            ex=ay*vz-az*vy
+            ey=az*vx-ax*vz
+            ez=ax*vy-ay*vx
+
+            if mx!=0 or my!=0 or mz!=0:
+                n=1/sqrt(mx*mx+my*my+mz*mz)
+                mx*=n
+                my*=n
+                mz*=n
+                q0q0=q0*q0
+                q1q1=q1*q1
+                q2q2=q2*q2
+                q3q3=q3*q3
+                q0q1=q0*q1
+                q0q2=q0*q2
+                q0q3=q0*q3
+                q1q2=q1*q2
+                q1q3=q1*q3
+                q2q3=q2*q3
+
+                # reference direction of earth's field, then estimated, halved
+                hx=2*(mx*(0.5-q2q2-q3q3)+my*(q1q2-q0q3)+mz*(q1q3+q0q2))
+                hy=2*(mx*(q1q2+q0q3)+my*(0.5-q1q1-q3q3)+mz*(q2q3-q0q1))
+                bx=sqrt(hx*hx+hy*hy)
+                bz=2*(mx*(q1q3-q0q2)+my*(q2q3+q0q1)+mz*(0.5-q1q1-q2q2))
+                wx=bx*(0.5-q2q2-q3q3)+bz*(q1q3-q0q2)
+                wy=bx*(q1q2-q0q3)+bz*(q0q1+q2q3)
+                wz=bx*(q0q2+q1q3)+bz*(0.5-q1q1-q2q2)
+                ex+=my*wz-mz*wy
+                ey+=mz*wx-mx*wz
+                ez+=mx*wy-my*wx
+
+            if self.ki>0:
+                b=self.bias
+                k=2*self.ki*dt
+                b[0]+=k*ex
+                b[1]+=k*ey
+                b[2]+=k*ez
+                gx+=b[0]
+                gy+=b[1]
+                gz+=b[2]
+            k=2*self.kp
+            gx+=k*ex
+            gy+=k*ey
+            gz+=k*ez
+
+        gx*=0.5*dt
+        gy*=0.5*dt
+        gz*=0.5*dt
+        self._store(q0-q1*gx-q2*gy-q3*gz,
+                    q1+q0*gx+q2*gz-q3*gy,
+                    q2+q0*gy-q1*gz+q3*gx,
+                    q3+q0*gz+q1*gy-q2*gx)
+
+if __name__ == "__main__":
+    from nos.util.bench import report
+
+    # cost per update. max fusion rate is 1e6/(µs per update)
+    for f in (Fusion(),Madgwick(),Mahony(ki=0.1)):
+        name=type(f).__name__
+        us,_=report(name+" imu",lambda:f.update(1.5,-0.5,0.25,0.01,0.02,0.98,0.001),1000)
+        print("  max rate: %d Hz" % (1000000/us))
+        us,_=report(name+" marg",lambda:f.update(1.5,-0.5,0.25,0.01,0.02,0.98,0.001,0.3,0.1,-0.4),1000)
+        print("  max rate: %d Hz" % (1000000/us))
+        report(name+" get_euler",f.get_euler,1000)
@@ -0,0 +1,282 @@
+#===================================================================
+# file: devices.py
+# desc: register level models of the i2c parts, for the simulated
+#       bus in nos.sim.machine
+# dev : nos
+#===================================================================
+import time
+from array import array
+
+class Device:
+    def __init__(self,addr,size=256):
+        """ an i2c target as a plain register file with auto increment.
+        subclasses refresh registers before a read and react to writes. reads
+        copy byte by byte so the model doesn't allocate on the hot path
+        * addr (`int`): 7 bit address
+        * size (`int`): register file bytes
+        """
+        self.addr=addr
+        self.regs=bytearray(size)
+        self.ptr=0          # register pointer for reads without a register
+        self.reads=0
+        self.writes=0
+
+    def read(self,reg,buf):
+        """ fills buf with the registers from reg on
+        * reg (`int`)       : first register
+        * buf (`memoryview`): byte view to fill
+        """
+        self.reads+=1
+        r=self.regs
+        m=len(r)
+        for i in range(len(buf)):
+            buf[i]=r[reg+i] if reg+i<m else 0
+        self.ptr=reg+len(buf)
+
+    def write(self,reg,data):
+        """ stores data from reg on
+        * reg  (`int`)  : first register
+        * data (`bytes`): values
+        """
+        self.writes+=1
+        self.regs[reg:reg+len(data)]=data
+        self.ptr=reg+len(data)
+
+    def readfrom(self,buf):
+        """ read without a register, from the pointer """
+        self.read(self.ptr,buf)
+
+    def writeto(self,data):
+        """ write without a register. the first byte sets the pointer """
+        if len(data)==0: return
+        if len(data)==1: self.ptr=data[0]
+        else: self.write(data[0],data[1:])
+
+class Rand:
+    def __init__(self,seed=1):
+        """ xorshift32. repeatable noise without the random module """
+        self.s=seed or 1
+
+    def next(self):
+        s=self.s
+        s^=s<<13&0xffffffff
+        s^=s>>17
+        s^=s<<5&0xffffffff
+        self.s=s
+        return s
+
+    def noise(self,amp):
+        """ int in -amp..amp """
+        if amp<=0: return 0
+        return self.next()%(2*amp+1)-amp
+
+class MPU6050(Device):
+    ACCEL_LSB   = (16384,8192,4096,2048)
+    GYRO_LSB    = (131,65.5,32.8,16.4)
+
+    def __init__(self,addr=0x68,seed=1):
+        """ accel, temp and gyro registers, sample rate divider and the fifo.
+        samples are what move() set plus up to noise counts of noise. the fifo
+        fills at the configured rate from the time it was enabled
+        * addr (`int`): 0x68 or 0x69
+        * seed (`int`): noise seed
+        """
+        super().__init__(addr,128)
+        self.regs[117]=0x68     # WHO_AM_I
+        self.regs[107]=0x40     # asleep after power on
+        self.noise=4
+        self.rand=Rand(seed)
+        self.fifo=0             # bytes waiting
+        self.overflows=0
+        self.samples=0
+        self.__base=array('i',[0]*7)    # counts before noise
+        self.__f=bytearray(14)
+        self.__t=time.ticks_us()
+        self.__carry=0
+        self.move((0,0,1),(0,0,0),25)
+
+    def move(self,accel=None,gyro=None,temp=None):
+        """ sets what the part senses
+        * accel (`tuple`) : x,y,z in g
+        * gyro  (`tuple`) : x,y,z in °/s
+        * temp  (`number`): °C
+        """
+        if accel!=None: self.accel=tuple(accel)
+        if gyro!=None: self.gyro=tuple(gyro)
+        if temp!=None: self.temp=temp
+        r=self.regs
+        a=self.ACCEL_LSB[r[28]>>3&3]
+        g=self.GYRO_LSB[r[27]>>3&3]
+        b=self.__base
+        for i in range(3):
+            b[i]=int(self.accel[i]*a)
+            b[4+i]=int(self.gyro[i]*g)
+        b[3]=int((self.temp-36.53)*340)
+
+    def period_us(self):
+        """ sample period from SMPLRT_DIV and DLPF_CFG """
+        cfg=self.regs[26]&7
+        base=8000 if cfg in (0,7) else 1000
+        return (self.regs[25]+1)*1000000//base
+
+    def __fifo_on(self):
+        return self.regs[106]&0x40 and self.regs[35]&0xf8==0xf8
+
+    def __accrue(self):
+        """ adds the frames sampled since the last look """
+        now=time.ticks_us()
+        dt=time.ticks_diff(now,self.__t)+self.__carry
+        self.__t=now
+        p=self.period_us()
+        n=dt//p
+        self.__carry=dt-n*p
+        if not self.__fifo_on() or n==0: return
+        self.fifo+=n*14
+        if self.fifo>=1024:
+            self.fifo=1024
+            self.overflows+=1
+            self.regs[58]|=0x10                     # FIFO_OFLOW_INT
+
+    def __sample(self,b,o):
+        """ one big endian frame at b[o:] """
+        base=self.__base
+        nz=self.noise
+        rnd=self.rand
+        for i in range(7):
+            x=base[i]+(0 if i==3 else rnd.noise(nz))
+            x=(32767 if x>32767 else -32768 if x<-32768 else x)&0xffff
+            b[o]=x>>8
+            b[o+1]=x&0xff
+            o+=2
+        self.samples+=1
+
+    def read(self,reg,buf):
+        e=reg+len(buf)
+        if reg==116:        # FIFO_R_W doesn't auto increment
+            self.reads+=1
+            self.__accrue()
+            n=min(len(buf),self.fifo)
+            f=self.__f
+            for o in range(0,n,14):
+                self.__sample(f,0)
+                for i in range(min(14,n-o)): buf[o+i]=f[i]
+            for i in range(n,len(buf)): buf[i]=0
+            self.fifo-=n
+            return
+        if reg<=72 and e>59: self.__sample(self.regs,59)
+        if reg<=115 and e>114:
+            self.__accrue()
+            self.regs[114]=self.fifo>>8
+            self.regs[115]=self.fifo&0xff
+        if reg<=58 and e>58: self.regs[58]|=0x01    # DATA_RDY
+        super().read(reg,buf)
+        if reg<=58 and e>58: self.regs[58]=0        # INT_STATUS clears on read
+
+    def write(self,reg,data):
+        super().write(reg,data)
+        e=reg+len(data)
+        if reg<=28 and e>27: self.move()            # new full scale
+        if reg<=106<e and self.regs[106]&0x04:
+            self.regs[106]&=~0x04                   # FIFO_RESET clears itself
+            self.__accrue()
+            self.fifo=0
+        if reg<=107<e and self.regs[107]&0x80:
+            self.__init__(self.addr,self.rand.s)    # DEVICE_RESET
+
+class WT901(Device):
+    def __init__(self,addr=0x50):
+        """ 16 bit little endian registers addressed by index, so register r is
+        at byte 2r. writes need R_KEY unlocked first, offsets are subtracted
+        from accel and gyro
+        * addr (`int`): i2c address
+        """
+        super().__init__(addr,256)
+        self.unlocked=False
+        self.saves=0
+        self.__set(0x51,(32767,0,0,0))  # quaternion
+        self.move((0,0,1),(0,0,0),(0,0,0),(200,-100,400),25)
+
+    def word(self,r):
+        """ register r as int16 """
+        v=self.regs[r*2]|self.regs[r*2+1]<<8
+        return v-0x10000 if v&0x8000 else v
+
+    def __set(self,r,vals):
+        for v in vals:
+            v=max(-32768,min(32767,int(v)))&0xffff
+            self.regs[r*2]=v&0xff
+            self.regs[r*2+1]=v>>8
+            r+=1
+
+    def move(self,accel=None,gyro=None,angle=None,mag=None,temp=None):
+        """ sets what the part senses. registers are rebuilt here, not per read
+        * accel (`tuple`) : x,y,z in g
+        * gyro  (`tuple`) : x,y,z in °/s
+        * angle (`tuple`) : roll,pitch,yaw in °
+        * mag   (`tuple`) : x,y,z raw
+        * temp  (`number`): °C
+        """
+        if accel!=None: self.accel=tuple(accel)
+        if gyro!=None: self.gyro=tuple(gyro)
+        if angle!=None: self.angle=tuple(angle)
+        if mag!=None: self.mag=tuple(mag)
+        if temp!=None: self.temp=temp
+        self.__set(0x34,[self.accel[i]*32768/16-self.word(0x05+i) for i in range(3)])
+        self.__set(0x37,[self.gyro[i]*32768/2000-self.word(0x08+i) for i in range(3)])
+        self.__set(0x3a,self.mag)
+        self.__set(0x3d,[x*32768/180 for x in self.angle])
+        self.__set(0x40,(self.temp*100,))
+
+    def read(self,reg,buf):
+        super().read(reg*2,buf)
+
+    def write(self,reg,data):
+        self.writes+=1
+        if len(data)<2: return
+        v=data[0]|data[1]<<8
+        if reg==0x69:
+            self.unlocked=v==0xb588
+            return
+        if not self.unlocked: return
+        if reg==0x00:
+            self.saves+=1
+            self.unlocked=False
+            return
+        self.regs[reg*2]=data[0]
+        self.regs[reg*2+1]=data[1]
+        if 0x05<=reg<=0x0a: self.move()    # new offsets
+
+class TCA9548A(Device):
+    def __init__(self,addr=0x70):
+        """ 8 channel mux. one control byte, each set bit connects a channel.
+        devices attached to a channel answer only while it is connected
+        * addr (`int`): 0x70-0x77
+        """
+        super().__init__(addr,1)
+        self.channels=[{} for _ in range(8)]
+        self.switches=0
+
+    @property
+    def mask(self):
+        return self.regs[0]
+
+    def attach(self,ch,dev):
+        """ puts dev behind channel ch """
+        self.channels[ch][dev.addr]=dev
+        return dev
+
+    def visible(self):
+        """ devices on the connected channels """
+        m=self.regs[0]
+        for ch in range(8):
+            if m>>ch&1: yield from self.channels[ch].values()
+
+    def readfrom(self,buf):
+        self.reads+=1
+        for i in range(len(buf)): buf[i]=self.regs[0]
+
+    def writeto(self,data):
+        self.writes+=1
+        if len(data):
+            self.regs[0]=data[-1]
+            self.switches+=1
@@ -0,0 +1,80 @@
+#===================================================================
+# file: host.py
+# desc: makes nos importable off device. ticks_* and sleep_ms/us on
+#       time, asyncio.sleep_ms, and the nos.sim modules standing in
+#       for machine, network, ubinascii and micropython
+# dev : nos
+#===================================================================
+# from nos.sim.host import install
+# install()                         # before importing anything from nos
+# from nos.sim.machine import BUS
+# from nos.sim import devices
+# BUS.attach(devices.MPU6050(0x68))
+#===================================================================
+import sys
+import time
+try: import asyncio
+except ImportError: import uasyncio as asyncio  #type: ignore
+
+TICKS_PERIOD = 1<<30    # same wrap as the ports
+
+def ticks_us():
+    return int(time.perf_counter()*1000000)&(TICKS_PERIOD-1)
+
+def ticks_ms():
+    return int(time.perf_counter()*1000)&(TICKS_PERIOD-1)
+
+def ticks_cpu():
+    return int(time.perf_counter()*100000000)&(TICKS_PERIOD-1)
+
+def ticks_add(t,d):
+    return (t+d)&(TICKS_PERIOD-1)
+
+def ticks_diff(a,b):
+    return ((a-b+(TICKS_PERIOD>>1))&(TICKS_PERIOD-1))-(TICKS_PERIOD>>1)
+
+def sleep_ms(ms):
+    if ms>0: time.sleep(ms/1000)
+
+def sleep_us(us):
+    if us>0: time.sleep(us/1000000)
+
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms/1000)
+
+class ThreadSafeFlag:
+    """ asyncio.ThreadSafeFlag for cpython. set() from the same thread only """
+    def __init__(self):
+        self.__e=asyncio.Event()
+
+    def set(self):
+        self.__e.set()
+
+    def clear(self):
+        self.__e.clear()
+
+    async def wait(self):
+        await self.__e.wait()
+        self.__e.clear()
+
+MODULES = ('machine','network','ubinascii','micropython')
+
+def install(modules=None):
+    """ patches in what the ports have and cpython lacks, and registers the
+    stand-ins in sys.modules, where imports look before the builtin modules.
+    on the micropython unix port only machine (no Pin or I2C there) and
+    network are replaced. safe to call twice
+    * modules (`tuple`): names from MODULES to replace instead
+    """
+    for k,v in (('ticks_us',ticks_us),('ticks_ms',ticks_ms),('ticks_cpu',ticks_cpu),
+                ('ticks_add',ticks_add),('ticks_diff',ticks_diff),
+                ('sleep_ms',sleep_ms),('sleep_us',sleep_us)):
+        if not hasattr(time,k): setattr(time,k,v)
+    if not hasattr(asyncio,'sleep_ms'): asyncio.sleep_ms=_sleep_ms
+    if not hasattr(asyncio,'ThreadSafeFlag'): asyncio.ThreadSafeFlag=ThreadSafeFlag
+
+    if modules==None:
+        modules=MODULES[:2] if sys.implementation.name=='micropython' else MODULES
+    for name in modules:
+        if name not in MODULES: raise ValueError(name)
+        sys.modules[name]=__import__('nos.sim.'+name,None,None,[name])
@@ -0,0 +1,213 @@
+#===================================================================
+# file: machine.py
+# desc: host stand-in for micropython's machine module. pins, i2c on
+#       a bus of nos.sim.devices models, adc and a bitstream that
+#       keeps the frames. see nos.sim.host
+# dev : nos
+#===================================================================
+import time
+import errno
+try: import uctypes     # type: ignore
+except ImportError: uctypes=None
+
+def _bytes(buf):
+    """ byte view of buf. typed arrays are seen as their raw bytes """
+    t=type(buf)
+    if t==bytearray: return buf
+    mv=memoryview(buf)
+    if uctypes==None: return mv.cast('B')
+    n=getattr(mv,'itemsize',1)
+    if n==1: return mv
+    return uctypes.bytearray_at(uctypes.addressof(buf),len(buf)*n)
+
+class Bus:
+    def __init__(self):
+        """ the wires every I2C and SoftI2C shares. devices answer by address,
+        the ones behind a mux only while their channel is connected
+        """
+        self.devices={}
+        self.reset_stats()
+
+    def attach(self,dev):
+        """ puts a nos.sim.devices model on the bus. returns it """
+        self.devices[dev.addr]=dev
+        return dev
+
+    def detach(self,addr):
+        self.devices.pop(addr,None)
+
+    def clear(self):
+        self.devices={}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.transactions=0
+        self.nbytes=0
+        self.nacks=0
+        self.wire_ns=0      # what the transfers would take on the wire
+
+    def find(self,addr):
+        """ the device answering addr. no answer raises OSError(ENODEV) like a nack """
+        d=self.devices.get(addr)
+        if d!=None: return d
+        for m in self.devices.values():
+            if hasattr(m,'visible'):
+                for d in m.visible():
+                    if d.addr==addr: return d
+        self.nacks+=1
+        raise OSError(errno.ENODEV)
+
+    def scan(self):
+        a=list(self.devices)
+        for m in self.devices.values():
+            if hasattr(m,'visible'): a+=[d.addr for d in m.visible()]
+        return sorted(a)
+
+    def account(self,n,freq):
+        """ one transaction of n bytes on the wire, address and register included """
+        self.transactions+=1
+        self.nbytes+=n
+        self.wire_ns+=n*9*1000000000//freq     # 8 bits and an ack
+
+BUS=Bus()
+
+class Pin:
+    IN          = 0
+    OUT         = 1
+    OPEN_DRAIN  = 2
+    PULL_UP     = 1
+    PULL_DOWN   = 2
+    IRQ_FALLING = 4
+    IRQ_RISING  = 8
+
+    def __init__(self,id,mode=-1,pull=-1,value=None):
+        """ a pin that remembers its level. fire() drives it from outside """
+        self.id=id
+        self.__v=0
+        self.handler=None
+        self.trigger=0
+        self.init(mode,pull,value)
+
+    def init(self,mode=-1,pull=-1,value=None):
+        if mode!=-1: self.mode=mode
+        if pull!=-1: self.pull=pull
+        if value!=None: self.__v=1 if value else 0
+
+    def value(self,v=None):
+        if v==None: return self.__v
+        self.__v=1 if v else 0
+    __call__=value
+
+    def on(self): self.__v=1
+    def off(self): self.__v=0
+    high=on
+    low=off
+
+    def irq(self,handler=None,trigger=IRQ_FALLING|IRQ_RISING,hard=False):
+        self.handler=handler
+        self.trigger=trigger
+        return self
+
+    def fire(self,v=1):
+        """ sets the level from outside, calling the irq handler on a matching edge
+        * v (`int`): new level
+        """
+        old=self.__v
+        self.__v=1 if v else 0
+        edge=self.IRQ_RISING if self.__v>old else self.IRQ_FALLING if self.__v<old else 0
+        if self.handler and edge&self.trigger: self.handler(self)
+
+    def __repr__(self):
+        return "Pin(%s)" % self.id
+
+class SoftI2C:
+    def __init__(self,scl=None,sda=None,freq=400000,timeout=50000,bus=None):
+        """ i2c master on the simulated bus
+        * bus (`Bus`): BUS by default
+        """
+        self.bus=bus or BUS
+        self.init(scl,sda,freq)
+
+    def init(self,scl=None,sda=None,freq=400000):
+        self.scl=scl
+        self.sda=sda
+        self.freq=freq
+
+    def scan(self):
+        return self.bus.scan()
+
+    def readfrom_mem_into(self,addr,memaddr,buf,addrsize=8):
+        b=_bytes(buf)
+        self.bus.find(addr).read(memaddr,b)
+        self.bus.account(len(b)+3,self.freq)
+
+    def readfrom_mem(self,addr,memaddr,nbytes,addrsize=8):
+        b=bytearray(nbytes)
+        self.readfrom_mem_into(addr,memaddr,b)
+        return bytes(b)
+
+    def writeto_mem(self,addr,memaddr,buf,addrsize=8):
+        self.bus.find(addr).write(memaddr,buf)
+        self.bus.account(len(buf)+2,self.freq)
+
+    def readfrom_into(self,addr,buf,stop=True):
+        b=_bytes(buf)
+        self.bus.find(addr).readfrom(b)
+        self.bus.account(len(b)+1,self.freq)
+
+    def readfrom(self,addr,nbytes,stop=True):
+        b=bytearray(nbytes)
+        self.readfrom_into(addr,b)
+        return bytes(b)
+
+    def writeto(self,addr,buf,stop=True):
+        self.bus.find(addr).writeto(buf)
+        self.bus.account(len(buf)+1,self.freq)
+        return len(buf)+1       # acks
+
+class I2C(SoftI2C):
+    def __init__(self,id=0,scl=None,sda=None,freq=400000,timeout=50000,bus=None):
+        """ same bus, a hardware block only in name """
+        self.id=id
+        super().__init__(scl,sda,freq,timeout,bus)
+
+class ADC:
+    def __init__(self,pin):
+        """ triangle wave, one period a second """
+        self.pin=pin
+
+    def read_u16(self):
+        x=time.ticks_ms()%1000
+        return (x if x<500 else 999-x)*65535//499
+
+# bitstream keeps the last frame per pin, copied into a buffer reused while
+# the frame size stays the same
+frames={}       # pin id: bytearray
+sent=0          # frames
+sent_bytes=0
+
+def bitstream(pin,encoding,timing,buf):
+    global sent,sent_bytes
+    k=getattr(pin,'id',pin)
+    f=frames.get(k)
+    if f==None or len(f)!=len(buf):
+        f=bytearray(len(buf))
+        frames[k]=f
+    f[:]=buf
+    sent+=1
+    sent_bytes+=len(buf)
+
+def freq(hz=None):
+    return 150000000
+
+def unique_id():
+    return b'nos-sim\0'
+
+def idle():
+    pass
+
+def disable_irq():
+    return 0
+
+def enable_irq(state=0):
+    pass
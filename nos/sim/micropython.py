@@ -0,0 +1,28 @@
+#===================================================================
+# file: micropython.py
+# desc: host stand-in for the micropython module. schedule runs the
+#       callback right away, the code emitters are no-ops
+# dev : nos
+#===================================================================
+scheduled=0
+
+def const(x):
+    return x
+
+def schedule(fn,arg):
+    global scheduled
+    scheduled+=1
+    fn(arg)
+
+def alloc_emergency_exception_buf(n):
+    pass
+
+def opt_level(level=None):
+    return 0
+
+def mem_info(verbose=False):
+    pass
+
+def native(fn):
+    return fn
+viper=native
@@ -0,0 +1,114 @@
+#===================================================================
+# file: network.py
+# desc: host stand-in for micropython's network module. a WLAN that
+#       joins the access points listed in APS after a simulated delay
+# dev : nos
+#===================================================================
+import time
+
+STA_IF = 0
+AP_IF  = 1
+
+STAT_IDLE           = 0
+STAT_CONNECTING     = 1
+STAT_GOT_IP         = 3
+STAT_CONNECT_FAIL   = -1
+STAT_NO_AP_FOUND    = -2
+STAT_WRONG_PASSWORD = -3
+
+# join time is ASSOC_MS, plus SCAN_MS without a bssid, plus DHCP_MS without
+# a static address
+ASSOC_MS = 50
+SCAN_MS  = 150
+DHCP_MS  = 100
+
+APS = []    # [ssid, password, bssid, channel, rssi]
+
+def add_ap(ssid,pswd,bssid=None,channel=6,rssi=-60):
+    """ puts an access point in range
+    * ssid    (`str`)  : network name
+    * pswd    (`str`)  : password
+    * bssid   (`bytes`): 6 byte mac, made up when None
+    * channel (`int`)  : wifi channel
+    * rssi    (`int`)  : dBm
+    """
+    if bssid==None: bssid=bytes((0x02,0,0,0,len(APS)>>8,len(APS)&0xff))
+    APS.append([ssid.encode() if type(ssid)==str else ssid,pswd,bssid,channel,rssi])
+    return bssid
+
+class WLAN:
+    def __init__(self,interface=STA_IF):
+        self.interface=interface
+        self.__active=False
+        self.__ap=None
+        self.__st=STAT_IDLE
+        self.__up=0             # ticks_ms the join completes
+        self.__static=None
+        self.__mac=bytes((0x02,0x6e,0x6f,0x73,0,interface+1))
+        self.joins=0
+        self.scans=0
+
+    def active(self,on=None):
+        if on==None: return self.__active
+        self.__active=bool(on)
+        if not on: self.disconnect()
+
+    def connect(self,ssid=None,key=None,bssid=None):
+        self.__ap=None
+        if type(ssid)==str: ssid=ssid.encode()
+        aps=[a for a in APS if a[0]==ssid and (bssid==None or a[2]==bytes(bssid))]
+        if not aps:
+            self.__st=STAT_NO_AP_FOUND
+            return
+        ap=max(aps,key=lambda a:a[4])
+        if key!=ap[1]:
+            self.__st=STAT_WRONG_PASSWORD
+            return
+        ms=ASSOC_MS+(SCAN_MS if bssid==None else 0)+(DHCP_MS if self.__static==None else 0)
+        self.__ap=ap
+        self.__st=STAT_CONNECTING
+        self.__up=time.ticks_add(time.ticks_ms(),ms)
+        self.joins+=1
+
+    def disconnect(self):
+        self.__ap=None
+        self.__st=STAT_IDLE
+
+    def drop(self):
+        """ loses the link as if the access point went away """
+        self.__ap=None
+        self.__st=STAT_CONNECT_FAIL
+
+    def status(self,param=None):
+        if self.__st==STAT_CONNECTING and time.ticks_diff(time.ticks_ms(),self.__up)>=0:
+            self.__st=STAT_GOT_IP
+        if param=='rssi': return self.__ap[4] if self.__ap else 0
+        return self.__st
+
+    def isconnected(self):
+        return self.status()==STAT_GOT_IP
+
+    def scan(self):
+        if not self.__active: raise OSError("wifi not active")
+        self.scans+=1
+        return [(a[0],a[2],a[3],a[4],3,False) for a in APS]
+
+    def ifconfig(self,cfg=None):
+        if cfg=='dhcp':
+            self.__static=None
+            return
+        if cfg!=None:
+            self.__static=tuple(cfg)
+            return
+        if self.__static: return self.__static
+        if self.isconnected(): return ('192.168.4.%d' % (10+self.interface),'255.255.255.0','192.168.4.1','192.168.4.1')
+        return ('0.0.0.0','0.0.0.0','0.0.0.0','0.0.0.0')
+
+    def config(self,*args,**kwargs):
+        if kwargs: return
+        k=args[0]
+        if k=='mac': return self.__mac
+        if k=='bssid': return self.__ap[2] if self.__ap else bytes(6)
+        if k=='channel': return self.__ap[3] if self.__ap else 0
+        if k in ('ssid','essid'): return self.__ap[0].decode() if self.__ap else ''
+        raise ValueError("unknown config param")
@@ -0,0 +1,203 @@
+#===================================================================
+# file: suite.py
+# desc: benchmark suite on the simulated hardware. sensor decode,
+#       led framebuffer and render, udp streaming over loopback, each
+#       with heap bytes per call. runs under cpython and the
+#       micropython unix port and appends one json line per run
+# dev : nos
+#===================================================================
+# python -m nos.sim.suite [results.jsonl] [quick]
+# micropython -m nos.sim.suite [results.jsonl] [quick]
+#
+# a line is {"t","platform","impl","version","results":{name:{..}}}. rows
+# have us (per call), bytes (allocated per call) and per_s, some add more
+#===================================================================
+from nos.sim.host import install
+install()
+
+import sys
+import time
+import json
+from array import array
+from nos.sim.machine import BUS
+from nos.sim import devices
+from nos.util.bench import report, alloc_per_call
+
+class Results:
+    def __init__(self,n=200):
+        """ named rows of one run
+        * n (`int`): calls per timed row
+        """
+        self.n=n
+        self.rows={}
+
+    def bench(self,name,fn,ops=1,n=None,**extra):
+        """ times fn and counts its allocations
+        * ops (`int`): operations per call, per_s counts these
+        """
+        us,b=report(name,fn,n or self.n)
+        row={'us':round(us,2),'bytes':round(b,1),'per_s':round(ops*1000000/us) if us else 0}
+        row.update(extra)
+        self.rows[name]=row
+        return row
+
+    def add(self,name,**values):
+        self.rows[name]=values
+        print("%-24s %s" % (name,values))
+
+    def skip(self,name,why):
+        self.rows[name]={'skipped':str(why)}
+        print("%-24s skipped: %s" % (name,why))
+
+def _wire_us(fn,n=20):
+    """ simulated bus time per call, what caps the rate on a real bus """
+    BUS.reset_stats()
+    for _ in range(n): fn()
+    return round(BUS.wire_ns/n/1000,1)
+
+def sensors(r):
+    from nos.util.i2c import NosI2C
+    from nos.sensors.MPU6050 import MPU6050
+    from nos.sensors.WT901 import WT901
+    from nos.sensors.TCA9548A import TCA9548A, TCA9548APoller
+
+    BUS.clear()
+    sim=BUS.attach(devices.MPU6050(0x68))
+    BUS.attach(devices.WT901(0x50))
+    mux=BUS.attach(devices.TCA9548A(0x70))
+    for ch in range(4): mux.attach(ch,devices.MPU6050(0x69,seed=ch+2))
+
+    i2c=NosI2C(5,4)
+    mpu=MPU6050(0x68,i2c=i2c)
+    wt=WT901(0x50,i2c=i2c)
+    raw=array('h',[0]*MPU6050.RAW_LEN)
+    f=array('f',[0]*MPU6050.RAW_LEN)
+    r.bench("mpu6050 read_raw_into",lambda: mpu.read_raw_into(raw),wire_us=_wire_us(lambda: mpu.read_raw_into(raw)))
+    r.bench("mpu6050 read_into",lambda: mpu.read_into(f))
+    r.bench("mpu6050 get_data",mpu.get_data)
+
+    mpu.fifo_start(rate=1000,nframes=32)
+    def drain():
+        sim.fifo=32*MPU6050.FRAME_LEN
+        mpu.fifo_read()
+    r.bench("mpu6050 fifo_read 32",drain,ops=32,wire_us=_wire_us(drain))
+    mpu.fifo_stop()
+
+    wraw=array('h',[0]*WT901.RAW_LEN)
+    wf=array('f',[0]*WT901.RAW_LEN)
+    plan=wt.plan('acceleration','angular_velocity','angle')
+    r.bench("wt901 read_raw_into",lambda: wt.read_raw_into(wraw),wire_us=_wire_us(lambda: wt.read_raw_into(wraw)))
+    r.bench("wt901 read_into",lambda: wt.read_into(wf))
+    r.bench("wt901 get_data",wt.get_data)
+    r.bench("wt901 plan poll",plan.poll,wire_us=_wire_us(plan.poll))
+
+    tca=TCA9548A(0x70,i2c=i2c)
+    mpus=[MPU6050(0x69,i2c=tca.bus(ch)) for ch in range(4)]
+    poller=TCA9548APoller(tca,mpus)
+    r.bench("tca9548a poll 4 mpu",poller.poll,ops=4,wire_us=_wire_us(poller.poll))
+
+def leds(r,amnt=300):
+    import nos.sim.machine as machine
+    from nos.acc.WS2812x import WS2812x, Palette
+    from nos.acc.effects import Engine, Rainbow
+
+    strip=WS2812x(13,amnt)
+    pal=Palette.rainbow()
+    strip.paint(pal)
+    dim=WS2812x(14,amnt)
+    dim.blit(strip)
+    dim.gamma=2.2
+    dim.brightness=0.25
+    r.bench("ws2812x fill",lambda: strip.fill(0x123456),ops=amnt)
+    r.bench("ws2812x roll",lambda: strip.roll(1),ops=amnt)
+    r.bench("ws2812x paint",lambda: strip.paint(pal,7),ops=amnt)
+    r.bench("ws2812x output gamma",dim.output,ops=amnt)
+    r.bench("ws2812x render",lambda: strip.render(True))
+    r.bench("ws2812x render gamma",lambda: dim.render(True))
+    if len(machine.frames[13])!=amnt*3: raise AssertionError("render didn't reach bitstream")
+
+    engine=Engine(strip,fps=1000)
+    engine.play(Rainbow(period_ms=2000))
+    r.bench("effects frame rainbow",engine.frame)
+
+def udp(r,seconds=1.0,port=65123):
+    import socket
+    from nos.util.udp_stream import UDP_STREAM
+    from nos.util.stream_format import unpack_header
+
+    raw=array('h',[0]*7)
+    def sample():
+        raw[0]=(raw[0]+1)&0x7fff
+        return raw
+    def text():
+        return {'t':time.ticks_ms(),'v':1.25}
+
+    cases=(
+        ("udp json",        dict(hook=text)),
+        ("udp binary x50",  dict(hook=sample,fmt='<7h',batch=50)),
+        ("udp delta x50",   dict(hook=sample,fmt='<7h',batch=50,codec='delta')),
+    )
+    for k,(name,kw) in enumerate(cases):
+        srv=cli=None
+        try:
+            srv=UDP_STREAM('127.0.0.1',port+k,**kw)
+            cli=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+            cli.bind(('127.0.0.1',0))
+            cli.setblocking(False)
+            cli.sendto(b'start',('127.0.0.1',port+k))
+            srv.poll_ctrl(100)
+            got=[0,0,0]     # datagrams, bytes, samples
+            def drain():
+                while True:
+                    try: m=cli.recv(2048)
+                    except OSError: return
+                    got[0]+=1
+                    got[1]+=len(m)
+                    got[2]+=unpack_header(m)[3] if kw.get('fmt') else 1
+            def step():
+                srv.tick()
+                drain()
+            b=alloc_per_call(srv.tick,r.n)
+            drain()
+            got[0]=got[1]=got[2]=0
+            t0=time.ticks_us()
+            ticks=0
+            while time.ticks_diff(time.ticks_us(),t0)<seconds*1000000:
+                step()
+                ticks+=1
+            us=time.ticks_diff(time.ticks_us(),t0)
+            drain()
+            r.add(name,us=round(us/ticks,2),bytes=round(b,1),per_s=round(ticks*1000000/us),
+                  msgs_per_s=round(got[0]*1000000/us),bytes_per_s=round(got[1]*1000000/us),
+                  samples_per_s=round(got[2]*1000000/us))
+        except (OSError,TypeError,ValueError) as e:
+            r.skip(name,e)
+        finally:
+            if srv: srv.udp.close()
+            if cli: cli.close()
+
+def run(path='bench.jsonl',quick=False):
+    """ runs every section and appends the results to path as one json line
+    * path  (`str`) : results file, None only prints
+    * quick (`bool`): fewer calls per row, for a smoke test
+    """
+    r=Results(50 if quick else 500)
+    sensors(r)
+    leds(r)
+    udp(r,0.2 if quick else 1.0)
+    v=sys.implementation.version
+    rec={
+        't'         : int(time.time()),
+        'platform'  : sys.platform,
+        'impl'      : sys.implementation.name,
+        'version'   : "%d.%d.%d" % (v[0],v[1],v[2]),
+        'quick'     : quick,
+        'results'   : r.rows,
+    }
+    if path:
+        with open(path,'a') as f: f.write(json.dumps(rec)+"\n")
+    return rec
+
+if __name__=="__main__":
+    a=sys.argv[1:]
+    run(a[0] if a else 'bench.jsonl','quick' in a[1:])
@@ -0,0 +1,6 @@
+#===================================================================
+# file: ubinascii.py
+# desc: host stand-in for micropython's ubinascii
+# dev : nos
+#===================================================================
+from binascii import hexlify, unhexlify, a2b_base64, b2a_base64, crc32
@@ -0,0 +1,54 @@
+#===================================================================
+# file: bench.py
+# desc: tiny timing and heap allocation helpers for benchmarks
+# dev : nos
+#===================================================================
+import time
+import gc
+
+try:
+    from gc import mem_alloc    # micropython
+    def _trace(on): pass
+except ImportError:
+    import tracemalloc
+    def mem_alloc():
+        """ bytes currently traced """
+        return tracemalloc.get_traced_memory()[0]
+    def _trace(on):
+        if on: tracemalloc.start()
+        else: tracemalloc.stop()
+
+def alloc_per_call(fn,n=100):
+    """ average heap bytes allocated per call. gc is held off while measuring
+    * fn (`callable`): called with no arguments
+    * n  (`int`)     : number of calls
+    """
+    fn()
+    gc.collect()
+    gc.disable()
+    _trace(True)
+    try:
+        a=mem_alloc()
+        for _ in range(n): fn()
+        b=mem_alloc()
+    finally:
+        _trace(False)
+        gc.enable()
+    return (b-a)/n
+
+def time_per_call(fn,n=100):
+    """ average µs per call
+    * fn (`callable`): called with no arguments
+    * n  (`int`)     : number of calls
+    """
+    fn()
+    t0=time.ticks_us()
+    for _ in range(n): fn()
+    return time.ticks_diff(time.ticks_us(),t0)/n
+
+def report(name,fn,n=100):
+    """ prints and returns (µs/call, bytes/call) for fn """
+    us=time_per_call(fn,n)
+    b=alloc_per_call(fn,n)
+    print("%-24s %10.1f us/call %8.1f B/call" % (name,us,b))
+    return us,b
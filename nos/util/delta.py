@@ -0,0 +1,193 @@
+#===================================================================
+# file: delta.py
+# desc: delta + zigzag varint codec for integer sensor samples.
+#       a drop-in for FrameBuilder when airtime matters more than cpu
+# dev : nos
+#===================================================================
+# payload of a FLAG_DELTA frame, count samples back to back
+#   every channel as a zigzag varint (7 bits per byte, lsb first,
+#   high bit set on all but the last byte)
+#   the first sample of a FLAG_KEY frame holds absolute values, every
+#   other sample the difference to the sample before it
+# frames that don't start with a key continue the previous frame, so a
+# decoder that saw a gap in seq waits for the next key
+#===================================================================
+import struct
+from nos.util.stream_format import HEADER, HEADER_SIZE, MAGIC, VERSION, FLAG_DELTA, FLAG_KEY, FORMAT_ERROR
+try: from time import ticks_diff
+except ImportError: ticks_diff=lambda a,b: a-b     # host
+
+def channels(fmt):
+    """ (codes, worst case varint bytes per sample) for an integer fmt """
+    codes=[]
+    n=''
+    for ch in fmt.lstrip('<>!=@'):
+        if ch in '0123456789': n+=ch
+        elif ch in 'bBhHiIlLqQ':
+            codes+=[ch]*int(n or 1)
+            n=''
+        else: raise FORMAT_ERROR("delta needs integer fields, got %r" % ch)
+    worst=0
+    for c in codes: worst+=(struct.calcsize(c)*8+7)//7
+    return codes,worst
+
+class DeltaFrameBuilder:
+    def __init__(self,fmt,stream_id=0,batch=1,mtu=1400,keyframe=100):
+        """ FrameBuilder that delta encodes samples. same add/frame/reset use
+        * fmt       (`str`): struct format of one sample. integers only
+        * stream_id (`int`): 0-255
+        * batch     (`int`): most samples per frame
+        * mtu       (`int`): datagram size budget in bytes
+        * keyframe  (`int`): samples between absolute values, at the next frame start
+        """
+        self.fmt=fmt
+        self.stream_id=stream_id
+        codes,self.worst=channels(fmt)
+        self.nch=len(codes)
+        self.batch=batch
+        self.keyframe=keyframe
+        self.off=HEADER_SIZE+len(fmt)
+        self.buf=bytearray(max(mtu,self.off+self.worst))
+        self.mv=memoryview(self.buf)
+        self.buf[HEADER_SIZE:self.off]=fmt.encode()
+        self.prev=[0]*self.nch
+        self.flags=FLAG_DELTA
+        self.seq=0
+        self.n=0
+        self.pos=self.off
+        self.t0=0
+        self.t1=0
+        self.since_key=keyframe     # first frame is a key
+        self.raw=0                  # bytes the samples would take packed
+        self.sent=0                 # bytes they took encoded
+
+    def add(self,sample,t):
+        """ encodes one sample. returns true once the frame is full
+        * sample (`tuple`): values for fmt
+        * t      (`int`)  : ticks_us of the sample
+        """
+        buf=self.buf
+        prev=self.prev
+        pos=self.pos
+        if self.n==0:
+            self.t0=t
+            if self.since_key>=self.keyframe:
+                self.flags=FLAG_DELTA|FLAG_KEY
+                self.since_key=0
+                for i in range(self.nch): prev[i]=0
+            else: self.flags=FLAG_DELTA
+        self.t1=t
+        for i in range(self.nch):
+            v=sample[i]
+            d=v-prev[i]
+            prev[i]=v
+            z=d<<1 if d>=0 else ((-d)<<1)-1
+            while z>0x7f:
+                buf[pos]=(z&0x7f)|0x80
+                z>>=7
+                pos+=1
+            buf[pos]=z
+            pos+=1
+        self.pos=pos
+        self.n+=1
+        self.since_key+=1
+        return self.n>=self.batch or len(buf)-pos<self.worst
+
+    def frame(self):
+        """ closes the frame. returns a memoryview of the datagram, valid until
+        the next add
+        """
+        n=self.n
+        period=ticks_diff(self.t1,self.t0)//(n-1) if n>1 else 0
+        struct.pack_into(HEADER,self.buf,0,MAGIC,VERSION,self.flags,self.stream_id,
+                         len(self.fmt),n,self.seq,self.t0,period)
+        self.seq=(self.seq+1)&0xffffffff
+        end=self.pos
+        self.raw+=n*struct.calcsize(self.fmt)
+        self.sent+=end-self.off
+        self.n=0
+        self.pos=self.off
+        return self.mv[:end]
+
+    def reset(self):
+        """ drops a partial frame. the next frame is a key since the decoder
+        never saw the dropped samples
+        """
+        self.n=0
+        self.pos=self.off
+        self.since_key=self.keyframe
+
+    def ratio(self):
+        """ encoded / packed payload bytes so far """
+        return self.sent/self.raw if self.raw else 1
+
+class DeltaDecoder:
+    def __init__(self,fmt):
+        """ undoes DeltaFrameBuilder for one stream
+        * fmt (`str`): struct format of one sample
+        """
+        self.fmt=fmt
+        self.size=struct.calcsize(fmt)
+        self.nch=len(channels(fmt)[0])
+        self.prev=[0]*self.nch
+        self.seq=None
+        self.synced=False
+        self.skipped=0      # frames dropped while waiting for a key
+
+    def decode(self,flags,count,seq,payload):
+        """ samples of one frame packed with fmt, or None until the stream
+        resyncs on a key after a gap
+        * flags, count, seq (`int`): from unpack_header
+        * payload (`bytes`)       : frame bytes after the header and fmt
+        """
+        if self.seq!=None and seq!=(self.seq+1)&0xffffffff: self.synced=False
+        self.seq=seq
+        if flags&FLAG_KEY:
+            self.synced=True
+            for i in range(self.nch): self.prev[i]=0
+        if not self.synced:
+            self.skipped+=1
+            return None
+        out=bytearray(count*self.size)
+        prev=self.prev
+        pos=0
+        for k in range(count):
+            for i in range(self.nch):
+                z=0
+                s=0
+                while True:
+                    b=payload[pos]
+                    pos+=1
+                    z|=(b&0x7f)<<s
+                    s+=7
+                    if b<0x80: break
+                prev[i]+=(z>>1)^-(z&1)
+            struct.pack_into(self.fmt,out,k*self.size,*prev)
+        return out
+
+
+if __name__=="__main__":
+    # ratio and encode cost on imu like data. run on the board
+    import random
+    from nos.util.bench import report
+    from nos.util.stream_format import FrameBuilder
+    fmt='<7h'
+    n=500
+    samples=[]
+    v=[0,0,16384,-2000,0,0,0]
+    for _ in range(n):
+        v=[max(-32768,min(32767,x+random.randint(-40,40))) for x in v]
+        samples.append(tuple(v))
+    for batch in (10,50):
+        plain=FrameBuilder(fmt,batch=batch)
+        delta=DeltaFrameBuilder(fmt,batch=batch,keyframe=100)
+        it=[0]
+        def step(fb):
+            def f():
+                s=samples[it[0]%n]
+                it[0]+=1
+                if fb.add(s,it[0]): fb.frame()
+            return f
+        report("plain batch %d" % batch,step(plain),n)
+        report("delta batch %d" % batch,step(delta),n)
+        print("delta payload ratio %.2f" % delta.ratio())
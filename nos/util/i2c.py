@@ -1,23 +1,246 @@
 #===================================================================
 # file: i2c.py
-# desc: uses SoftI2C.
+# desc: hardware I2C when the pins allow it, SoftI2C otherwise.
 # dev : nos
 #===================================================================
-from machine import Pin,SoftI2C #type: ignore
-class NosI2C(SoftI2C):
+from machine import Pin,SoftI2C,I2C #type: ignore
+from array import array
+import time
+import sys
+
+_claims={}  # hardware block: (scl,sda) of the bus using it
+
+def hw_id(scl,sda):
+    """ free hardware i2c block for a pin pair, None if there is none. a block
+    another pin pair already uses doesn't count, re-pinning it would take the
+    other bus down
+    * scl (`int`): scl pin number
+    * sda (`int`): sda pin number
+    """
+    if sys.platform=='rp2':
+        # i2c0 on sda 0,4,8.. i2c1 on sda 2,6,10.. scl is always sda+1
+        if not (sda%2==0 and scl==sda+1 and sda<30): return None
+        ids=((sda//2)%2,)
+    elif sys.platform=='esp32': ids=(0,1)   # gpio matrix routes any pin
+    else: return None
+    for i in ids:
+        c=_claims.get(i)
+        if c==None or c==(scl,sda): return i
+    return None
+
+def nbytes(buf):
+    """ size of buf in bytes. typed arrays count their items' bytes """
+    t=type(buf)
+    if t==bytearray or t==bytes: return len(buf)
+    m=memoryview(buf)
+    try: return m.nbytes
+    except AttributeError: return len(m)*getattr(m,'itemsize',1)
+
+class NosI2CStats:
+    BUCKETS = 16    # bucket k counts latencies in [2^k,2^(k+1)) µs
+    
+    def __init__(self):
+        """ per address counters and a log2 latency histogram. fixed size, so
+        recording never allocates
+        """
+        self.count=array('I',[0]*128)
+        self.nbytes=array('I',[0]*128)  # bytes moved
+        self.errors=array('I',[0]*128)
+        self.us=array('I',[0]*128)      # summed latency
+        self.us_max=array('I',[0]*128)
+        self.hist=array('I',[0]*self.BUCKETS)
+    
+    def add(self,addr,n,us):
+        """ records one transaction
+        * addr (`int`): device address
+        * n    (`int`): bytes moved
+        * us   (`int`): latency in µs
+        """
+        self.count[addr]+=1
+        self.nbytes[addr]+=n
+        self.us[addr]+=us
+        if us>self.us_max[addr]: self.us_max[addr]=us
+        b=0
+        while us>1 and b<self.BUCKETS-1:
+            us>>=1
+            b+=1
+        self.hist[b]+=1
+    
+    def reset(self):
+        for a in (self.count,self.nbytes,self.errors,self.us,self.us_max,self.hist):
+            for i in range(len(a)): a[i]=0
+    
+    def snapshot(self):
+        """ dict of active addresses plus the histogram. json friendly """
+        d={'hist':list(self.hist)}
+        for a in range(128):
+            n=self.count[a]
+            if n or self.errors[a]:
+                d["0x%02x" % a]={'n':n,'bytes':self.nbytes[a],'errors':self.errors[a],
+                                 'us_avg':self.us[a]//n if n else 0,'us_max':self.us_max[a]}
+        return d
+    
+    def show(self):
+        """ prints the snapshot """
+        d=self.snapshot()
+        for k in sorted(d):
+            if k=='hist': continue
+            v=d[k]
+            print("%s: %d tx, %d bytes, %d errors, avg %dus, max %dus" % (k,v['n'],v['bytes'],v['errors'],v['us_avg'],v['us_max']))
+        for b in range(self.BUCKETS):
+            if self.hist[b]: print("%6dus+ %d" % (1<<b if b else 0,self.hist[b]))
+
+class NosI2C:
     class NO_ADDR_PROVIDED(Exception):pass
-    def __init__(self,scl:Pin,sda:Pin):
+    class NO_HARDWARE(Exception):pass
+    def __init__(self,scl:Pin,sda:Pin,freq=400000,hard=None,id=None):
         """ NosI2C
-        * scl (`int`)   : scl pin 
-        * sda (`int`)   : sda pin 
+        * scl  (`int`) : scl pin 
+        * sda  (`int`) : sda pin 
+        * freq (`int`) : bus frequency
+        * hard (`bool`): True needs machine.I2C, False forces SoftI2C. None uses
+        machine.I2C when the pins map to a hardware block
+        * id   (`int`) : hardware block. worked out from the pins when None, a
+        block already taken by another NosI2C falls back to SoftI2C
         """
+        if hard!=False and id==None and type(scl)==int and type(sda)==int:
+            id=hw_id(scl,sda)
+        if hard and id==None: raise self.NO_HARDWARE
+        self.id=None if hard==False else id
+        if self.id!=None: _claims[self.id]=(scl,sda)
+        
         if type(scl)!=Pin: scl=Pin(scl)
         if type(sda)!=Pin: sda=Pin(sda)
         
         self.__scl=scl
         self.__sda=sda
         
-        super().__init__(scl,sda)
+        self.stats=None
+        self.instrumented=False
+        self.__build(freq)
+    
+    def __build(self,freq):
+        if self.id!=None: self.bus=I2C(self.id,scl=self.__scl,sda=self.__sda,freq=freq)
+        else: self.bus=SoftI2C(self.__scl,self.__sda,freq=freq)
+        self.freq=freq
+        self.instrument(self.instrumented)
+    
+    def instrument(self,on=True):
+        """ counts transactions, bytes, errors and latency per address into
+        self.stats. off binds the backend directly again, so it costs nothing
+        * on (`bool`): enable
+        """
+        if on:
+            if self.stats==None: self.stats=NosI2CStats()
+            self.readfrom_mem=self.__t_readfrom_mem
+            self.readfrom_mem_into=self.__t_readfrom_mem_into
+            self.writeto_mem=self.__t_writeto_mem
+            self.readfrom=self.__t_readfrom
+            self.readfrom_into=self.__t_readfrom_into
+            self.writeto=self.__t_writeto
+        else:
+            # bound straight to the backend so calls cost no extra python frame
+            b=self.bus
+            self.readfrom_mem=b.readfrom_mem
+            self.readfrom_mem_into=b.readfrom_mem_into
+            self.writeto_mem=b.writeto_mem
+            self.readfrom=b.readfrom
+            self.readfrom_into=b.readfrom_into
+            self.writeto=b.writeto
+        self.instrumented=on
+    
+    def __err(self,addr):
+        self.stats.errors[addr]+=1
+    
+    def __t_readfrom_mem(self,addr,reg,nbytes):
+        t=time.ticks_us()
+        try: r=self.bus.readfrom_mem(addr,reg,nbytes)
+        except OSError:
+            self.__err(addr)
+            raise
+        self.stats.add(addr,nbytes,time.ticks_diff(time.ticks_us(),t))
+        return r
+    def __t_readfrom_mem_into(self,addr,reg,buf):
+        t=time.ticks_us()
+        try: self.bus.readfrom_mem_into(addr,reg,buf)
+        except OSError:
+            self.__err(addr)
+            raise
+        self.stats.add(addr,nbytes(buf),time.ticks_diff(time.ticks_us(),t))
+    def __t_writeto_mem(self,addr,reg,data):
+        t=time.ticks_us()
+        try: self.bus.writeto_mem(addr,reg,data)
+        except OSError:
+            self.__err(addr)
+            raise
+        self.stats.add(addr,nbytes(data),time.ticks_diff(time.ticks_us(),t))
+    def __t_readfrom(self,addr,nbytes):
+        t=time.ticks_us()
+        try: r=self.bus.readfrom(addr,nbytes)
+        except OSError:
+            self.__err(addr)
+            raise
+        self.stats.add(addr,nbytes,time.ticks_diff(time.ticks_us(),t))
+        return r
+    def __t_readfrom_into(self,addr,buf):
+        t=time.ticks_us()
+        try: self.bus.readfrom_into(addr,buf)
+        except OSError:
+            self.__err(addr)
+            raise
+        self.stats.add(addr,nbytes(buf),time.ticks_diff(time.ticks_us(),t))
+    def __t_writeto(self,addr,data):
+        t=time.ticks_us()
+        try: r=self.bus.writeto(addr,data)
+        except OSError:
+            self.__err(addr)
+            raise
+        self.stats.add(addr,nbytes(data),time.ticks_diff(time.ticks_us(),t))
+        return r
+    
+    def __getattr__(self,name):
+        """ anything else (start, stop, write, ..) comes from the backend """
+        if name=='bus': raise AttributeError(name)
+        return getattr(self.bus,name)
+    
+    @property
+    def hardware(self):
+        """ true when running on a machine.I2C block """
+        return self.id!=None
+    
+    def negotiate(self,checks,freqs=(100000,400000,1000000),tries=3):
+        """ keeps the fastest freq whose verification reads match the slowest's.
+        returns the chosen freq. the checks must read something that doesn't
+        change, a read without a register on most parts comes from an auto
+        incrementing pointer and differs every time
+        * checks (`list`) : (addr,reg,nbytes) of static registers such as
+        WHO_AM_I. reg None reads without a register, only for parts with a
+        single fixed byte like a mux control register
+        * freqs  (`tuple`): candidate frequencies
+        * tries  (`int`)  : reads per check at each freq
+        """
+        if not checks: raise ValueError("negotiate needs (addr,reg,nbytes) checks")
+        freqs=sorted(freqs)
+        self.__build(freqs[0])
+        ref=[self.__check(c) for c in checks]
+        best=freqs[0]
+        for f in freqs[1:]:
+            self.__build(f)
+            try:
+                ok=True
+                for _ in range(tries):
+                    for c,r in zip(checks,ref):
+                        if self.__check(c)!=r: ok=False
+            except OSError: ok=False
+            if not ok: break
+            best=f
+        if best!=self.freq: self.__build(best)
+        return best
+    
+    def __check(self,c):
+        addr,reg,n=c
+        if reg==None: return self.bus.readfrom(addr,n)
+        return self.bus.readfrom_mem(addr,reg,n)
     
     def write_reg(self,addr,reg,data):
         """ write data to register 
@@ -34,25 +257,37 @@ class NosI2C(SoftI2C):
         * nbytes (`int`): number of bytes to read  
         """
         return self.readfrom_mem(addr,reg,nbytes)   
+    
+    def read_reg_into(self,addr,reg,buf):
+        """ read len(buf) bytes from reg into buf. no allocation
+        * addr  (`int`)      : address of device
+        * reg   (`int`)      : register to read from
+        * buf   (`bytearray`): preallocated buffer or memoryview
+        """
+        self.readfrom_mem_into(addr,reg,buf)
      
     def scan(self):
         """ Prints detected addresses on the bus """
-        res=super().scan() 
+        res=self.bus.scan() 
         print("scanned addresses: %s" % ([hex(i) for i in res]))
         return res
          
 class NosI2CDevice:
     class INIT_ERROR(Exception):pass
+    class SHADOW_MISMATCH(Exception):pass
     def __init__(self,addr,**kwargs):
         """ NosI2CDevice. Just stores address. Can share i2c
         * scl (`int`)   : scl pin 
         * sda (`int`)   : sda pin 
         * i2c (`NosI2C`): i2c object. scl and sda ignored if provided
+        * channel (`int`): mux channel the device sits behind, if any. taken
+        from i2c when it is a TCA9548AChannel
         """
         self.addr=addr
         scl=kwargs.pop("scl",None)
         sda=kwargs.pop("sda",None)
         i2c=kwargs.pop("i2c",None)
+        self.channel=kwargs.pop("channel",getattr(i2c,"channel",None))
         if i2c: 
             self.i2c=i2c        
         else:
@@ -60,6 +295,10 @@ class NosI2CDevice:
                 self.i2c=NosI2C(scl,sda)
             else:
                 raise NosI2CDevice.INIT_ERROR
+        
+        # write-through copy of config registers. reg: value, None if unknown
+        self.shadow={}
+        self.shadow_check=False     # debug. read back every shadowed write
         self.init()
     def init(self):
         pass
@@ -71,5 +310,69 @@ class NosI2CDevice:
         """
         return self.i2c.readfrom_mem(self.addr,reg,nbytes)
     
+    def read_reg_into(self,reg,buf):
+        """ read len(buf) bytes from reg into buf. no allocation
+        * reg    (`int`)      : register to read from
+        * buf    (`bytearray`): preallocated buffer or memoryview
+        """
+        self.i2c.readfrom_mem_into(self.addr,reg,buf)
+    
+    def write_reg(self,reg,data):
+        """ writes one byte to reg. shadowed registers are written through
+        * reg  (`int`): register to write to
+        * data (`int`): 8 bit value
+        """
+        self.i2c.write_reg(self.addr,reg,data.to_bytes(1,'big'))
+        if reg in self.shadow:
+            self.shadow[reg]=data
+            if self.shadow_check: self.verify(reg)
+    
+    def shadow_regs(self,*regs):
+        """ keeps a shadow of regs. reads each once """
+        for reg in regs: self.shadow[reg]=None
+        self.sync()
+    
+    def read_shadow(self,reg):
+        """ shadowed value of reg. only touches the bus when invalidated """
+        v=self.shadow[reg]
+        if v==None:
+            v=self.read_reg(reg)[0]
+            self.shadow[reg]=v
+        return v
+    
+    def update_reg(self,reg,mask,value):
+        """ read-modify-write of a bitfield against the shadow. one write when
+        the bits change, no bus traffic when they don't
+        * reg   (`int`): shadowed register
+        * mask  (`int`): bits to change
+        * value (`int`): new bits, already shifted into place
+        """
+        old=self.read_shadow(reg)
+        new=(old&~mask)|(value&mask)
+        if new!=old: self.write_reg(reg,new)
+        return new
+    
+    def sync(self):
+        """ rereads every shadowed register from the device """
+        for reg in self.shadow:
+            self.shadow[reg]=self.read_reg(reg)[0]
+    
+    def invalidate(self,reg=None):
+        """ forgets shadowed values so the next access rereads them
+        * reg (`int`): one register. all when None
+        """
+        if reg!=None: self.shadow[reg]=None
+        else:
+            for r in self.shadow: self.shadow[r]=None
+    
+    def verify(self,reg=None):
+        """ checks the shadow against the device. raises SHADOW_MISMATCH
+        * reg (`int`): one register. all when None
+        """
+        for r in ([reg] if reg!=None else self.shadow):
+            v=self.read_reg(r)[0]
+            if self.shadow[r]!=None and self.shadow[r]!=v:
+                raise self.SHADOW_MISMATCH("reg %d: shadow 0x%02x device 0x%02x" % (r,self.shadow[r],v))
+    
     
 
@@ -0,0 +1,329 @@
+#===================================================================
+# file: recorder.py
+# desc: ring buffer of raw samples, flushed to flash in whole blocks
+#       and replayed through UDP_STREAM once the link is back
+# dev : nos
+#===================================================================
+# <path>.dat
+#   file header, padded to one block so data blocks stay aligned
+#     magic    4s  b'NREC'
+#     version  B
+#     fmt len  B
+#     rec size H   bytes per record
+#     block    H   bytes per block
+#     blocks   H   blocks kept before the file wraps
+#     fmt          struct format of one sample
+#   data blocks, block n of the file holds sequence number seq%blocks
+#     seq      I   block sequence number, counts up from 0
+#     t0       I   ticks_us of the first record
+#     t1       I   ticks_us of the last record
+#     count    H   records in this block
+#     pad      2x
+#     records  count * (t I | sample packed with fmt), then padding
+# <path>.idx
+#   one 16 byte entry per data block, a copy of its block header. read on
+#   open to resume without scanning the data file, rebuilt from the data
+#   file when it is missing
+#===================================================================
+import struct
+import time
+from nos.util.stream_format import HEADER, HEADER_SIZE, MAGIC as FRAME_MAGIC, VERSION as FRAME_VERSION, FLAG_REPLAY
+import nos.util.store as store
+
+MAGIC       = b'NREC'
+VERSION     = 1
+FILE_HEADER = '<4sBBHHH'
+BLOCK_HDR   = '<IIIH2x'
+BLOCK_SIZE  = struct.calcsize(BLOCK_HDR)
+
+class RECORDER_ERROR(Exception):pass
+
+class Recorder:
+    def __init__(self,fmt,path=None,block=4096,slots=4,blocks=256,stream_id=0,mtu=1400):
+        """ records samples into a ring of block sized slots. full slots are
+        written to flash with one aligned write each by flush()
+        * fmt       (`str`): struct format of one sample, e.g. '<7h'
+        * path      (`str`): log file prefix. None keeps the backlog in ram only
+        * block     (`int`): bytes per block. match the flash erase size
+        * slots     (`int`): blocks held in ram
+        * blocks    (`int`): blocks kept on flash before the oldest is overwritten
+        * stream_id (`int`): stream id of replayed frames
+        * mtu       (`int`): replay datagram size budget
+        """
+        self.fmt=fmt
+        self.size=struct.calcsize(fmt)
+        self.rec=4+self.size
+        self.block=block
+        self.per=(block-BLOCK_SIZE)//self.rec
+        if self.per<1: raise RECORDER_ERROR("block too small for one record")
+        self.slots=slots
+        self.blocks=blocks
+        self.path=path
+        self.ring=bytearray(slots*block)
+        self.mv=memoryview(self.ring)
+        self.seq=0          # block being filled
+        self.n=0            # records in it
+        self.flushed=0      # next block to write to flash
+        self.sent=0         # next block to replay
+        self.dropped=0      # records overwritten before reaching flash
+        self.stalls=0       # flushes that found the ring full
+        self.flush_us_max=0
+        # replay
+        self.stream_id=stream_id
+        self.fmt_b=fmt.encode()
+        self.off=HEADER_SIZE+len(self.fmt_b)
+        self.per_frame=max(1,min(self.per,(mtu-self.off)//self.size))
+        self.frame=bytearray(self.off+self.per_frame*self.size)
+        self.frame[HEADER_SIZE:self.off]=self.fmt_b
+        self.fseq=0
+        self.__pos=0        # record within the block being replayed
+        self.__rd=bytearray(block) if path else None
+        self.__ram_low=0    # first block the ring holds since open
+        if path: self.__open()
+
+    def __key(self):
+        return "rec_%s" % self.path.replace('/','_')
+
+    def __open(self):
+        """ opens or creates the log files and resumes after the last block """
+        head=struct.pack(FILE_HEADER,MAGIC,VERSION,len(self.fmt_b),self.rec,self.block,self.blocks)+self.fmt_b
+        new=False
+        try: self.fp=open(self.path+'.dat','r+b')
+        except OSError:
+            self.fp=open(self.path+'.dat','wb')
+            self.fp.write(head)
+            self.fp.write(bytes(self.block-len(head)))
+            self.fp.close()
+            self.fp=open(self.path+'.dat','r+b')
+            new=True
+        old=self.fp.read(len(head))
+        if old!=head: raise RECORDER_ERROR("%s.dat has another layout" % self.path)
+        if new: idx=self.__reindex()
+        else:
+            try:
+                self.ip=open(self.path+'.idx','r+b')
+                idx=self.ip.read()
+            except OSError: idx=self.__reindex()
+        last=-1
+        for o in range(0,len(idx)-BLOCK_SIZE+1,BLOCK_SIZE):
+            seq,t0,t1,n=struct.unpack_from(BLOCK_HDR,idx,o)
+            if n and seq>last: last=seq
+        # the ring starts empty, blocks before this one come from flash
+        self.seq=self.flushed=self.__ram_low=last+1
+        c=store.load(self.__key(),'<I')
+        self.sent=min(c[0],self.flushed) if c else self.flushed
+
+    def __reindex(self):
+        """ rebuilds <path>.idx from the block headers in <path>.dat
+        return (`bytes`): the index
+        """
+        self.ip=open(self.path+'.idx','wb')
+        hdr=bytearray(BLOCK_SIZE)
+        for k in range(self.blocks):
+            self.fp.seek((1+k)*self.block)
+            if self.fp.readinto(hdr)!=BLOCK_SIZE: break
+            self.ip.write(hdr)
+        self.ip.close()
+        self.ip=open(self.path+'.idx','r+b')
+        return self.ip.read()
+
+    def add(self,sample,t):
+        """ records one sample. returns true when a block is ready to flush
+        * sample (`tuple`): values for fmt
+        * t      (`int`)  : ticks_us of the sample
+        """
+        o=(self.seq%self.slots)*self.block+BLOCK_SIZE+self.n*self.rec
+        struct.pack_into('<I',self.ring,o,t)
+        struct.pack_into(self.fmt,self.ring,o+4,*sample)
+        self.n+=1
+        if self.n<self.per: return False
+        self.__close()
+        return True
+
+    def add_raw(self,data,t):
+        """ records one sample that is already packed with fmt
+        * data (`buffer`): size bytes
+        * t    (`int`)   : ticks_us of the sample
+        """
+        o=(self.seq%self.slots)*self.block+BLOCK_SIZE+self.n*self.rec
+        struct.pack_into('<I',self.ring,o,t)
+        self.ring[o+4:o+self.rec]=data
+        self.n+=1
+        if self.n<self.per: return False
+        self.__close()
+        return True
+
+    def __close(self):
+        """ seals the current slot and moves to the next. the oldest unflushed
+        block is dropped when the ring is full
+        """
+        s=self.seq%self.slots
+        o=s*self.block
+        n=self.n
+        t0=struct.unpack_from('<I',self.ring,o+BLOCK_SIZE)[0]
+        t1=struct.unpack_from('<I',self.ring,o+BLOCK_SIZE+(n-1)*self.rec)[0]
+        struct.pack_into(BLOCK_HDR,self.ring,o,self.seq,t0,t1,n)
+        self.seq+=1
+        self.n=0
+        low=self.seq-self.slots+1           # oldest block still in the ring
+        if self.path and self.flushed<low:
+            self.dropped+=(low-self.flushed)*self.per
+            self.flushed=low
+        if self.sent<self.low(): self.sent=self.low()
+
+    def seal(self):
+        """ closes a partly filled block so it can be flushed and replayed """
+        if self.n: self.__close()
+
+    def low(self):
+        """ oldest block still available for replay """
+        ram=max(0,self.seq-self.slots+1)
+        if not self.path: return ram
+        return min(ram,max(0,self.flushed-self.blocks))
+
+    @property
+    def pending(self):
+        """ closed blocks waiting for flash """
+        return self.seq-self.flushed if self.path else 0
+
+    @property
+    def backlog(self):
+        """ closed blocks not replayed yet """
+        return self.seq-self.sent
+
+    def flush(self):
+        """ writes every closed block to flash, one block sized write each,
+        and their index entries. call it outside time critical sections
+        return (`int`): blocks written
+        """
+        if not self.path: return 0
+        if self.pending>=self.slots-1: self.stalls+=1
+        t=time.ticks_us()
+        n=0
+        while self.flushed<self.seq:
+            s=self.flushed
+            o=(s%self.slots)*self.block
+            self.fp.seek((1+s%self.blocks)*self.block)
+            self.fp.write(self.mv[o:o+self.block])
+            self.ip.seek((s%self.blocks)*BLOCK_SIZE)
+            self.ip.write(self.mv[o:o+BLOCK_SIZE])
+            self.flushed+=1
+            n+=1
+        if n:
+            self.fp.flush()
+            self.ip.flush()
+            d=time.ticks_diff(time.ticks_us(),t)
+            if d>self.flush_us_max: self.flush_us_max=d
+        return n
+
+    def __block(self,s):
+        """ memoryview of block s from the ring or flash """
+        if s>=max(self.__ram_low,self.seq-self.slots+1):
+            o=(s%self.slots)*self.block
+            return self.mv[o:o+self.block]
+        self.fp.seek((1+s%self.blocks)*self.block)
+        self.fp.readinto(self.__rd)
+        return memoryview(self.__rd)
+
+    def skip(self):
+        """ marks the backlog as delivered, e.g. while streaming live """
+        self.sent=self.seq
+        self.__pos=0
+
+    def next_frame(self):
+        """ builds the next replay datagram from the backlog
+        return (`memoryview`): stream_format frame flagged FLAG_REPLAY, or None
+        once caught up
+        """
+        if self.sent<self.low():
+            self.sent=self.low()
+            self.__pos=0
+        while True:
+            if self.sent>=self.seq: return None
+            b=self.__block(self.sent)
+            seq,t0,t1,n=struct.unpack_from(BLOCK_HDR,b,0)
+            if seq==self.sent and n>0: break
+            self.sent+=1                # overwritten or never written
+            self.__pos=0
+        i=self.__pos
+        k=min(self.per_frame,n-i)
+        rec=self.rec
+        o=BLOCK_SIZE+i*rec
+        ta=struct.unpack_from('<I',b,o)[0]
+        tb=struct.unpack_from('<I',b,o+(k-1)*rec)[0]
+        for j in range(k):
+            p=o+j*rec+4
+            d=self.off+j*self.size
+            self.frame[d:d+self.size]=b[p:p+self.size]
+        period=time.ticks_diff(tb,ta)//(k-1) if k>1 else 0
+        struct.pack_into(HEADER,self.frame,0,FRAME_MAGIC,FRAME_VERSION,FLAG_REPLAY,
+                         self.stream_id,len(self.fmt_b),k,self.fseq,ta,period)
+        self.fseq=(self.fseq+1)&0xffffffff
+        self.__pos=i+k
+        if self.__pos>=n:
+            self.sent+=1
+            self.__pos=0
+        return memoryview(self.frame)[:self.off+k*self.size]
+
+    def replay_some(self,send,budget):
+        """ sends backlog frames until about budget bytes went out
+        * send   (`callable`): takes one datagram, e.g. UDP_STREAM.send
+        * budget (`int`)     : bytes
+        return (`int`): bytes sent
+        """
+        sent=0
+        while sent<budget:
+            f=self.next_frame()
+            if f==None: break
+            send(f)
+            sent+=len(f)
+        return sent
+
+    async def replay(self,send,kbps=64,period_ms=20):
+        """ replays the backlog at about kbps kbit/s, then returns
+        * send      (`callable`): takes one datagram
+        * kbps      (`int`)     : bandwidth cap
+        * period_ms (`int`)     : send interval
+        """
+        try: import asyncio
+        except ImportError: import uasyncio as asyncio  #type: ignore
+        budget=max(1,kbps*period_ms//8)
+        carry=0
+        while self.backlog:
+            carry+=budget
+            carry-=self.replay_some(send,carry)
+            await asyncio.sleep_ms(period_ms)
+        self.save_cursor()
+
+    def save_cursor(self):
+        """ remembers the replay position across reboots """
+        if self.path: store.save(self.__key(),'<I',self.sent)
+
+    def close(self):
+        self.seal()
+        self.flush()
+        self.save_cursor()
+        if self.path:
+            self.fp.close()
+            self.ip.close()
+
+
+if __name__=="__main__":
+    from array import array
+    from nos.sensors.MPU6050 import MPU6050
+    mpu=MPU6050(0x68,scl=5,sda=4)
+    raw=array('h',[0]*MPU6050.RAW_LEN)
+    rec=Recorder('<7h',path='imu',block=4096,slots=4,blocks=128)
+    t0=time.ticks_ms()
+    while time.ticks_diff(time.ticks_ms(),t0)<5000:
+        mpu.read_raw_into(raw)
+        if rec.add_raw(raw,time.ticks_us()): rec.flush()
+        time.sleep_ms(1)
+    print("blocks %d dropped %d stalls %d flush max %d us" % (rec.seq,rec.dropped,rec.stalls,rec.flush_us_max))
+    rec.close()
+
+    # replay when the link is back
+    # from nos.util.udp_stream import UDP_STREAM
+    # udp=UDP_STREAM(hook=lambda:None)
+    # while not udp.connected: udp.poll_ctrl(100)
+    # asyncio.run(rec.replay(udp.send,kbps=128))
@@ -0,0 +1,45 @@
+#===================================================================
+# file: store.py
+# desc: small struct packed records kept on flash
+# dev : nos
+#===================================================================
+import struct
+import os
+
+MAGIC  = b'NOS1'
+PREFIX = ''         # directory for record files. '' is the cwd
+
+def _path(name):
+    return "%s%s.bin" % (PREFIX,name)
+
+def save(name,fmt,*values):
+    """ packs values with struct fmt and writes them as one record
+    * name (`str`): record name
+    * fmt  (`str`): struct format, stored with the record
+    """
+    f=fmt.encode()
+    with open(_path(name),'wb') as fp:
+        fp.write(MAGIC)
+        fp.write(bytes((len(f),)))
+        fp.write(f)
+        fp.write(struct.pack(fmt,*values))
+
+def load(name,fmt):
+    """ values saved under name, or None if missing, truncated, corrupt or
+    saved with another fmt
+    * name (`str`): record name
+    * fmt  (`str`): struct format the record must match
+    """
+    try:
+        with open(_path(name),'rb') as fp: d=fp.read()
+    except OSError: return None
+    f=fmt.encode()
+    n=len(f)
+    if len(d)<5+n or d[:4]!=MAGIC or d[4]!=n or d[5:5+n]!=f: return None
+    try: return struct.unpack(fmt,d[5+n:])
+    except Exception: return None
+
+def remove(name):
+    """ deletes a record. missing records are ignored """
+    try: os.remove(_path(name))
+    except OSError: pass
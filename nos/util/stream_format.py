@@ -0,0 +1,91 @@
+#===================================================================
+# file: stream_format.py
+# desc: binary frame layout for UDP_STREAM. shared by device and host
+# dev : nos
+#===================================================================
+# frame = header | fmt | count samples packed with fmt
+#   magic     2s  b'NS'
+#   version   B
+#   flags     B   FLAG_DELTA payload is delta coded, see nos.util.delta
+#                 FLAG_KEY   first sample holds absolute values
+#                 FLAG_REPLAY recorded backlog, see nos.util.recorder
+#   stream id B
+#   fmt len   B
+#   count     H   samples in this frame
+#   seq       I   frame number per stream
+#   t0        I   device ticks_us of the first sample. wraps like ticks_us
+#   period    I   mean µs between samples, 0 for a single sample
+#===================================================================
+import struct
+try: from time import ticks_diff
+except ImportError: ticks_diff=lambda a,b: a-b     # host
+
+MAGIC       = b'NS'
+VERSION     = 1
+HEADER      = '<2sBBBBHIII'
+HEADER_SIZE = struct.calcsize(HEADER)
+FLAG_DELTA  = 0x01
+FLAG_KEY    = 0x02
+FLAG_REPLAY = 0x04
+
+class FORMAT_ERROR(Exception):pass
+
+def unpack_header(buf):
+    """ parses a frame header
+    return (`tuple`): flags,stream_id,fmt,count,seq,t0,period,payload offset
+    """
+    if len(buf)<HEADER_SIZE: raise FORMAT_ERROR("short frame")
+    magic,ver,flags,sid,flen,count,seq,t0,period=struct.unpack_from(HEADER,buf,0)
+    if magic!=MAGIC or ver!=VERSION: raise FORMAT_ERROR("not a stream frame")
+    o=HEADER_SIZE+flen
+    fmt=bytes(buf[HEADER_SIZE:o]).decode()
+    return flags,sid,fmt,count,seq,t0,period,o
+
+class FrameBuilder:
+    def __init__(self,fmt,stream_id=0,batch=1,mtu=1400):
+        """ batches struct packed samples into one reusable datagram buffer
+        * fmt       (`str`): struct format of one sample, e.g. '<7h'
+        * stream_id (`int`): 0-255
+        * batch     (`int`): samples per frame, capped by mtu
+        * mtu       (`int`): datagram size budget in bytes
+        """
+        self.fmt=fmt
+        self.stream_id=stream_id
+        self.size=struct.calcsize(fmt)
+        self.off=HEADER_SIZE+len(fmt)
+        self.cap=max(1,min(batch,(mtu-self.off)//self.size))
+        self.buf=bytearray(self.off+self.cap*self.size)
+        self.mv=memoryview(self.buf)
+        self.buf[HEADER_SIZE:self.off]=fmt.encode()
+        self.flags=0
+        self.seq=0
+        self.n=0
+        self.t0=0
+        self.t1=0
+
+    def add(self,sample,t):
+        """ packs one sample. returns true once the frame is full
+        * sample (`tuple`): values for fmt
+        * t      (`int`)  : ticks_us of the sample
+        """
+        if self.n==0: self.t0=t
+        self.t1=t
+        struct.pack_into(self.fmt,self.buf,self.off+self.n*self.size,*sample)
+        self.n+=1
+        return self.n>=self.cap
+
+    def frame(self):
+        """ closes the frame. returns a memoryview of the datagram, valid until
+        the next add
+        """
+        n=self.n
+        period=ticks_diff(self.t1,self.t0)//(n-1) if n>1 else 0
+        struct.pack_into(HEADER,self.buf,0,MAGIC,VERSION,self.flags,self.stream_id,
+                         len(self.fmt),n,self.seq,self.t0,period)
+        self.seq=(self.seq+1)&0xffffffff
+        self.n=0
+        return self.mv[:self.off+n*self.size]
+
+    def reset(self):
+        """ drops a partial frame """
+        self.n=0
@@ -0,0 +1,178 @@
+#===================================================================
+# file: timing.py
+# desc: deadlines, condition waits, rate limiting and periodic ticks
+#       on ticks_ms/ticks_us. wrap safe as long as a span stays under
+#       half the ticks period
+# dev : nos
+#===================================================================
+import time
+try: import asyncio
+except ImportError: import uasyncio as asyncio  #type: ignore
+
+class Deadline:
+    def __init__(self,ms):
+        """ a point ms from now
+        * ms (`int`): timeout, None never expires
+        """
+        self.reset(ms)
+
+    def reset(self,ms=-1):
+        """ restarts from now. keeps the timeout unless given """
+        if ms!=-1: self.ms=ms
+        self.t0=time.ticks_ms()
+
+    def elapsed_ms(self):
+        return time.ticks_diff(time.ticks_ms(),self.t0)
+
+    def remaining_ms(self):
+        """ ms left, 0 once expired, None without timeout """
+        if self.ms==None: return None
+        return max(0,self.ms-self.elapsed_ms())
+
+    def expired(self):
+        return self.ms!=None and self.elapsed_ms()>=self.ms
+
+def wait_until(fn,timeout_ms=None,poll_ms=10):
+    """ calls fn every poll_ms, sleeping in between, until it returns true
+    * fn         (`callable`): condition
+    * timeout_ms (`int`)     : give up after this long. None waits forever
+    * poll_ms    (`int`)     : sleep between checks
+    return (`bool`): true if fn did, false on timeout
+    """
+    d=Deadline(timeout_ms)
+    while True:
+        if fn(): return True
+        r=d.remaining_ms()
+        if r==0: return False
+        time.sleep_ms(poll_ms if r==None else min(poll_ms,r))
+
+async def await_until(fn,timeout_ms=None,poll_ms=10):
+    """ wait_until that yields to other tasks between checks """
+    d=Deadline(timeout_ms)
+    while True:
+        if fn(): return True
+        r=d.remaining_ms()
+        if r==0: return False
+        await asyncio.sleep_ms(poll_ms if r==None else min(poll_ms,r))
+
+class TokenBucket:
+    def __init__(self,rate,burst=None):
+        """ allows rate units per second on average, burst at once
+        * rate  (`number`): units per second, e.g. bytes or messages
+        * burst (`number`): bucket size, rate by default
+        """
+        self.rate=rate
+        self.burst=rate if burst==None else burst
+        self.tokens=self.burst
+        self.t=time.ticks_us()
+
+    def __refill(self):
+        now=time.ticks_us()
+        self.tokens=min(self.burst,self.tokens+time.ticks_diff(now,self.t)*self.rate/1000000)
+        self.t=now
+
+    def take(self,n=1):
+        """ takes n tokens if there are enough
+        return (`bool`): true if taken
+        """
+        self.__refill()
+        if self.tokens<n: return False
+        self.tokens-=n
+        return True
+
+    def delay_ms(self,n=1):
+        """ ms until n tokens are available """
+        self.__refill()
+        if self.tokens>=n: return 0
+        return int((n-self.tokens)*1000/self.rate)+1
+
+    async def wait(self,n=1):
+        """ yields until n tokens could be taken, then takes them """
+        while not self.take(n): await asyncio.sleep_ms(self.delay_ms(n))
+
+class Ticker:
+    def __init__(self,hz):
+        """ periodic deadlines. wait() returns at each one. fractional periods
+        carry over so the long run rate is exact. a tick that starts more than
+        a period late skips the deadlines it missed instead of bursting
+        * hz (`number`): tick rate
+        """
+        self.hz=hz
+        self.reset()
+
+    @property
+    def hz(self):
+        return 1000000/self.period
+
+    @hz.setter
+    def hz(self,hz):
+        self.period=1000000/hz
+
+    def reset(self):
+        """ clears the stats and restarts the schedule from now """
+        self.ticks=0
+        self.overruns=0         # deadlines skipped
+        self.late_us_max=0
+        self.__late_us=0
+        self.t0=time.ticks_us()
+        self.restart()
+
+    def restart(self):
+        """ next deadline is now, e.g. after idling. keeps the stats """
+        self.next=time.ticks_us()
+        self.__frac=0
+
+    def remaining_us(self):
+        """ µs to the next deadline, negative when late """
+        return time.ticks_diff(self.next,time.ticks_us())
+
+    def book(self,t):
+        """ counts a tick that started at t and moves to the next deadline """
+        late=time.ticks_diff(t,self.next)
+        if late>0:
+            self.__late_us+=late
+            if late>self.late_us_max: self.late_us_max=late
+        self.ticks+=1
+        p=self.period
+        self.__frac+=p
+        step=int(self.__frac)
+        self.__frac-=step
+        self.next=time.ticks_add(self.next,step)
+        behind=time.ticks_diff(t,self.next)
+        if behind>p:
+            n=int(behind//p)
+            self.overruns+=n
+            self.next=time.ticks_add(self.next,int(n*p))
+
+    def wait(self):
+        """ sleeps until the next deadline and books the tick
+        return (`int`): ticks_us at wake up
+        """
+        d=self.remaining_us()
+        if d>0: time.sleep_us(d)
+        t=time.ticks_us()
+        self.book(t)
+        return t
+
+    async def wait_async(self):
+        """ wait() that yields to other tasks. ms sleeps, then a yield loop for
+        the last part
+        """
+        while True:
+            d=self.remaining_us()
+            if d<=0: break
+            await asyncio.sleep_ms(d//1000)     # 0 just yields
+        t=time.ticks_us()
+        self.book(t)
+        return t
+
+    def stats(self):
+        """ achieved rate and lateness against the deadlines """
+        s=time.ticks_diff(time.ticks_us(),self.t0)/1000000
+        return {
+            'ticks'         : self.ticks,
+            'rate'          : self.ticks/s if s>0 else 0,
+            'late_us_avg'   : self.__late_us/self.ticks if self.ticks else 0,
+            'late_us_max'   : self.late_us_max,
+            'overruns'      : self.overruns,
+        }
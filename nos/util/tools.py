@@ -3,16 +3,17 @@
 # desc: some common helpers 
 # dev : nos
 #===================================================================
-import time
+from nos.util.timing import wait_until
 
 class CTO_TIMEOUT(Exception): pass
 
 def isClass(c):
     return type(CTO_TIMEOUT)==type(c)
-def ConditionTimeout(fn,to=5.0,exception=None):
-    start = time.time()
-    while time.time() - start <= to:
-        if fn(): return True
+def ConditionTimeout(fn,to=5.0,exception=None,poll_ms=1):
+    """ true once fn() is, false or exception after to seconds. sleeps poll_ms
+    between checks, see nos.util.timing for the async version
+    """
+    if wait_until(fn,int(to*1000),poll_ms): return True
         
     if exception==None: return False
     
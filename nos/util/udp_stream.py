@@ -4,55 +4,289 @@
 # dev : nos
 #===================================================================
 import socket
+import select
 import machine      #type: ignore
 import errno
 import time
+import json
+import math
+from nos.util.stream_format import FrameBuilder
+from nos.util.timing import Ticker
+try: import asyncio
+except ImportError: import uasyncio as asyncio  #type: ignore
+
+MAX_RATE = 10000    # Hz a client can ask for
+
+class StreamGroup:
+    def __init__(self,rate,topics,frame=None):
+        """ clients sharing a rate and topic set. encoded once per tick
+        * rate   (`number`)      : Hz. 0 follows every tick
+        * topics (`tuple`)       : topic names, None for everything
+        * frame  (`FrameBuilder`): batch for binary mode
+        """
+        self.rate=rate
+        self.topics=topics
+        self.frame=frame
+        self.members=[]
+        self.next=time.ticks_us()
+        
+    def due(self,t):
+        """ true when a message is due at ticks_us t. decimates on absolute
+        deadlines so the long run rate is the requested one
+        """
+        if not self.rate: return True
+        if time.ticks_diff(t,self.next)<0: return False
+        p=int(1000000/self.rate)
+        self.next=time.ticks_add(self.next,p)
+        if time.ticks_diff(t,self.next)>=0: self.next=time.ticks_add(t,p)  # stalled
+        return True
 
 class UDP_STREAM:
-    def __init__(self,host='0.0.0.0',port=65000,hook=lambda:"",hz=None):
-        self.connected=[]
+    def __init__(self,host='0.0.0.0',port=65000,hook=lambda:"",hz=None,
+                 fmt=None,stream_id=0,batch=1,mtu=1400,timeout_ms=None,
+                 codec=None,keyframe=100):
+        """ streams hook() to subscribed clients. control messages:
+        * `start [rate] [topic,topic]`: subscribe. rate in Hz up to MAX_RATE, none
+        for every tick. a bad rate or topic list is answered with `error <reason>`
+        * `stop`: unsubscribe
+        * `once`: one message right away
+        * `ping`: keepalive. any message counts
+        
+        args:
+        * host       (`str`)     : address to bind
+        * port       (`int`)     : port to bind
+        * hook       (`callable`): returns the message for one tick. a dict is sent
+        as json, filtered by the client's topics. with fmt, the sample values as
+        a tuple. None skips the tick
+        * hz         (`number`)  : tick rate. None runs as fast as possible
+        * fmt        (`str`)     : struct format of a sample. enables binary frames,
+        see nos.util.stream_format. topics don't apply
+        * stream_id  (`int`)     : binary frame stream id
+        * batch      (`int`)     : samples per binary datagram
+        * mtu        (`int`)     : binary datagram size budget
+        * timeout_ms (`int`)     : drop clients silent for this long. None keeps them
+        * codec      (`str`)     : 'delta' delta/varint codes binary frames, see
+        nos.util.delta. integer fmts only
+        * keyframe   (`int`)     : samples between delta keys
+        """
+        self.clients={}     # addr: [group, last heard ticks_ms]
+        self.groups={}      # (rate,topics): StreamGroup
         self.host=host
         self.port=port
         self.hook=hook
+        self.ticker=Ticker(hz or 1)
         self.hz=hz
+        self.timeout_ms=timeout_ms
         self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp.bind((host, port))
         self.udp.setblocking(False)
+        self.poller = select.poll()
+        self.poller.register(self.udp,select.POLLIN)
+        self.running=False
+        self.reset_stats()
+        self.__expired=time.ticks_ms()
         
-        print("UDP server @%s:%s" % (host,port))
+        # binary mode. groups get their own batch, once a single sample frame
+        self.fmt=fmt
+        self.__frame_args=(fmt,stream_id,batch,mtu)
+        self.codec=codec
+        self.keyframe=keyframe
+        if fmt: self.__once=FrameBuilder(fmt,stream_id,1,mtu)
         
-    def __msg(self):
-        msg=self.hook()
+        print("UDP server @%s:%s" % (host,port))
+    
+    @property
+    def hz(self):
+        """ tick rate, None for as fast as possible. setting it retimes the ticker """
+        return self.__hz
+
+    @hz.setter
+    def hz(self,hz):
+        self.__hz=hz
+        self.ticker.hz=hz or 1
+
+    @property
+    def dropped(self):
+        """ deadlines skipped after a stall """
+        return self.ticker.overruns
+
+    @property
+    def late_us_max(self):
+        return self.ticker.late_us_max
+
+    @property
+    def connected(self):
+        """ subscribed client addresses """
+        return list(self.clients)
+    
+    def __encode(self,msg,topics=None):
         if msg==None: return
+        if type(msg)==dict:
+            if topics: msg={k:msg[k] for k in topics if k in msg}
+            msg=json.dumps(msg)
         try: msg.decode('utf-8')
         except: msg=msg.encode('utf-8')
         return msg
-    def start(self):
-        while True:
+    
+    def __handle(self,msg,addr):
+        print("%s --> %s" % (addr[0],msg))
+        c=self.clients.get(addr)
+        if c: c[1]=time.ticks_ms()
+        args=msg.split()
+        if len(args)==0: return
+        cmd=args[0]
+        if cmd==b'start':
             try:
-                msg,addr=self.udp.recvfrom(1024)
-                print("%s --> %s" % (addr[0],msg))
-                if msg==b'start':
-                    if addr in self.connected: pass   # already in
-                    else: self.connected.append(addr)
-                elif msg==b'stop':
-                    if addr in self.connected:
-                        self.connected.remove(addr)
-                elif msg==b'once':
-                    if addr in self.connected: continue
-                    else: self.udp.sendto(self.__msg(), addr)
-                        
-                    
-                        
+                rate=0
+                if len(args)>1:
+                    rate=float(args[1])
+                    if not math.isfinite(rate) or rate<=0: raise ValueError("rate must be a positive number")
+                topics=tuple(sorted(args[2].decode().split(','))) if len(args)>2 else None
+            except (ValueError,UnicodeError) as e:
+                self.udp.sendto(("error %s" % e).encode(), addr)
+                return
+            self.subscribe(addr,min(rate,MAX_RATE),topics)
+        elif cmd==b'stop':
+            self.unsubscribe(addr)
+        elif cmd==b'once':
+            msg=self.__single(c[0].topics if c else None)
+            if msg!=None: self.udp.sendto(msg, addr)
+    
+    def subscribe(self,addr,rate=0,topics=None):
+        """ adds or moves a client
+        * addr   (`tuple`) : client address
+        * rate   (`number`): Hz. 0 for every tick
+        * topics (`tuple`) : topic names, None for everything
+        """
+        if not math.isfinite(rate) or rate<0: raise ValueError("bad rate %r" % rate)
+        self.unsubscribe(addr)
+        key=(rate,topics)
+        g=self.groups.get(key)
+        if g==None:
+            g=StreamGroup(rate,topics,self.__builder() if self.fmt else None)
+            self.groups[key]=g
+        g.members.append(addr)
+        self.clients[addr]=[g,time.ticks_ms()]
+    
+    def __builder(self):
+        if self.codec=='delta':
+            from nos.util.delta import DeltaFrameBuilder
+            return DeltaFrameBuilder(*self.__frame_args,keyframe=self.keyframe)
+        return FrameBuilder(*self.__frame_args)
+    
+    def unsubscribe(self,addr):
+        c=self.clients.pop(addr,None)
+        if c==None: return
+        g=c[0]
+        g.members.remove(addr)
+        if len(g.members)==0: del self.groups[(g.rate,g.topics)]
+    
+    def __expire(self):
+        """ drops clients that went quiet. checked once a second """
+        now=time.ticks_ms()
+        if self.timeout_ms==None or time.ticks_diff(now,self.__expired)<1000: return
+        self.__expired=now
+        for addr in [a for a,c in self.clients.items() if time.ticks_diff(now,c[1])>self.timeout_ms]:
+            print("%s timed out" % addr[0])
+            self.unsubscribe(addr)
+    
+    def __single(self,topics=None):
+        """ one message outside the tick, text or single sample frame """
+        if not self.fmt: return self.__encode(self.hook(),topics)
+        sample=self.hook()
+        if sample==None: return
+        self.__once.add(sample,time.ticks_us())
+        return self.__once.frame()
+    
+    def send(self,msg):
+        """ sends one prepared datagram to every subscribed client """
+        for c in self.clients: self.udp.sendto(msg, c)
+    
+    def poll_ctrl(self,timeout=0):
+        """ handles waiting control messages and expires quiet clients
+        * timeout (`int`): ms to wait for the first one
+        """
+        while self.poller.poll(timeout):
+            try: msg,addr=self.udp.recvfrom(1024)
             except OSError as e:
-                if e.errno==errno.EAGAIN: pass
-                else: raise Exception("aksjdlask")
-            
-            if len(self.connected)>0:
-                msg=self.__msg()
-                if self.hz: time.sleep(1/self.hz)
-                for c in self.connected:
-                    self.udp.sendto(msg, c)
+                if e.errno==errno.EAGAIN: break
+                raise
+            self.__handle(msg,addr)
+            timeout=0
+        self.__expire()
+    
+    def tick(self):
+        """ evaluates the hook once and sends it to every group that is due.
+        in binary mode the sample is batched per group and a datagram goes out
+        once its frame is full
+        """
+        self.ticks+=1
+        t=time.ticks_us()
+        sample=self.hook()
+        if sample==None: return
+        for g in self.groups.values():
+            if not g.due(t): continue
+            if self.fmt:
+                if not g.frame.add(sample,t): continue
+                msg=g.frame.frame()
+            else:
+                msg=self.__encode(sample,g.topics)
+            for c in g.members:
+                self.udp.sendto(msg, c)
+    
+    def reset_stats(self):
+        self.ticks=0
+        self.ticker.reset()
+        self.__t0=time.ticks_us()
+    
+    def stats(self):
+        """ achieved tick rate and lateness against the deadlines """
+        s=time.ticks_diff(time.ticks_us(),self.__t0)/1000000
+        t=self.ticker.stats()
+        return {
+            'ticks'         : self.ticks,
+            'rate'          : self.ticks/s if s>0 else 0,
+            'late_us_avg'   : t['late_us_avg'],
+            'late_us_max'   : t['late_us_max'],
+            'dropped'       : t['overruns'],
+        }
+    
+    def start(self,idle_ms=100):
+        """ blocking server loop
+        * idle_ms (`int`): control poll timeout while nobody is connected
+        """
+        self.running=True
+        self.reset_stats()
+        while self.running:
+            if len(self.clients)==0:
+                self.poll_ctrl(idle_ms)
+                self.ticker.restart()
+                continue
+            if self.hz: self.ticker.wait()
+            self.poll_ctrl()
+            self.tick()
+    
+    async def serve(self,idle_ms=100):
+        """ asyncio server. yields between ticks so sensor polling, led
+        rendering etc. keep running: asyncio.create_task(udp.serve())
+        * idle_ms (`int`): control poll period while nobody is connected
+        """
+        self.running=True
+        self.reset_stats()
+        while self.running:
+            if len(self.clients)==0:
+                self.poll_ctrl()
+                self.ticker.restart()
+                await asyncio.sleep_ms(idle_ms)
+                continue
+            if self.hz: await self.ticker.wait_async()
+            else: await asyncio.sleep_ms(0)
+            self.poll_ctrl()
+            self.tick()
+    
+    def stop(self):
+        """ ends start() or serve() after the current tick """
+        self.running=False
 
 
 if __name__ == "__main__":
@@ -63,13 +297,36 @@ if __name__ == "__main__":
     get_adc = lambda: str(round(scale*adc.read_u16(),3)).encode('utf-8')
     print({'v':123})
     
-    import nos.util.wifi as wifi
-    wifi.connect("NOSNET","handsome")
-    wifi.check()
+    from nos.util.wifi import WIFI
+    wifi=WIFI("NOSNET","handsome",static=True)
+    wifi.join()
     print(wifi.get_ipv4())
     
     
-    udp=UDP_STREAM(hook=get_adc)
+    udp=UDP_STREAM(hook=get_adc,hz=100)
     # udp.start()
     
+    # topics. dashboards send b'start 10 v', loggers b'start' for all at 100Hz
+    # udp=UDP_STREAM(hook=lambda:{'v':scale*adc.read_u16(),'t':time.ticks_ms()},hz=100,timeout_ms=10000)
+    
+    # binary. 1kHz mpu6050 raw counts, 50 samples per datagram
+    # from nos.sensors.MPU6050 import MPU6050
+    # from array import array
+    # mpu=MPU6050(0x68,scl=5,sda=4)
+    # raw=array('h',[0]*MPU6050.RAW_LEN)
+    # def sample():
+    #     mpu.read_raw_into(raw)
+    #     return raw
+    # udp=UDP_STREAM(hook=sample,hz=1000,fmt='<7h',batch=50)
+    # same with delta coding, roughly a third of the airtime for a still board
+    # udp=UDP_STREAM(hook=sample,hz=1000,fmt='<7h',batch=50,codec='delta')
+    
+    # or next to other tasks
+    # async def main():
+    #     asyncio.create_task(udp.serve())
+    #     while True:
+    #         await asyncio.sleep(5)
+    #         print(udp.stats())
+    # asyncio.run(main())
+    
     
@@ -6,14 +6,41 @@
 #   * rpi pico v2
 #===================================================================
 from nos.util.tools import CTO,CTO_TIMEOUT
+from nos.util.timing import wait_until, await_until
+import nos.util.store as store
 import network      #type: ignore
 import ubinascii    #type: ignore
+import time
+try: import asyncio
+except ImportError: import uasyncio as asyncio  #type: ignore
+
+CACHE     = "wifi"
+CACHE_FMT = '<32s6sBB4s4s4s4s'  # ssid, bssid, channel, has ip, ip, mask, gateway, dns
+
+def _ip(b):
+    return "%d.%d.%d.%d" % tuple(b)
+def _ipb(s):
+    return bytes(int(x) for x in s.split('.'))
 
 class WIFI(network.WLAN):
-    def __init__(self,ssid,pswd):
+    def __init__(self,ssid,pswd,static=False):
+        """ station interface
+        * ssid   (`str`) : network ssid
+        * pswd   (`str`) : password for network
+        * static (`bool`): reuse the cached dhcp lease as a static address on
+        the fast path, skipping dhcp
+        """
         self.ssid=ssid
         self.pswd=pswd
+        self.static=static
         super().__init__(network.STA_IF)
+        self.connect_ms=0       # last successful join
+        self.connects=0
+        self.fast_joins=0       # joins that used the cache
+        self.outages=0
+        self.outage_ms=0        # total
+        self.outage_ms_max=0
+        self.running=False
 
     def connect(self,**kwargs):
         """ attempts connection. no checking.
@@ -36,6 +63,155 @@ class WIFI(network.WLAN):
             print("failed to conenct")
             raise CTO_TIMEOUT
         
+    def load_cache(self):
+        """ last good association for this ssid
+        return (`tuple`): bssid or None if unknown, channel, ifconfig tuple or
+        None. None if none
+        """
+        c=store.load(CACHE,CACHE_FMT)
+        if c==None or c[0].rstrip(b'\0')!=self.ssid.encode(): return None
+        ifc=tuple(_ip(x) for x in c[4:]) if c[3] else None
+        return c[1] if any(c[1]) else None,c[2],ifc
+
+    def save_cache(self,bssid,channel):
+        """ caches the association. flash is only written when the bssid, channel
+        or address changed
+        * bssid   (`bytes`): None or all zero when unknown
+        * channel (`int`)  : wifi channel
+        return (`bool`): true if written
+        """
+        bssid=bytes(bssid) if bssid and any(bssid) else None
+        ifc=tuple(self.ifconfig())
+        if self.load_cache()==(bssid,channel,ifc): return False
+        store.save(CACHE,CACHE_FMT,self.ssid.encode(),bssid or bytes(6),channel,1,*(_ipb(x) for x in ifc))
+        return True
+
+    def forget(self):
+        """ drops the cached association """
+        store.remove(CACHE)
+
+    def __best(self):
+        """ strongest bssid and channel advertising our ssid, or None """
+        best=None
+        for ssid,bssid,channel,rssi,*_ in self.scan():
+            if ssid.decode()==self.ssid and (best==None or rssi>best[2]):
+                best=(bssid,channel,rssi)
+        return best
+
+    def __attempts(self,scan=True):
+        """ (bssid, channel, ifconfig) to try in order. the cache first, then a
+        scan, then a plain connect
+        * scan (`bool`): false skips the scan, it blocks for seconds
+        """
+        c=self.load_cache()
+        if c: yield c
+        self.active(True)
+        if scan:
+            try: b=self.__best()
+            except OSError: b=None
+            if b: yield b[0],b[1],None
+        if not c or c[0]: yield None,0,None
+
+    def __start(self,bssid,ifc):
+        if self.isconnected(): self.disconnect()
+        self.active(True)
+        if ifc and self.static: self.ifconfig(ifc)
+        else:
+            try: self.ifconfig('dhcp')
+            except (OSError,TypeError,ValueError): pass
+        if bssid: super().connect(self.ssid,self.pswd,bssid=bssid)
+        else: super().connect(self.ssid,self.pswd)
+
+    def __joined(self,t0,first,bssid,channel):
+        self.connect_ms=time.ticks_diff(time.ticks_ms(),t0)
+        self.connects+=1
+        if first: self.fast_joins+=1
+        if bssid==None:
+            try: bssid=self.config('bssid')
+            except (OSError,ValueError): pass
+        try: channel=self.config('channel') or channel    # the ap may have moved
+        except (OSError,ValueError): pass
+        self.save_cache(bssid,channel)
+
+    def join(self,timeout_ms=10000,fast_ms=3000):
+        """ connects, trying the cached bssid (and static address) first, then
+        the strongest access point from a scan. blocks, sleeping between checks
+        * timeout_ms (`int`): per attempt
+        * fast_ms    (`int`): for the cached attempt
+        return (`bool`): true once connected
+        """
+        t0=time.ticks_ms()
+        cached=self.load_cache()!=None
+        for k,(bssid,channel,ifc) in enumerate(self.__attempts()):
+            first=cached and k==0
+            self.__start(bssid,ifc)
+            if wait_until(self.isconnected,fast_ms if first else timeout_ms,20):
+                self.__joined(t0,first,bssid,channel)
+                return True
+        return False
+
+    async def join_async(self,timeout_ms=10000,fast_ms=3000,scan=True):
+        """ join() that yields while waiting. the scan itself still blocks
+        * scan (`bool`): false tries only the cache and a plain connect
+        """
+        t0=time.ticks_ms()
+        cached=self.load_cache()!=None
+        for k,(bssid,channel,ifc) in enumerate(self.__attempts(scan)):
+            first=cached and k==0
+            self.__start(bssid,ifc)
+            if await await_until(self.isconnected,fast_ms if first else timeout_ms,50):
+                self.__joined(t0,first,bssid,channel)
+                return True
+        return False
+
+    async def supervise(self,period_ms=1000,backoff_ms=(1000,60000),scan_after=3,timeout_ms=10000):
+        """ keeps the link up in the background: asyncio.create_task(wifi.supervise())
+        reconnects with exponential backoff and records outages. retries skip
+        the blocking scan, which stalls every other task for seconds, until
+        scan_after joins in a row have failed
+        * period_ms  (`int`)  : status check interval while connected
+        * backoff_ms (`tuple`): first and longest wait between failed joins
+        * scan_after (`int`)  : failed joins before retries scan again
+        * timeout_ms (`int`)  : per join attempt
+        """
+        self.running=True
+        down=None
+        wait=backoff_ms[0]
+        fails=0
+        while self.running:
+            if self.isconnected():
+                if down!=None:
+                    d=time.ticks_diff(time.ticks_ms(),down)
+                    self.outage_ms+=d
+                    if d>self.outage_ms_max: self.outage_ms_max=d
+                    down=None
+                    wait=backoff_ms[0]
+                    fails=0
+                await asyncio.sleep_ms(period_ms)
+                continue
+            if down==None:
+                down=time.ticks_ms()
+                if self.connects: self.outages+=1
+            if await self.join_async(timeout_ms,min(3000,timeout_ms),fails>=scan_after): continue
+            fails+=1
+            await asyncio.sleep_ms(wait)
+            wait=min(wait*2,backoff_ms[1])
+
+    def stop(self):
+        """ ends supervise() """
+        self.running=False
+
+    def stats(self):
+        return {
+            'connected'     : self.isconnected(),
+            'connect_ms'    : self.connect_ms,
+            'connects'      : self.connects,
+            'fast_joins'    : self.fast_joins,
+            'outages'       : self.outages,
+            'outage_ms'     : self.outage_ms,
+            'outage_ms_max' : self.outage_ms_max,
+        }
+
     def get_mac(self):
         return ubinascii.hexlify(self.config('mac'),':').decode()
 
@@ -55,7 +231,15 @@ class WIFI(network.WLAN):
         return self.status()
 
 if __name__ == "__main__":
-    wifi=WIFI("NOSNET","handsome")
-    wifi.connect()
-    wifi.check()
+    wifi=WIFI("NOSNET","handsome",static=True)
+    print(wifi.join(), wifi.stats())
+    # or keep it up next to other tasks
+    # async def main():
+    #     asyncio.create_task(wifi.supervise())
+    #     while True:
+    #         await asyncio.sleep(10)
+    #         print(wifi.stats())
+    # asyncio.run(main())
+    # wifi.connect()
+    # wifi.check()
     print(wifi.get_status())
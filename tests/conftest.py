@@ -0,0 +1,11 @@
+#===================================================================
+# file: conftest.py
+# desc: runs the tests on the simulated hardware, see nos.sim.host
+# dev : nos
+#===================================================================
+import os
+import sys
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nos.sim.host import install
+install()
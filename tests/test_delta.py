@@ -0,0 +1,69 @@
+#===================================================================
+# file: test_delta.py
+# desc: delta codec round trip and resync
+# dev : nos
+#===================================================================
+import struct
+from nos.util.delta import DeltaFrameBuilder, DeltaDecoder, channels
+from nos.util.stream_format import unpack_header, FLAG_DELTA, FLAG_KEY, FORMAT_ERROR
+
+FMT='<3hi'
+
+def samples(n):
+    v=[0,0,16384,100000]
+    out=[]
+    for k in range(n):
+        v=[max(-32768,min(32767,v[0]+(k*37%81)-40)),-v[1]-1 if k%7==0 else v[1]+3,
+           32767 if k%11==0 else -32768 if k%13==0 else v[2],v[3]-k*1000]
+        out.append(tuple(v))
+    return out
+
+def frames(fb,data):
+    out=[]
+    for k,s in enumerate(data):
+        if fb.add(s,k*1000): out.append(bytes(fb.frame()))
+    if fb.n: out.append(bytes(fb.frame()))
+    return out
+
+def decode(dec,frame):
+    flags,sid,fmt,count,seq,t0,period,o=unpack_header(frame)
+    assert fmt==FMT and flags&FLAG_DELTA
+    out=dec.decode(flags,count,seq,frame[o:])
+    return None if out==None else [struct.unpack_from(FMT,out,i*struct.calcsize(FMT)) for i in range(count)]
+
+def test_roundtrip():
+    data=samples(500)
+    fb=DeltaFrameBuilder(FMT,batch=16,keyframe=50)
+    dec=DeltaDecoder(FMT)
+    got=[]
+    for f in frames(fb,data): got+=decode(dec,f)
+    assert got==data
+    assert dec.skipped==0
+    assert fb.ratio()<1
+
+def test_extremes():
+    data=[(32767,-32768,0,2**31-1),(-32768,32767,0,-2**31),(0,0,0,0)]*3
+    fb=DeltaFrameBuilder(FMT,batch=4,keyframe=5)
+    dec=DeltaDecoder(FMT)
+    got=[]
+    for f in frames(fb,data): got+=decode(dec,f)
+    assert got==data
+
+def test_resync_after_gap():
+    data=samples(200)
+    fb=DeltaFrameBuilder(FMT,batch=10,keyframe=40)
+    fs=frames(fb,data)
+    dec=DeltaDecoder(FMT)
+    got={}
+    for i,f in enumerate(fs):
+        if i==2: continue               # lost datagram
+        d=decode(dec,f)
+        if d!=None: got[i]=d
+    assert 3 not in got and dec.skipped==1      # frame 3 waits for the key at 4
+    assert unpack_header(fs[4])[0]&FLAG_KEY and 4 in got
+    for i,d in got.items(): assert d==data[i*10:i*10+10]
+
+def test_rejects_floats():
+    try: channels('<3f')
+    except FORMAT_ERROR: return
+    assert False
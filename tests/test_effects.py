@@ -0,0 +1,22 @@
+#===================================================================
+# file: test_effects.py
+# desc: Engine scheduling
+# dev : nos
+#===================================================================
+from nos.acc.WS2812x import WS2812x
+from nos.acc.backends import Capture
+from nos.acc.effects import Engine, Solid
+
+def test_fps_change_retimes_ticker():
+    e=Engine(WS2812x(None,4,backend=Capture()),fps=50)
+    assert e.ticker.period==20000
+    e.fps=100
+    assert e.ticker.period==10000 and round(e.fps)==100
+    assert e.stats()['budget_us']==10000 and e.dropped==0
+
+def test_frame_renders_effect():
+    cap=Capture()
+    e=Engine(WS2812x(None,4,backend=cap))
+    e.play(Solid(0x102030))
+    e.frame()
+    assert cap.count==1 and e.frames==1
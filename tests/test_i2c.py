@@ -0,0 +1,44 @@
+#===================================================================
+# file: test_i2c.py
+# desc: NosI2C instrumentation on the simulated bus
+# dev : nos
+#===================================================================
+from array import array
+from nos.sim.machine import BUS
+from nos.sim import devices
+from nos.util.i2c import NosI2C, nbytes
+
+def test_nbytes():
+    assert nbytes(bytearray(5))==5
+    assert nbytes(array('h',[0]*12))==24
+    assert nbytes(array('f',[0]*3))==12
+    assert nbytes(memoryview(bytearray(8))[2:6])==4
+
+def test_stats_count_bytes_of_typed_buffers():
+    BUS.clear()
+    BUS.attach(devices.WT901())
+    i2c=NosI2C(5,4)
+    i2c.instrument()
+    i2c.readfrom_mem_into(0x50,0x34,array('h',[0]*12))
+    i2c.readfrom_mem_into(0x50,0x34,bytearray(6))
+    i2c.writeto_mem(0x50,0x69,b'\x88\xb5')
+    d=i2c.stats.snapshot()['0x50']
+    assert d['n']==3 and d['bytes']==24+6+2
+
+def test_esp32_buses_get_their_own_block(monkeypatch):
+    import nos.util.i2c as i2c
+    monkeypatch.setattr(i2c.sys,'platform','esp32')
+    monkeypatch.setattr(i2c,'_claims',{})
+    a=NosI2C(22,21)
+    b=NosI2C(19,18)
+    c=NosI2C(17,16)
+    assert (a.id,b.id,c.id)==(0,1,None)
+    assert NosI2C(22,21).id==0
+
+def test_negotiate_needs_checks():
+    import pytest
+    BUS.clear()
+    BUS.attach(devices.MPU6050())
+    i2c=NosI2C(5,4)
+    with pytest.raises(ValueError): i2c.negotiate([])
+    assert i2c.negotiate([(0x68,117,1)])==1000000 and i2c.freq==1000000
@@ -0,0 +1,39 @@
+#===================================================================
+# file: test_mpu6050.py
+# desc: MPU6050 fifo draining on the simulated bus
+# dev : nos
+#===================================================================
+import pytest
+from nos.sim.machine import BUS
+from nos.sim import devices
+from nos.util.i2c import NosI2C
+from nos.sensors.MPU6050 import MPU6050
+
+@pytest.fixture
+def mpu():
+    BUS.clear()
+    sim=BUS.attach(devices.MPU6050(0x68))
+    mpu=MPU6050(0x68,i2c=NosI2C(5,4))
+    mpu.fifo_start(rate=100,nframes=8)
+    yield mpu,sim
+    BUS.clear()
+
+def test_fifo_read_drains_frames(mpu):
+    mpu,sim=mpu
+    sim.fifo=3*MPU6050.FRAME_LEN
+    assert mpu.fifo_read()==3
+    assert mpu.fifo_overflows==0
+
+def test_overflow_seen_after_partial_drain(mpu):
+    # the count is below FIFO_SIZE again, only INT_STATUS still tells
+    mpu,sim=mpu
+    sim.fifo=5*MPU6050.FRAME_LEN
+    sim.regs[MPU6050.R_INT_STATUS]|=0x10
+    assert mpu.fifo_read()==0
+    assert mpu.fifo_overflows==1 and sim.fifo==0
+    assert sim.regs[MPU6050.R_INT_STATUS]==0
+
+def test_full_fifo_is_an_overflow(mpu):
+    mpu,sim=mpu
+    sim.fifo=MPU6050.FIFO_SIZE
+    assert mpu.fifo_read()==0 and mpu.fifo_overflows==1
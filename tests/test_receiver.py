@@ -0,0 +1,43 @@
+#===================================================================
+# file: test_receiver.py
+# desc: host receiver, live and replayed frames kept apart
+# dev : nos
+#===================================================================
+import socket
+import pytest
+np=pytest.importorskip('numpy')
+from nos.util.stream_format import FrameBuilder, FLAG_REPLAY
+from nos.host.receiver import StreamReceiver, TICKS_PERIOD
+
+def frame(fb,v,t,replay=False):
+    fb.add((v,),t)
+    b=bytearray(fb.frame())
+    if replay: b[3]|=FLAG_REPLAY
+    return bytes(b)
+
+@pytest.fixture
+def link():
+    dev=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+    dev.bind(('127.0.0.1',0))
+    rx=StreamReceiver('127.0.0.1',dev.getsockname()[1],keepalive=0)
+    to=('127.0.0.1',rx.sock.getsockname()[1])
+    live=FrameBuilder('<h')
+    old=FrameBuilder('<h')
+    dev.sendto(frame(old,7,TICKS_PERIOD-100,True),to)
+    dev.sendto(frame(live,1,1000),to)
+    dev.sendto(frame(old,8,50,True),to)
+    dev.sendto(frame(live,2,2000),to)
+    yield rx
+    rx.sock.close()
+    dev.close()
+
+def test_read_keeps_backlog_out(link):
+    t,x=link.read(count=2)
+    assert list(x.ravel())==[1,2] and list(t)==[1000,2000]
+    assert link.replayed==2
+
+def test_read_marks_backlog_on_its_own_timeline(link):
+    t,x,old=link.read(count=2,replay=True)
+    assert list(x.ravel())==[7,1,8,2]
+    assert list(old)==[True,False,True,False]
+    assert list(t[old])==[TICKS_PERIOD-100,TICKS_PERIOD+50]
@@ -0,0 +1,93 @@
+#===================================================================
+# file: test_recorder.py
+# desc: recorder flush, reboot and replay
+# dev : nos
+#===================================================================
+import os
+import struct
+import pytest
+import nos.util.store as store
+from nos.util.recorder import Recorder
+from nos.util.stream_format import unpack_header, FLAG_REPLAY
+
+FMT='<h'
+BLOCK=64        # 6 byte records, 8 per block
+
+@pytest.fixture
+def path(tmp_path,monkeypatch):
+    monkeypatch.setattr(store,'PREFIX',str(tmp_path)+'/')
+    return str(tmp_path/'log')
+
+def record(rec,n,flush=True):
+    for i in range(n):
+        if rec.add((i,),i*1000) and flush: rec.flush()
+
+def replay(rec):
+    got=[]
+    while True:
+        f=rec.next_frame()
+        if f==None: return got
+        flags,sid,fmt,count,seq,t0,period,o=unpack_header(f)
+        assert flags&FLAG_REPLAY and fmt==FMT
+        got+=[struct.unpack_from(FMT,f,o+2*k)[0] for k in range(count)]
+
+def test_replay_in_ram():
+    rec=Recorder(FMT,block=BLOCK,slots=4)
+    record(rec,24)
+    assert rec.backlog==3
+    assert replay(rec)==list(range(24))
+    assert rec.backlog==0
+
+def test_reopen_replays_flushed_blocks(path):
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    record(rec,13*rec.per)
+    assert rec.seq==13 and rec.flushed==13
+    rec.close()
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    assert rec.backlog==13
+    assert replay(rec)==list(range(13*rec.per))
+    assert rec.sent==13
+    rec.close()
+
+def test_reopen_keeps_cursor(path):
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    record(rec,6*rec.per)
+    for _ in range(3*rec.per//rec.per_frame): rec.next_frame()
+    rec.close()
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    assert rec.backlog==3
+    assert replay(rec)==list(range(3*rec.per,6*rec.per))
+    rec.close()
+
+def test_missing_index_is_rebuilt(path):
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    record(rec,13*rec.per)
+    rec.close()
+    size=os.path.getsize(path+'.dat')
+    os.remove(path+'.idx')
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    assert os.path.getsize(path+'.dat')==size
+    assert rec.seq==13
+    assert replay(rec)==list(range(13*rec.per))
+    rec.close()
+
+def test_appends_after_reopen(path):
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    record(rec,2*rec.per)
+    rec.close()
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=32)
+    for i in range(2*rec.per,4*rec.per): rec.add((i,),i)
+    rec.flush()
+    assert replay(rec)==list(range(4*rec.per))
+    rec.close()
+
+def test_long_run_of_bad_blocks_is_skipped(path):
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=1600)
+    record(rec,1500*rec.per)
+    rec.close()
+    with open(path+'.dat','r+b') as f:      # torn blocks, all but the last
+        f.seek(BLOCK)
+        f.write(bytes(1499*BLOCK))
+    rec=Recorder(FMT,path=path,block=BLOCK,slots=4,blocks=1600)
+    assert replay(rec)==list(range(1499*rec.per,1500*rec.per))
+    rec.close()
@@ -0,0 +1,52 @@
+#===================================================================
+# file: test_segments.py
+# desc: Segment writes stay inside their zone
+# dev : nos
+#===================================================================
+import pytest
+from nos.acc.WS2812x import WS2812x
+from nos.acc.backends import Capture
+from nos.acc.segments import Segment
+
+def strip(n=10):
+    return WS2812x(None,n,backend=Capture())
+
+def lit(s):
+    return [i for i in range(s.amnt) if s[i]]
+
+def test_fill_stays_in_zone():
+    s=strip()
+    Segment(s,3,4).fill(0x010101,0,100)
+    assert lit(s)==[3,4,5,6]
+
+def test_reverse_fill_stays_in_zone():
+    s=strip()
+    Segment(s,3,4,reverse=True).fill(0x010101,2,5)
+    assert lit(s)==[3,4]
+
+def test_mirror_fill_stays_in_zone():
+    s=strip()
+    Segment(s,2,6,mirror=True).fill(0x010101,1,10)
+    assert lit(s)==[3,4,5,6]
+
+def test_index_outside_zone_raises():
+    s=strip()
+    z=Segment(s,0,4,reverse=True)
+    with pytest.raises(IndexError): z[4]=0x010101
+    with pytest.raises(IndexError): z[-5]
+    z[-1]=0x010101
+    z[1:100]=[0x020202]*10
+    assert lit(s)==[0,1,2] and s[9]==0
+
+def test_blit_from_segment():
+    s=strip()
+    s[2]=0x112233
+    s[3]=0x445566
+    d=strip(4)
+    d.blit(Segment(s,2,2,reverse=True),1)
+    assert d[:]==[0,0x445566,0x112233,0]
+
+def test_segment_blit_clamps():
+    s=strip()
+    Segment(s,3,4).blit(b'\xff'*30,2)
+    assert lit(s)==[5,6]
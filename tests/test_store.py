@@ -0,0 +1,22 @@
+#===================================================================
+# file: test_store.py
+# desc: flash records, round trip and damaged files
+# dev : nos
+#===================================================================
+import pytest
+import nos.util.store as store
+
+@pytest.fixture(autouse=True)
+def prefix(tmp_path,monkeypatch):
+    monkeypatch.setattr(store,'PREFIX',str(tmp_path)+'/')
+
+def test_roundtrip():
+    store.save('r','<Ih',7,-3)
+    assert store.load('r','<Ih')==(7,-3)
+    assert store.load('r','<Ii')==None
+    assert store.load('missing','<I')==None
+
+@pytest.mark.parametrize('data',[b'',b'NO',b'NOS1',b'NOS1\x03<I',b'NOS1\x02<I\x01\x02',b'XXXX\x02<I\0\0\0\0'])
+def test_damaged_files_load_none(data):
+    with open(store._path('r'),'wb') as f: f.write(data)
+    assert store.load('r','<I')==None
@@ -0,0 +1,38 @@
+#===================================================================
+# file: test_tca9548a.py
+# desc: TCA9548APoller on the simulated bus
+# dev : nos
+#===================================================================
+import pytest
+from nos.sim.machine import BUS
+from nos.sim import devices
+from nos.util.i2c import NosI2C
+from nos.sensors.MPU6050 import MPU6050
+from nos.sensors.TCA9548A import TCA9548A, TCA9548APoller
+
+@pytest.fixture
+def bus():
+    BUS.clear()
+    mux=BUS.attach(devices.TCA9548A(0x70))
+    for ch in range(2): mux.attach(ch,devices.MPU6050(0x68,seed=ch+2))
+    BUS.attach(devices.MPU6050(0x69))
+    yield NosI2C(5,4)
+    BUS.clear()
+
+def test_main_bus_device_polls_without_switching(bus):
+    tca=TCA9548A(0x70,i2c=bus)
+    mpus=[MPU6050(0x68,i2c=tca.bus(ch)) for ch in range(2)]+[MPU6050(0x69,i2c=bus)]
+    poller=TCA9548APoller(tca,mpus)
+    n=tca.switches
+    poller.poll()
+    poller.poll()
+    assert poller.groups[-1]==(None,(2,))
+    assert tca.switches-n==3     # ch0, ch1, then ch0 again on the way back
+    assert all(r[2] for r in poller.raw)   # az of 1 g everywhere
+
+def test_bad_channel_is_refused(bus):
+    tca=TCA9548A(0x70,i2c=bus)
+    with pytest.raises(TCA9548A.CHANNEL_ERROR): tca.bus(8)
+    with pytest.raises(TCA9548A.CHANNEL_ERROR): tca.select(-1)
+    mpu=MPU6050(0x69,i2c=bus,channel=9)
+    with pytest.raises(TCA9548A.CHANNEL_ERROR): TCA9548APoller(tca,[mpu])
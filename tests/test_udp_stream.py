@@ -0,0 +1,68 @@
+#===================================================================
+# file: test_udp_stream.py
+# desc: UDP_STREAM subscribe validation over loopback
+# dev : nos
+#===================================================================
+import json
+import socket
+import pytest
+from nos.util.udp_stream import UDP_STREAM, MAX_RATE
+
+@pytest.fixture
+def link():
+    srv=UDP_STREAM('127.0.0.1',0,hook=lambda:{'a':1,'b':2})
+    cli=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+    cli.bind(('127.0.0.1',0))
+    cli.settimeout(1)
+    addr=srv.udp.getsockname()
+    def ctrl(msg):
+        cli.sendto(msg,addr)
+        srv.poll_ctrl(500)
+    yield srv,cli,ctrl
+    srv.udp.close()
+    cli.close()
+
+@pytest.mark.parametrize('msg',[b'start nan',b'start inf',b'start -inf',b'start -5',
+                                b'start 0',b'start fast',b'start 10 \xff\xfe'])
+def test_bad_subscribe_is_refused(link,msg):
+    srv,cli,ctrl=link
+    ctrl(msg)
+    assert srv.connected==[]
+    assert cli.recv(256).startswith(b'error ')
+    srv.tick()          # nothing stored that could break the loop
+
+def test_subscribe_topics(link):
+    srv,cli,ctrl=link
+    ctrl(b'start 50 b')
+    assert len(srv.connected)==1
+    srv.tick()
+    assert json.loads(cli.recv(256))=={'b':2}
+
+def test_rate_is_clamped(link):
+    srv,cli,ctrl=link
+    ctrl(b'start 1e12')
+    g=list(srv.groups.values())[0]
+    assert g.rate==MAX_RATE
+    srv.tick()
+    assert json.loads(cli.recv(256))=={'a':1,'b':2}
+
+def test_every_tick_and_stop(link):
+    srv,cli,ctrl=link
+    ctrl(b'start')
+    for _ in range(3): srv.tick()
+    assert [json.loads(cli.recv(256)) for _ in range(3)]==[{'a':1,'b':2}]*3
+    ctrl(b'stop')
+    assert srv.connected==[]
+
+def test_subscribe_rejects_bad_rate(link):
+    srv,cli,ctrl=link
+    with pytest.raises(ValueError): srv.subscribe(('127.0.0.1',1),float('nan'))
+    assert srv.connected==[]
+
+def test_rate_change_retimes_ticker(link):
+    srv=link[0]
+    assert srv.dropped==0 and srv.late_us_max==0
+    srv.hz=250
+    assert srv.ticker.period==4000
+    srv.hz=None
+    assert srv.hz==None and srv.ticker.hz==1
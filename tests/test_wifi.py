@@ -0,0 +1,64 @@
+#===================================================================
+# file: test_wifi.py
+# desc: WIFI join and association cache on the simulated network
+# dev : nos
+#===================================================================
+import pytest
+import network
+import nos.util.store as store
+from nos.util.wifi import WIFI
+
+@pytest.fixture
+def saves(tmp_path,monkeypatch):
+    monkeypatch.setattr(store,'PREFIX',str(tmp_path)+'/')
+    monkeypatch.setattr(network,'APS',[])
+    network.add_ap('nos','pw',channel=11)
+    n=[]
+    save=store.save
+    def counted(*a):
+        n.append(a)
+        save(*a)
+    monkeypatch.setattr(store,'save',counted)
+    return n
+
+def test_cache_written_only_on_change(saves):
+    w=WIFI('nos','pw')
+    assert w.join() and len(saves)==1
+    assert w.join() and w.fast_joins==1 and len(saves)==1
+    network.APS[0][3]=6
+    assert w.join() and len(saves)==2
+    assert w.load_cache()[1]==6
+
+def test_unknown_bssid_is_not_cached(saves):
+    w=WIFI('nos','pw')
+    w.active(True)
+    w.save_cache(bytes(6),11)
+    assert w.load_cache()[0]==None
+    assert w.join() and w.load_cache()[0]==network.APS[0][2]
+
+def test_supervisor_reconnects_without_scanning(saves):
+    import asyncio
+    w=WIFI('nos','pw')
+    assert w.join()
+    scans=w.scans
+    async def run():
+        task=asyncio.create_task(w.supervise(period_ms=10,backoff_ms=(10,10)))
+        await asyncio.sleep(0.05)
+        w.drop()
+        await asyncio.sleep(0.5)
+        w.stop()
+        await task
+    asyncio.run(run())
+    assert w.isconnected() and w.outages==1 and w.scans==scans
+
+def test_supervisor_scans_after_failed_joins(saves,monkeypatch):
+    import asyncio
+    w=WIFI('nos','pw')
+    monkeypatch.setattr(network,'APS',[])
+    async def run():
+        task=asyncio.create_task(w.supervise(backoff_ms=(10,10),scan_after=2,timeout_ms=30))
+        while w.scans==0: await asyncio.sleep(0.01)
+        w.stop()
+        await task
+    asyncio.run(asyncio.wait_for(run(),5))
+    assert w.scans==1
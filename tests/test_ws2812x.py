@@ -0,0 +1,53 @@
+#===================================================================
+# file: test_ws2812x.py
+# desc: WS2812x framebuffer and render on the capture backend
+# dev : nos
+#===================================================================
+from nos.acc.WS2812x import WS2812x
+from nos.acc.backends import Capture
+
+def strip(n=10):
+    cap=Capture()
+    return WS2812x(None,n,backend=cap),cap
+
+def test_render_skips_clean_frames():
+    s,cap=strip()
+    s.fill(0x010203)
+    assert s.render() and not s.render()
+    assert cap.count==1
+
+def test_direct_buf_writes_render():
+    s,cap=strip()
+    s.render()
+    s.buf[0:3]=b'\x10\x20\x30'
+    assert s.render()
+    assert cap.frames[-1][:3]==b'\x10\x20\x30'
+
+def test_blit_leaves_source_clean():
+    a,_=strip()
+    b,_=strip()
+    a.fill(0x0000ff)
+    a.render()
+    b.blit(a)
+    assert b.dirty and not a.dirty
+
+def test_fill_and_roll_clamp_to_strip():
+    s,_=strip(4)
+    s.fill(0x010101,2,100)
+    assert bytes(s.buf)==bytes(6)+b'\x01'*6
+    s.fill(0x020202,-3,2)
+    assert bytes(s.buf[:6])==b'\x02'*6
+    s.fill(0x030303,9)
+    s[3]=0x040404
+    s.roll(1,2,10)
+    assert bytes(s.buf)==b'\x02'*6+b'\x04'*3+b'\x01'*3
+
+def test_blit_clamps_to_both_ends():
+    s,_=strip(4)
+    s.blit(bytes(range(1,13)),2,1,10)
+    assert bytes(s.buf)==bytes(6)+bytes(range(4,10))
+    s.blit(bytes(range(1,13)),0,3)
+    assert bytes(s.buf[:3])==bytes(range(10,13))
+    s.blit(b'\xff'*12,9)
+    s.blit(b'\xff'*12,0,9)
+    assert bytes(s.buf[:3])==bytes(range(10,13))
@@ -0,0 +1,39 @@
+#===================================================================
+# file: test_wt901.py
+# desc: WT901 register plans on the simulated part
+# dev : nos
+#===================================================================
+import pytest
+import nos.util.store as store
+from nos.sim.machine import BUS
+from nos.sim import devices
+from nos.util.i2c import NosI2C
+from nos.sensors.WT901 import WT901
+
+@pytest.fixture
+def wt(tmp_path,monkeypatch):
+    monkeypatch.setattr(store,'PREFIX',str(tmp_path)+'/')
+    BUS.clear()
+    sim=BUS.attach(devices.WT901())
+    return sim,WT901(0x50,i2c=NosI2C(5,4))
+
+def put32(sim,reg,v):
+    v&=0xffffffff
+    sim.regs[reg*2:reg*2+4]=bytes((v&0xff,v>>8&0xff,v>>16&0xff,v>>24))
+
+def test_wide_fields_keep_every_digit(wt):
+    sim,dev=wt
+    put32(sim,WT901.R_LonL,1234567891)
+    put32(sim,WT901.R_LatL,-987654321)
+    put32(sim,WT901.R_PressureL,101325)
+    d=dev.plan('gps','pressure').get_data()
+    assert d['gps']==[1234567891,-987654321]
+    assert d['pressure']==101325
+
+def test_plan_matches_get_data(wt):
+    sim,dev=wt
+    sim.move(accel=(0.25,-0.5,1.0),angle=(10,-20,30))
+    d=dev.plan('acceleration','angle').get_data()
+    g=dev.get_data()
+    for k in ('acceleration','angle'):
+        for a in 'xyz': assert d[k][a]==pytest.approx(g[k][a],abs=1e-3)